@@ -0,0 +1,49 @@
+"""Gunicorn settings for the web process; gunicorn reads this file from the working directory.
+
+By default (SERVER_MODE=asgi) iccs372proj1.asgi is served from uvicorn workers,
+where one worker keeps serving other requests while the async views wait on
+I/O; the project's middleware runs async too, so requests stay on the event
+loop. SERVER_MODE=wsgi runs iccs372proj1.wsgi on gunicorn's sync workers, which
+run each async view to completion before taking the next request. Both take
+the worker count from WEB_CONCURRENCY and the port from PORT, as gunicorn does.
+SERVER_MODE is exported for settings.py, which picks DB_CONN_MAX_AGE by it.
+
+The worker count gunicorn settles on (from -w or WEB_CONCURRENCY) is exported
+as WEB_CONCURRENCY before the workers start, so settings.py can pick a cache
+that all of them share.
+
+Each worker keeps its /metrics totals in files under PROMETHEUS_MULTIPROC_DIR,
+and /metrics adds up every worker's, whichever one answers the scrape. Set it
+to a directory only this server uses (tmpfs is best); without one a fresh
+temporary directory is made. Files left from a previous run are removed at
+startup, since counters restart with the workers.
+"""
+import os
+import shutil
+import tempfile
+
+SERVER_MODE = os.environ.setdefault('SERVER_MODE', 'asgi')
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'iccs372proj1.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'iccs372proj1.wsgi:application'
+
+
+# Read by prometheus_client when a worker imports it, so it has to be set before they start
+if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='iccs372proj1-metrics-')
+
+
+def on_starting(server):
+    os.environ['WEB_CONCURRENCY'] = str(server.cfg.workers)
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
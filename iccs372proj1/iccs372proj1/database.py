@@ -0,0 +1,53 @@
+"""settings.DATABASES for a database URL, tuned for the backend it names.
+
+PostgreSQL connections are either kept open between requests (conn_max_age,
+checked before reuse) or, with a pool size, borrowed from psycopg's pool,
+which Django 5.1 manages itself. Django refuses to combine the two.
+
+SQLite gets pragmas that suit a web server writing from several workers.
+The write-ahead log lets reads carry on while a write commits, and
+synchronous=NORMAL then only syncs at checkpoints, which keeps the database
+consistent through a crash but may lose the last transactions on power loss.
+Transactions start IMMEDIATE: they take the write lock up front and queue on
+the busy timeout, instead of failing with "database is locked" when two
+read-then-write transactions (like booking a room) try to upgrade at once.
+"""
+import dj_database_url
+
+SQLITE = 'django.db.backends.sqlite3'
+POSTGRESQL = 'django.db.backends.postgresql'
+
+# Run on every new SQLite connection
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    # Read the first 256MB of the file through the OS page cache instead of copying it in
+    'PRAGMA mmap_size=268435456',
+    # Let SQLite keep up to 64MB of pages per connection (negative sizes are in KB)
+    'PRAGMA cache_size=-65536',
+)
+
+
+def sqlite_options(busy_timeout):
+    """OPTIONS for the tuned SQLite profile; busy_timeout is in seconds"""
+    return {
+        'init_command': ';'.join(SQLITE_PRAGMAS),
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': busy_timeout,
+    }
+
+
+def database_config(url, conn_max_age=0, health_checks=True, pool_size=0, busy_timeout=20):
+    """settings.DATABASES entry for url"""
+    config = dj_database_url.parse(url, conn_max_age=conn_max_age, conn_health_checks=health_checks)
+    if config['ENGINE'] == SQLITE:
+        config['OPTIONS'] = {**sqlite_options(busy_timeout), **config.get('OPTIONS', {})}
+    elif config['ENGINE'] == POSTGRESQL and pool_size:
+        config['CONN_MAX_AGE'] = 0
+        config.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': min(2, pool_size),
+            'max_size': pool_size,
+            # Seconds a request waits for a free connection before failing
+            'timeout': busy_timeout,
+        }
+    return config
@@ -9,17 +9,36 @@ https://docs.djangoproject.com/en/5.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
-import dj_database_url
 from pathlib import Path
 import json
 import os
 
+from .database import database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 # Read the service account credentials from the JSON file
 GOOGLE_CALENDAR_API_CREDENTIALS = json.loads(os.getenv('GOOGLE_CALENDAR_CREDENTIALS', '{}'))
 
+# Calendar client used by the sync worker; set to inventory.fake_calendar.FakeCalendarAPI
+# to run without network access
+CALENDAR_BACKEND = os.getenv('CALENDAR_BACKEND', 'inventory.google_calendar.GoogleCalendarAPI')
+# Override the Calendar API base URL, e.g. to point at a local stub server
+GOOGLE_CALENDAR_API_ENDPOINT = os.getenv('GOOGLE_CALENDAR_API_ENDPOINT') or None
+GOOGLE_CALENDAR_HTTP_TIMEOUT = 10
+# Most calendar calls one ASGI worker process has in flight at once
+CALENDAR_ASYNC_CONCURRENCY = 10
+FAKE_CALENDAR_LATENCY = float(os.getenv('FAKE_CALENDAR_LATENCY', '0'))
+FAKE_CALENDAR_FAILURE_RATE = float(os.getenv('FAKE_CALENDAR_FAILURE_RATE', '0'))
+
+# Outbox retry policy for the sync_calendar workers (seconds)
+CALENDAR_SYNC_MAX_ATTEMPTS = 8
+CALENDAR_SYNC_BASE_BACKOFF = 5
+CALENDAR_SYNC_MAX_BACKOFF = 15 * 60
+# How long the entries a worker claimed stay its own; after that another worker may send them again
+CALENDAR_SYNC_CLAIM_SECONDS = 5 * 60
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
@@ -46,30 +65,26 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
 ]
 
-LAB_ROOMS = {
-    'room1': {'name': 'Lab Room 1', 'calendar_id': 'c_494b497eabb29d3866a26954c964cc4d37eecc550bd43644e10ecbf458a3917d@group.calendar.google.com'},
-    'room2': {'name': 'Lab Room 2', 'calendar_id': 'c_3a3bfa9453191b6c5d4a2bb91e65da3e27ac4cbb68df71b79544de8f91e53c82@group.calendar.google.com'},
-    'room3': {'name': 'Lab Room 3', 'calendar_id': 'c_e06857ebb2c6cf25350feb85d269f570e4753ecd3fdb7537807e43fcc94f7799@group.calendar.google.com'},
-    'room4': {'name': 'Lab Room 4', 'calendar_id': 'c_08b064952f4fec9e0ae24b91644b2f98165c085d7b29abc9066ff867d3947e09@group.calendar.google.com'},
-    'room5': {'name': 'Lab Room 5', 'calendar_id': 'c_e1502d41091c7caf280fd10f8e362a7de2ec24e738a88bad835ed9818a02d794@group.calendar.google.com'},
-}
-
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'inventory.metrics.PerformanceMiddleware',
+    'inventory.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'inventory.querycheck.QueryInspectorMiddleware',
 ]
 
 ROOT_URLCONF = 'iccs372proj1.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for the performance middleware
+        'BACKEND': 'inventory.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -89,12 +104,39 @@ WSGI_APPLICATION = 'iccs372proj1.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Seconds a connection is kept open for later requests; async views don't reuse connections,
+# so ASGI mode closes them after each request (use a pool there instead)
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '0' if os.getenv('SERVER_MODE') == 'asgi' else '60'))
+# PostgreSQL connections per worker process in psycopg's pool; 0 keeps persistent connections instead
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '0'))
+# Seconds to wait for SQLite's write lock, or for a free pooled PostgreSQL connection
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '20'))
+
+# SQLite databases are switched to the write-ahead log on first connection (see database.py). The mode
+# is stored in the file, so it stays on for good, and db.sqlite3-wal/-shm appear next to the database.
 DATABASES = {
-    'default': dj_database_url.config(
-        default='sqlite:///db.sqlite3'
+    'default': database_config(
+        os.getenv('DATABASE_URL') or 'sqlite:///db.sqlite3',
+        conn_max_age=DB_CONN_MAX_AGE,
+        pool_size=DB_POOL_SIZE,
+        busy_timeout=DB_BUSY_TIMEOUT,
     )
 }
 
+# Read replicas of the default database (comma separated URLs), added as replica1, replica2, ...;
+# views with replica_reads = True spread their GET requests over them (see inventory/replicas.py)
+for number, url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        **database_config(url, conn_max_age=DB_CONN_MAX_AGE, pool_size=DB_POOL_SIZE, busy_timeout=DB_BUSY_TIMEOUT),
+        # Tests read the rows they wrote to the test database
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['inventory.replicas.ReplicaRouter']
+# Seconds a browser's reads stay on the primary after it wrote, so it sees its own changes; must
+# be longer than the replicas lag behind
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -130,8 +172,15 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 STATIC_URL = 'static/'
-STATIC_ROOT = BASE_DIR / 'staticfiles'
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Where collectstatic puts the files WhiteNoise serves
+STATIC_ROOT = Path(os.getenv('STATIC_ROOT') or BASE_DIR / 'staticfiles')
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # Content-hashed names that WhiteNoise serves as immutable for a year, with gzip and Brotli copies.
+    # {% static %} reads the names from the manifest collectstatic writes; without DEBUG a file missing
+    # from it is an error, so a deploy that skipped collectstatic fails instead of linking plain names.
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
@@ -148,4 +197,88 @@ LOGIN_URL = 'login'
 
 LOGOUT_REDIRECT_URL = '/'
 
+# Default low-stock threshold for new items; each item can override it
 LOW_QUANTITY = 3
+
+# Page totals at or above this many rows are cached for PAGINATOR_CACHED_COUNT_TTL seconds
+PAGINATOR_CACHED_COUNT_THRESHOLD = 1000
+PAGINATOR_CACHED_COUNT_TTL = 60
+
+# Worker processes serving requests; gunicorn.conf.py exports the count gunicorn runs with
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+# Cache backend: 'locmem' (per process) or 'file' (shared by every worker on the host).
+# Unset, a single process uses locmem and several workers share the file cache.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND') or ('file' if WEB_CONCURRENCY > 1 else 'locmem')
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a cached dashboard fragment (item table, categories, low-stock count) is kept
+DASHBOARD_CACHE_TTL = 300
+# Fragments are only cached where every worker sees an invalidation: with locmem under several
+# workers, the others would serve a stale fragment until DASHBOARD_CACHE_TTL runs out
+DASHBOARD_CACHE_ENABLED = CACHE_BACKEND != 'locmem' or WEB_CONCURRENCY == 1
+
+# Who receives the low-stock digests sent by notify_low_stock (comma separated);
+# with nobody configured the digest is logged instead
+LOW_STOCK_ALERT_RECIPIENTS = [address for address in os.getenv('LOW_STOCK_ALERT_RECIPIENTS', '').split(',') if address]
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+
+# Seconds before the cached copy of a room calendar's remote events is refreshed in the background
+ROOM_EVENTS_REMOTE_TTL = int(os.getenv('ROOM_EVENTS_REMOTE_TTL', '60'))
+# Seconds browsers may reuse a room's event feed before revalidating it with its ETag
+ROOM_EVENTS_MAX_AGE = 15
+
+# Most reservations one recurring booking may create
+RESERVATION_SERIES_MAX_OCCURRENCES = 52
+
+# Seconds before the in-process lab room cache is reloaded to pick up other workers' changes
+LAB_ROOM_CACHE_TTL = 60
+
+# Seconds before the in-process autocomplete index is rebuilt to pick up other workers' writes
+SUGGESTION_INDEX_TTL = 300
+
+# Share of requests whose SQL, calendar calls and template rendering are timed and sent back in a
+# Server-Timing header; every request is still counted and timed as a whole
+PERF_SAMPLE_RATE = float(os.getenv('PERF_SAMPLE_RATE', '1' if DEBUG else '0.01'))
+# Bearer token Prometheus scrapes /metrics with; without one only staff users can read it
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Report repeated statements (N+1 candidates) and slow statements with their EXPLAIN plans, one JSON
+# object per line; for development and staging, it times and fingerprints every statement
+QUERY_INSPECTOR = os.getenv('QUERY_INSPECTOR', 'False').lower() == 'true'
+# Runs of one statement within a request that make it an N+1 candidate
+QUERY_INSPECTOR_REPEAT_THRESHOLD = int(os.getenv('QUERY_INSPECTOR_REPEAT_THRESHOLD', '5'))
+# Milliseconds after which a statement is reported as slow
+QUERY_INSPECTOR_SLOW_MS = float(os.getenv('QUERY_INSPECTOR_SLOW_MS', '100'))
+# File the findings are appended to, for rank_queries; without one they go to stderr
+QUERY_INSPECTOR_LOG = os.getenv('QUERY_INSPECTOR_LOG', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'querycheck': (
+            {'class': 'logging.FileHandler', 'filename': QUERY_INSPECTOR_LOG, 'delay': True, 'formatter': 'message'}
+            if QUERY_INSPECTOR_LOG else
+            {'class': 'logging.StreamHandler', 'formatter': 'message'}
+        ),
+    },
+    'loggers': {
+        'inventory.querycheck': {'handlers': ['querycheck'], 'level': 'WARNING', 'propagate': False},
+    },
+}
@@ -1,5 +1,38 @@
 from django.contrib import admin
-from .models import InventoryItem, Category
+from .models import InventoryItem, Category, CalendarSyncTask, LabRoom, LowStockAlert, StockMovement
 
 admin.site.register(InventoryItem)
 admin.site.register(Category)
+
+
+@admin.register(CalendarSyncTask)
+class CalendarSyncTaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'action', 'event_id', 'status', 'attempts', 'next_attempt_at')
+    list_filter = ('status', 'action')
+
+
+@admin.register(LabRoom)
+class LabRoomAdmin(admin.ModelAdmin):
+    list_display = ('key', 'name', 'calendar_id', 'capacity', 'is_available')
+    list_filter = ('is_available',)
+    prepopulated_fields = {'key': ('name',)}
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('id', 'item', 'kind', 'delta', 'user', 'created_at')
+    list_filter = ('kind',)
+    list_select_related = ('item', 'user')
+
+    # The ledger is append-only
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LowStockAlert)
+class LowStockAlertAdmin(admin.ModelAdmin):
+    list_display = ('id', 'item', 'quantity', 'threshold', 'created_at', 'notified_at')
+    list_select_related = ('item',)
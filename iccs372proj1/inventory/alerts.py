@@ -0,0 +1,49 @@
+"""Batched delivery of low-stock alerts.
+
+Alerts are queued in the LowStockAlert outbox by whatever write pushed an item
+to or below its threshold. The notify_low_stock worker collects them here and
+sends one digest per batch instead of one message per item, skipping items
+that were restocked before the digest went out.
+"""
+import logging
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.utils import timezone
+
+from .models import LowStockAlert
+
+logger = logging.getLogger(__name__)
+
+
+def digest_lines(alerts):
+    """One line per item that is still low, in the order the alerts were raised"""
+    lines, seen = [], set()
+    for alert in alerts:
+        item = alert.item
+        if item.pk in seen or not item.is_low:
+            continue
+        seen.add(item.pk)
+        lines.append(f"{item.name}: {item.quantity} left (threshold {item.low_stock_threshold})")
+    return lines
+
+
+def send_pending_alerts(limit=500):
+    """Send one digest for up to `limit` queued alerts; returns (alerts processed, items reported)"""
+    alerts = list(
+        LowStockAlert.objects.filter(notified_at__isnull=True).select_related('item').order_by('id')[:limit]
+    )
+    if not alerts:
+        return 0, 0
+
+    lines = digest_lines(alerts)
+    if lines:
+        subject = f"{len(lines)} inventory item(s) low on stock"
+        recipients = getattr(settings, 'LOW_STOCK_ALERT_RECIPIENTS', [])
+        if recipients:
+            send_mail(subject, "\n".join(lines), None, recipients)
+        else:
+            logger.warning("%s:\n%s", subject, "\n".join(lines))
+
+    LowStockAlert.objects.filter(pk__in=[alert.pk for alert in alerts]).update(notified_at=timezone.now())
+    return len(alerts), len(lines)
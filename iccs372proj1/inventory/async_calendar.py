@@ -0,0 +1,114 @@
+"""Calendar client for coroutines running on an ASGI server's event loop.
+
+GoogleCalendarAPI blocks on httplib2, which would stall every request sharing
+the loop. AsyncGoogleCalendarAPI talks to the same Calendar v3 REST endpoints
+with httpx.AsyncClient instead. At most CALENDAR_ASYNC_CONCURRENCY calls per
+event loop are in flight; the others wait for a free slot, so a burst of
+requests can't open a connection each or run into Google's rate limits.
+
+Other backends (the fake calendar) are sync only; ThreadedCalendarAPI runs
+their calls in worker threads behind the same limit.
+"""
+import asyncio
+import weakref
+from urllib.parse import quote
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from google.auth.transport.requests import Request
+
+from .google_calendar import CalendarAPIError, EventPage, default_credentials, get_calendar_api
+from .metrics import InstrumentedCalendarAPI
+
+GOOGLE_BACKEND = 'inventory.google_calendar.GoogleCalendarAPI'
+DEFAULT_ENDPOINT = 'https://www.googleapis.com/calendar/v3/'
+
+# One client per event loop: httpx connections and semaphores can't be shared between loops
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_calendar_api():
+    """Calendar client for the running event loop, matching settings.CALENDAR_BACKEND"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        if settings.CALENDAR_BACKEND == GOOGLE_BACKEND:
+            client = InstrumentedCalendarAPI(AsyncGoogleCalendarAPI())
+        else:
+            # The sync client times its own calls
+            client = ThreadedCalendarAPI(get_calendar_api())
+        _clients[loop] = client
+    return client
+
+
+def _reset_on_setting_change(setting, **kwargs):
+    if setting.startswith('CALENDAR_') or setting.startswith('GOOGLE_CALENDAR_'):
+        _clients.clear()
+
+
+setting_changed.connect(_reset_on_setting_change)
+
+
+class AsyncGoogleCalendarAPI:
+    """Async Google Calendar client with the same list_events contract as GoogleCalendarAPI"""
+
+    def __init__(self, credentials=None, api_endpoint=None, concurrency=None):
+        self.credentials = credentials or default_credentials()
+        self.api_endpoint = api_endpoint or settings.GOOGLE_CALENDAR_API_ENDPOINT or DEFAULT_ENDPOINT
+        concurrency = concurrency or settings.CALENDAR_ASYNC_CONCURRENCY
+        self._limit = asyncio.Semaphore(concurrency)
+        self._refresh_lock = asyncio.Lock()
+        self._http = httpx.AsyncClient(
+            base_url=self.api_endpoint,
+            timeout=settings.GOOGLE_CALENDAR_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=concurrency),
+        )
+
+    async def _headers(self):
+        if not self.credentials.valid:
+            async with self._refresh_lock:
+                if not self.credentials.valid:
+                    # google-auth only refreshes synchronously; it happens about once an hour
+                    await asyncio.to_thread(self.credentials.refresh, Request())
+        headers = {}
+        self.credentials.apply(headers)
+        return headers
+
+    async def _get(self, path, params, action):
+        async with self._limit:
+            try:
+                response = await self._http.get(path, params=params, headers=await self._headers())
+            except httpx.HTTPError as e:
+                raise CalendarAPIError(f"Failed to {action}: {str(e)}")
+        if response.is_error:
+            raise CalendarAPIError(f"Failed to {action}: {response.text}", response.status_code)
+        return response.json()
+
+    async def list_events(self, calendar_id, sync_token=None, updated_min=None, page_token=None, page_size=250):
+        """One page of a calendar's events; see GoogleCalendarAPI.list_events"""
+        params = {'showDeleted': 'true', 'maxResults': page_size}
+        if sync_token:
+            params['syncToken'] = sync_token
+        elif updated_min:
+            params['updatedMin'] = updated_min.isoformat()
+        if page_token:
+            params['pageToken'] = page_token
+
+        response = await self._get(
+            f"calendars/{quote(calendar_id, safe='')}/events", params, 'list Google Calendar events'
+        )
+        return EventPage(response.get('items', []), response.get('nextPageToken'), response.get('nextSyncToken'))
+
+
+class ThreadedCalendarAPI:
+    """Async front for a sync calendar client; each call runs in a worker thread"""
+
+    def __init__(self, api, concurrency=None):
+        self.api = api
+        self._limit = asyncio.Semaphore(concurrency or settings.CALENDAR_ASYNC_CONCURRENCY)
+
+    async def list_events(self, *args, **kwargs):
+        async with self._limit:
+            return await sync_to_async(self.api.list_events, thread_sensitive=False)(*args, **kwargs)
@@ -0,0 +1,128 @@
+"""Per-room, per-day occupancy bitmaps backing the availability API.
+
+Each day is split into 15 minute slots; bit i of a RoomOccupancy row is set
+when any confirmed reservation touches slot i. Bitmaps are rebuilt for the
+affected room-days whenever a reservation changes, so availability queries
+read one small row per room and day and never scan reservations.
+
+A rebuild holds a lock on the room's row while it reads the reservations and
+upserts the bitmaps. Two bookings of one room then rebuild one after the
+other, the second seeing the first's reservation, instead of both inserting
+the same room-day or the later one overwriting a bitmap that lacks the other.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import LabRoom, Reservation, RoomOccupancy
+from .rooms import lab_rooms
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOT = timedelta(minutes=SLOT_MINUTES)
+FULL_DAY = (1 << SLOTS_PER_DAY) - 1
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def days_between(start_time, end_time):
+    """Local dates touched by the half-open interval [start_time, end_time)"""
+    first = timezone.localtime(start_time).date()
+    last = timezone.localtime(end_time - timedelta(microseconds=1)).date()
+    return [first + timedelta(days=n) for n in range((last - first).days + 1)]
+
+
+def slot_mask(day, start_time, end_time):
+    """Bits for the slots of `day` that [start_time, end_time) overlaps"""
+    begin = day_start(day)
+    start = max(start_time, begin)
+    end = min(end_time, begin + timedelta(days=1))
+    if end <= start:
+        return 0
+    first = int((start - begin) // SLOT)
+    last = min(SLOTS_PER_DAY, -int(-(end - begin) // SLOT))
+    return ((1 << (last - first)) - 1) << first
+
+
+def refresh_occupancy(room_id, days):
+    """Rebuild the bitmaps of one room for the given days from its confirmed reservations"""
+    days = sorted(set(days))
+    if not days:
+        return
+    # Joins the caller's transaction (Reservation.save() runs one) without a savepoint
+    with transaction.atomic(savepoint=False):
+        # Held until commit; on SQLite the IMMEDIATE transaction already serialises writers
+        list(LabRoom.objects.select_for_update().filter(pk=room_id).values_list('pk'))
+        reservations = Reservation.objects.overlapping(
+            room_id, day_start(days[0]), day_start(days[-1] + timedelta(days=1))
+        ).values_list('start_time', 'end_time')
+
+        bitmaps = dict.fromkeys(days, 0)
+        for start_time, end_time in reservations:
+            for day in days_between(start_time, end_time):
+                if day in bitmaps:
+                    bitmaps[day] |= slot_mask(day, start_time, end_time)
+
+        # Free days keep no row, so the table only grows with booked room-days
+        free = [day for day, bits in bitmaps.items() if not bits]
+        if free:
+            RoomOccupancy.objects.filter(room_id=room_id, day__in=free).delete()
+        # One upsert however many days changed (a recurring series touches many)
+        RoomOccupancy.objects.bulk_create(
+            [
+                RoomOccupancy(room_id=room_id, day=day, slots=RoomOccupancy.pack(bits))
+                for day, bits in bitmaps.items() if bits
+            ],
+            update_conflicts=True,
+            unique_fields=['room', 'day'],
+            update_fields=['slots'],
+        )
+
+
+def refresh_spans(spans):
+    """Rebuild the bitmaps touched by a set of booked_span() tuples"""
+    days_by_room = {}
+    for room_id, start_time, end_time in spans:
+        days_by_room.setdefault(room_id, set()).update(days_between(start_time, end_time))
+    for room_id, days in days_by_room.items():
+        refresh_occupancy(room_id, days)
+
+
+def free_slots(start_date, end_date, room_ids=None):
+    """Free intervals per room id between two local dates (inclusive), read from the bitmaps only"""
+    room_ids = list(room_ids or [room.pk for room in lab_rooms.all()])
+    days = [start_date + timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+
+    occupied = {
+        (room_id, day): RoomOccupancy.unpack(slots)
+        for room_id, day, slots in RoomOccupancy.objects.filter(
+            room_id__in=room_ids, day__gte=start_date, day__lte=end_date
+        ).values_list('room_id', 'day', 'slots')
+    }
+
+    result = {}
+    for room_id in room_ids:
+        intervals = []
+        for day in days:
+            free = ~occupied.get((room_id, day), 0) & FULL_DAY
+            begin = day_start(day)
+            slot = 0
+            while slot < SLOTS_PER_DAY:
+                if not free >> slot & 1:
+                    slot += 1
+                    continue
+                run_start = slot
+                while slot < SLOTS_PER_DAY and free >> slot & 1:
+                    slot += 1
+                start_time = begin + SLOT * run_start
+                end_time = begin + SLOT * slot
+                # Join runs that continue across midnight
+                if intervals and intervals[-1][1] == start_time:
+                    intervals[-1] = (intervals[-1][0], end_time)
+                else:
+                    intervals.append((start_time, end_time))
+        result[room_id] = intervals
+    return result
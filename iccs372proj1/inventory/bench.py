@@ -0,0 +1,136 @@
+"""Helpers shared by the bench_* management commands"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import httpx
+from django.conf import settings
+from django.db import connection
+from django.urls import reverse
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from .rooms import lab_rooms
+
+
+@contextmanager
+def isolated_database(name=None):
+    """Run the body against a throwaway test database so benchmarks never touch real data.
+
+    Pass a file name to benchmark SQLite on disk instead of in memory. The test
+    environment is set up too, so django.test.Client can drive the views; with
+    no collectstatic manifest, the pages it renders link the plain static names.
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    if name:
+        test_settings['NAME'] = name
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    # Rooms cached from another database must not leak in (or out)
+    lab_rooms.invalidate()
+    unhashed = override_settings(STORAGES={
+        **settings.STORAGES,
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    unhashed.enable()
+    try:
+        yield
+    finally:
+        unhashed.disable()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        lab_rooms.invalidate()
+        test_settings['NAME'] = old_test_name
+        teardown_test_environment()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds"""
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+    }
+
+
+def format_summary(label, summary):
+    if not summary['count']:
+        return f"{label}: no samples"
+    return (
+        f"{label}: n={summary['count']} mean={summary['mean_ms']}ms p50={summary['p50_ms']}ms "
+        f"p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms max={summary['max_ms']}ms"
+    )
+
+
+def regressions(baseline, current, tolerance=0.2, floor_ms=2.0):
+    """Describe every route whose p95 grew by more than tolerance (and floor_ms) or that runs more queries.
+
+    Both arguments are bench_urls results: {'scales': {scale: {'routes': {route: summary}}}}.
+    Scales and routes missing from either side are skipped.
+    """
+    found = []
+    for scale, result in current['scales'].items():
+        old_routes = baseline.get('scales', {}).get(scale, {}).get('routes', {})
+        for route, new in result['routes'].items():
+            old = old_routes.get(route)
+            if not old or not old['count'] or not new['count']:
+                continue
+            if new['p95_ms'] > old['p95_ms'] * (1 + tolerance) and new['p95_ms'] - old['p95_ms'] > floor_ms:
+                found.append(f"{scale} {route}: p95 {old['p95_ms']}ms -> {new['p95_ms']}ms")
+            if new['queries'] > old['queries']:
+                found.append(f"{scale} {route}: {old['queries']} -> {new['queries']} queries per request")
+    return found
+
+
+@contextmanager
+def gunicorn_server(env, workers=2):
+    """Serve the app with gunicorn (configured by gunicorn.conf.py and env) on a free port; yields its base URL
+
+    Static files are collected into a temporary STATIC_ROOT first, as in a deploy.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    static_root = tempfile.TemporaryDirectory()
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), STATIC_ROOT=static_root.name, **env)
+    subprocess.run(
+        [sys.executable, 'manage.py', 'collectstatic', '--no-input', '--verbosity', '0'],
+        cwd=settings.BASE_DIR, env=env, check=True,
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+        cwd=settings.BASE_DIR, env=env,
+    )
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        deadline = time.time() + 30
+        while True:
+            try:
+                httpx.get(base_url + reverse('login'), timeout=1)
+                break
+            except httpx.HTTPError:
+                if time.time() > deadline:
+                    raise RuntimeError(f"Server at {base_url} did not come up")
+                time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait()
+        static_root.cleanup()
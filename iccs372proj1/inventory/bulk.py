@@ -0,0 +1,288 @@
+"""Streaming bulk import and export of inventory items.
+
+Imports read CSV, a JSON array or JSON Lines one record at a time, validate
+names in set-based batches and write each batch with bulk_create and grouped
+updates inside its own transaction, so memory stays flat however large the file is.
+Records whose name matches an existing item (case-insensitively) update its
+quantity and category.
+"""
+import csv
+import io
+import itertools
+import json
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .cache import bump_inventory_version
+from .models import Category, InventoryItem, LowStockAlert, StockMovement
+from .suggest import suggestion_index
+
+EXPORT_FIELDS = ['name', 'quantity', 'category']
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 20
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, record, message, count=1):
+        self.failed += count
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Record {record}: {message}")
+
+    def __str__(self):
+        return f"{self.created} created, {self.updated} updated, {self.failed} rejected"
+
+
+def _iter_json_array(text, buffer='', chunk_size=64 * 1024):
+    """Yield the values of a top-level JSON array without loading the whole document"""
+    decoder = json.JSONDecoder()
+    state = 'start'
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not buffer or (state == 'value' and not eof and len(buffer) < chunk_size):
+            chunk = '' if eof else text.read(chunk_size)
+            eof = not chunk
+            if not buffer and eof:
+                raise ValueError("Unexpected end of JSON input")
+            buffer += chunk
+            if not buffer.strip():
+                continue
+            buffer = buffer.lstrip()
+
+        if state == 'start':
+            if buffer[0] != '[':
+                raise ValueError("Expected a JSON array")
+            buffer, state = buffer[1:], 'first'
+        elif state in ('first', 'next'):
+            if buffer[0] == ']':
+                return
+            if state == 'next':
+                if buffer[0] != ',':
+                    raise ValueError("Expected ',' or ']' in JSON array")
+                buffer = buffer[1:]
+            state = 'value'
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except ValueError:
+                if eof:
+                    raise
+                chunk = text.read(chunk_size)
+                eof = not chunk
+                buffer += chunk
+                continue
+            if end == len(buffer) and not eof:
+                # A number at the very end of the buffer may continue in the next chunk
+                chunk = text.read(chunk_size)
+                eof = not chunk
+                if chunk:
+                    buffer += chunk
+                    continue
+            yield value
+            buffer, state = buffer[end:], 'next'
+
+
+def _iter_json(text):
+    """A JSON array, or JSON Lines (one object per line)"""
+    first = text.read(1)
+    while first.isspace():
+        first = text.read(1)
+    if first == '[':
+        yield from _iter_json_array(text, buffer=first)
+        return
+    for line in itertools.chain([first + text.readline()], text):
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_records(stream, file_format):
+    """Iterate over the records of a binary file-like object in 'csv' or 'json' format"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        return csv.DictReader(text)
+    return _iter_json(text)
+
+
+def _clean_record(record):
+    if not isinstance(record, dict):
+        raise ValueError("expected an object with name, quantity and category")
+    name = str(record.get('name') or '').strip()
+    if not name:
+        raise ValueError("name is required")
+    if len(name) > 200:
+        raise ValueError("name is longer than 200 characters")
+    quantity = record.get('quantity')
+    # int() would truncate 2.7 from JSON (and take true as 1)
+    if isinstance(quantity, bool) or (isinstance(quantity, float) and not quantity.is_integer()):
+        raise ValueError("quantity must be a whole number")
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("quantity must be a whole number")
+    if quantity < 0:
+        raise ValueError("quantity cannot be negative")
+    category = str(record.get('category') or '').strip()
+    if len(category) > 200:
+        raise ValueError("category is longer than 200 characters")
+    return name, quantity, category
+
+
+def _categories(names):
+    """Category objects by name, creating the missing ones"""
+    found = {category.name: category for category in Category.objects.filter(name__in=names).order_by()}
+    missing = [name for name in names if name not in found]
+    if missing:
+        Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+        found.update((category.name, category) for category in Category.objects.filter(name__in=missing).order_by())
+    return found
+
+
+def _write_batch(rows, user):
+    """Create or update the items of one batch; returns (created, updated) counts"""
+    # One lookup per batch instead of one iexact query per record; the rows stay locked until
+    # the batch commits, so the ledger deltas below match what is overwritten
+    matches = InventoryItem.objects.select_for_update().annotate(lower_name=Lower('name'))
+    existing = {item.lower_name: item for item in matches.filter(lower_name__in=list(rows)).order_by()}
+    categories = _categories({category for _, _, category in rows.values() if category})
+
+    created, movements = [], []
+    # Rows that end up with the same values share one UPDATE ... WHERE id IN (...).
+    # bulk_update() builds a CASE expression per row, which costs far more than the SQL saves.
+    changes = defaultdict(list)
+    for key, (name, quantity, category) in rows.items():
+        item = existing.get(key)
+        category = categories.get(category) if category else None
+        if item is None:
+            item = InventoryItem(name=name, quantity=quantity, category=category, user=user)
+            created.append(item)
+            continue
+        category_id = category.pk if category else None
+        if (item.quantity, item.category_id) != (quantity, category_id):
+            changes[quantity, category_id].append(item.pk)
+        if quantity != item.quantity:
+            movements.append(StockMovement(item=item, kind=StockMovement.ADJUST, delta=quantity - item.quantity, user=user))
+
+    InventoryItem.objects.bulk_create(created)
+    now = timezone.now()
+    for (quantity, category_id), ids in changes.items():
+        InventoryItem.objects.filter(pk__in=ids).update(quantity=quantity, category_id=category_id, last_updated=now)
+    # Low-stock flags and alerts for the changed quantities, set-based like the rest of the batch
+    changed = [movement.item_id for movement in movements]
+    if changed:
+        InventoryItem.refresh_low_stock(changed)
+    # Opening balances for the new items and adjustments for the changed ones
+    movements += [
+        StockMovement(item=item, kind=StockMovement.ADJUST, delta=item.quantity, user=user)
+        for item in created if item.quantity
+    ]
+    StockMovement.objects.bulk_create(movements)
+    LowStockAlert.objects.bulk_create([
+        LowStockAlert(item=item, quantity=item.quantity, threshold=item.low_stock_threshold)
+        for item in created if item.is_low
+    ])
+    return len(created), len(rows) - len(created)
+
+
+def import_items(records, user, batch_size=BATCH_SIZE):
+    """Create or update inventory items from an iterable of records; returns an ImportResult"""
+    result = ImportResult()
+    numbered = enumerate(records, 1)
+    while True:
+        batch = list(itertools.islice(numbered, batch_size))
+        if not batch:
+            break
+        rows, first = {}, batch[0][0]
+        for number, record in batch:
+            try:
+                name, quantity, category = _clean_record(record)
+            except ValueError as e:
+                result.add_error(number, e)
+                continue
+            # The last record wins when a name repeats within the batch
+            rows[name.lower()] = (name, quantity, category)
+        if not rows:
+            continue
+        try:
+            with transaction.atomic():
+                created, updated = _write_batch(rows, user)
+        except IntegrityError as e:
+            # Someone created one of these names concurrently; report the batch and carry on
+            result.add_error(f"{first}-{batch[-1][0]}", e, count=len(rows))
+            continue
+        # Counted once the batch has committed, so a rolled back batch is only reported as rejected
+        result.created += created
+        result.updated += updated
+
+    # bulk_create and update() skip model signals
+    suggestion_index.invalidate()
+    bump_inventory_version()
+    return result
+
+
+def export_records():
+    rows = InventoryItem.objects.order_by('id').values_list('name', 'quantity', 'category__name')
+    for name, quantity, category in rows.iterator(chunk_size=2000):
+        yield {'name': name, 'quantity': quantity, 'category': category}
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller"""
+
+    def write(self, value):
+        return value
+
+
+def _buffered(pieces, size=64 * 1024):
+    """Join small strings into chunks of roughly `size` characters"""
+    buffer, length = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def export_csv():
+    writer = csv.writer(_Echo())
+    lines = itertools.chain(
+        [writer.writerow(EXPORT_FIELDS)],
+        (writer.writerow([record[field] for field in EXPORT_FIELDS]) for record in export_records()),
+    )
+    return _buffered(lines)
+
+
+def export_json():
+    def pieces():
+        yield '['
+        for n, record in enumerate(export_records()):
+            yield (',\n' if n else '\n') + json.dumps(record)
+        yield '\n]\n'
+    return _buffered(pieces())
+
+
+async def astream(chunks):
+    """Async iterator over export_csv() or export_json(), for responses served over ASGI.
+
+    Each chunk is made by sync_to_async on the request's thread, where the export's
+    cursor lives, so the export still streams a chunk at a time in flat memory.
+    """
+    done = object()
+    try:
+        while (chunk := await sync_to_async(next)(chunks, done)) is not done:
+            yield chunk
+    finally:
+        # A client that hangs up leaves the cursor open otherwise
+        await sync_to_async(chunks.close)()
@@ -0,0 +1,95 @@
+"""Versioned cache for the dashboard's rendered table, category list and low-stock count.
+
+Every entry key embeds the current inventory version. Saving or deleting an
+item or category bumps the version (see signals.py), so every older entry
+stops being read at once and simply expires; nothing has to enumerate or
+delete keys, which keeps this working on the local-memory and file backends.
+The version lives in the cache too, so a per-process cache under several
+workers would leave the others serving stale fragments; settings.py turns
+DASHBOARD_CACHE_ENABLED off for that combination.
+Entries are computed from the primary database, never from a read replica.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import DASHBOARD_CACHE
+from .replicas import primary
+
+VERSION_KEY = 'inventory:version'
+_MISSING = object()
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def current_version(key):
+    """Value of a version counter kept in the cache"""
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a counter that was evicted never reuses an older number
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        current_version(key)
+
+
+def inventory_version():
+    return current_version(VERSION_KEY)
+
+
+def bump_inventory_version():
+    """Invalidate every cached dashboard fragment"""
+    bump_version(VERSION_KEY)
+
+
+def cached(name, key_parts, compute, version=None):
+    """Return the cached value for name/key_parts under the current version, computing it on a miss"""
+    if not settings.DASHBOARD_CACHE_ENABLED:
+        return compute()
+    if version is None:
+        version = inventory_version()
+    digest = hashlib.md5(repr(key_parts).encode()).hexdigest()
+    key = f'dashboard:{name}:{version}:{digest}'
+
+    value = cache.get(key, _MISSING)
+    hit = value is not _MISSING
+    with _stats_lock:
+        _stats[name, 'hits' if hit else 'misses'] += 1
+    DASHBOARD_CACHE['hits' if hit else 'misses'].labels(name).inc()
+    if not hit:
+        # A lagging replica would store old rows under the new version
+        with primary():
+            value = compute()
+        cache.set(key, value, settings.DASHBOARD_CACHE_TTL)
+    return value
+
+
+def cache_stats():
+    """Hit and miss counts per fragment for this process"""
+    with _stats_lock:
+        names = sorted({name for name, _ in _stats})
+        report = {}
+        for name in names:
+            hits, misses = _stats[name, 'hits'], _stats[name, 'misses']
+            report[name] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+            }
+        return report
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,165 @@
+"""Tiny local HTTP server that mimics the Calendar v3 event endpoints.
+
+Used by the benchmarks to exercise the real client stack (discovery, auth,
+httplib2) without leaving the machine. Listings support pageToken and
+syncToken; the sync token is simply the number of the last change seen.
+Batch requests (POST /batch/calendar/v3, multipart/mixed) are answered part
+by part, in one round trip.
+"""
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+class CalendarStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=None, content_type='application/json'):
+        if self.latency:
+            time.sleep(self.latency)
+        if isinstance(body, bytes):
+            data = body
+        else:
+            data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length)
+
+    def _changed(self, key):
+        with self.server.lock:
+            self.server.change_count += 1
+            self.server.changes[key] = (self.server.change_count, datetime.now(timezone.utc).isoformat())
+
+    def _handle(self, method, path, body):
+        """(status, JSON body or None) for one events request"""
+        url = urlparse(path)
+        # /calendar/v3/calendars/<calendarId>/events[/<eventId>]
+        parts = [unquote(p) for p in url.path.split('/') if p]
+        calendar_id, event_id = parts[3], parts[5] if len(parts) > 5 else None
+        if method == 'GET':
+            return self._list(calendar_id, {name: values[0] for name, values in parse_qs(url.query).items()})
+        if method == 'POST':
+            return self._insert(calendar_id, json.loads(body or b'{}'))
+        if method == 'PUT':
+            return self._update(calendar_id, event_id, json.loads(body or b'{}'))
+        return self._delete(calendar_id, event_id)
+
+    def _list(self, calendar_id, query):
+        try:
+            since = int(query.get('syncToken') or 0)
+        except ValueError:
+            return 410, {'error': {'code': 410, 'message': 'Sync token is no longer valid, a full sync is required.'}}
+        offset = int(query.get('pageToken') or 0)
+        page_size = int(query.get('maxResults') or 250)
+        updated_min = query.get('updatedMin')
+
+        with self.server.lock:
+            changed = sorted(
+                (number, updated, event_id)
+                for (calendar, event_id), (number, updated) in self.server.changes.items()
+                if calendar == calendar_id and number > since
+                and (not updated_min or datetime.fromisoformat(updated) >= datetime.fromisoformat(updated_min))
+            )
+            items = []
+            for number, updated, event_id in changed[offset:offset + page_size]:
+                event = self.server.events.get((calendar_id, event_id))
+                event = dict(event, status='confirmed') if event else {'id': event_id, 'status': 'cancelled'}
+                event['updated'] = updated
+                items.append(event)
+            body = {'kind': 'calendar#events', 'items': items}
+            if offset + page_size < len(changed):
+                body['nextPageToken'] = str(offset + page_size)
+            else:
+                body['nextSyncToken'] = str(self.server.change_count)
+        return 200, body
+
+    def _insert(self, calendar_id, event):
+        event.setdefault('id', uuid.uuid4().hex)
+        key = (calendar_id, event['id'])
+        if key in self.server.events:
+            return 409, {'error': {'code': 409, 'message': 'The requested identifier already exists.'}}
+        self.server.events[key] = event
+        self._changed(key)
+        return 200, event
+
+    def _update(self, calendar_id, event_id, event):
+        if (calendar_id, event_id) not in self.server.events:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        event['id'] = event_id
+        self.server.events[(calendar_id, event_id)] = event
+        self._changed((calendar_id, event_id))
+        return 200, event
+
+    def _delete(self, calendar_id, event_id):
+        if self.server.events.pop((calendar_id, event_id), None) is None:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        self._changed((calendar_id, event_id))
+        return 204, None
+
+    def _batch(self, body):
+        """Answer a multipart/mixed batch: each part is an HTTP request, answered by a part with its response"""
+        message = BytesParser().parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+        )
+        boundary = f'batch_{uuid.uuid4().hex}'
+        out = []
+        for part in message.get_payload():
+            request = part.get_payload()
+            head, _, inner_body = request.partition('\n\n')
+            method, path, _ = head.split('\n', 1)[0].split(' ', 2)
+            status, reply = self._handle(method, path, inner_body.encode())
+            data = json.dumps(reply) if reply is not None else ''
+            content_id = part['Content-ID'].replace('<', '<response-', 1)
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: {content_id}\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n{data}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        self._reply(200, ''.join(out).encode(), f'multipart/mixed; boundary={boundary}')
+
+    def do_GET(self):
+        self._reply(*self._handle('GET', self.path, None))
+
+    def do_POST(self):
+        if urlparse(self.path).path.startswith('/batch/'):
+            return self._batch(self._body())
+        self._reply(*self._handle('POST', self.path, self._body()))
+
+    def do_PUT(self):
+        self._reply(*self._handle('PUT', self.path, self._body()))
+
+    def do_DELETE(self):
+        self._reply(*self._handle('DELETE', self.path, None))
+
+
+def start_stub_server(latency=0):
+    """Start the stub on a free localhost port; returns (server, api_endpoint)"""
+    handler = type('Handler', (CalendarStubHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    # Clients hanging up mid-reply (a benchmarked server being stopped) are not worth a traceback
+    server.handle_error = lambda request, client_address: None
+    server.events = {}
+    server.changes = {}
+    server.change_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/calendar/v3/"
@@ -0,0 +1,158 @@
+import random
+import re
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Value, When
+from django.db.models.functions import Left, StrIndex
+from django.utils import timezone
+
+from .google_calendar import get_calendar_api
+from .models import CalendarSyncTask
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, capped by CALENDAR_SYNC_MAX_BACKOFF"""
+    delay = min(settings.CALENDAR_SYNC_BASE_BACKOFF * (2 ** (attempts - 1)), settings.CALENDAR_SYNC_MAX_BACKOFF)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def task_operation(task):
+    """Batch operation (see GoogleCalendarAPI.batch) for an outbox entry"""
+    operation = {
+        'action': task.action,
+        'calendar_id': task.calendar_id,
+        'event_id': task.event_id,
+    }
+    if task.action != CalendarSyncTask.DELETE:
+        operation.update(
+            summary=task.payload['summary'],
+            description=task.payload['description'],
+            start_time=datetime.fromisoformat(task.payload['start_time']),
+            end_time=datetime.fromisoformat(task.payload['end_time']),
+            recurrence=task.payload.get('recurrence'),
+        )
+    return operation
+
+
+def is_issued_id(event_id):
+    """True for ids from CalendarSyncTask.new_event_id(); events with other ids were made outside this app"""
+    return re.fullmatch(r'[0-9a-f]{32}', event_id) is not None
+
+
+def is_instance_id(event_id):
+    """Ids we choose are plain hex; '<id>_<start>' names one occurrence of a recurring event"""
+    return '_' in event_id
+
+
+def ordering_key():
+    """event_id up to its first '_': changes to an occurrence queue behind those to its recurring event"""
+    return Case(
+        When(event_id__contains='_', then=Left('event_id', StrIndex('event_id', Value('_')) - 1)),
+        default=F('event_id'),
+    )
+
+
+def _settled(operation, result):
+    """True when the remote calendar already matches what the operation asked for.
+
+    Inserts carry the event id chosen when the task was queued, so a retried
+    insert that already landed answers 409; deleting an event that is already
+    gone answers 404/410.
+    """
+    if result.ok:
+        return True
+    if operation['action'] == CalendarSyncTask.CREATE:
+        return result.status == 409
+    if operation['action'] == CalendarSyncTask.DELETE:
+        return result.status in (404, 410)
+    return False
+
+
+def apply_tasks(api, tasks):
+    """Send outbox entries as batch requests; returns one error (or None) per task"""
+    operations = [task_operation(task) for task in tasks]
+    errors = [None] * len(tasks)
+
+    recreate = []
+    for i, (operation, result) in enumerate(zip(operations, api.batch(operations))):
+        if _settled(operation, result):
+            continue
+        if operation['action'] == CalendarSyncTask.UPDATE and result.status == 404 and not is_instance_id(operation['event_id']):
+            # The insert never made it (or the event was removed remotely); recreate it.
+            # A lone occurrence can't be recreated outside its recurring event.
+            recreate.append(i)
+            continue
+        errors[i] = result.error
+
+    if recreate:
+        inserts = [dict(operations[i], action=CalendarSyncTask.CREATE) for i in recreate]
+        for i, operation, result in zip(recreate, inserts, api.batch(inserts)):
+            if not _settled(operation, result):
+                errors[i] = result.error
+
+    return errors
+
+
+def apply_task(api, task):
+    """Send a single outbox entry, raising its error if it failed"""
+    error = apply_tasks(api, [task])[0]
+    if error is not None:
+        raise error
+
+
+def drain_outbox(api=None, limit=100):
+    """Process due outbox entries and return (sent, failed) counts.
+
+    Entries for the same event are applied strictly in the order they were
+    queued: only the oldest pending entry per event goes into a batch, and
+    while it waits for a retry the later ones are held back, so a delete can
+    never overtake its insert. Occurrences of a recurring event count as
+    that event.
+
+    Several sync_calendar processes can drain the outbox at once. Each claims
+    its entries in a short transaction, locking them (skipping rows another
+    worker has locked) and moving next_attempt_at CALENDAR_SYNC_CLAIM_SECONDS
+    ahead, so they are no longer due for anyone else while it sends them. On
+    SQLite the transaction takes the write lock up front, which serializes the
+    claims instead. A worker that dies mid-send leaves its entries to be
+    retried once the claim runs out.
+    """
+    api = api or get_calendar_api()
+    pending = CalendarSyncTask.objects.filter(status=CalendarSyncTask.PENDING).annotate(key=ordering_key())
+    # Filtered in SQL, so entries waiting for a retry never crowd due ones out of the limit
+    queued_before = pending.filter(key=OuterRef('key'), id__lt=OuterRef('id'))
+    with transaction.atomic():
+        now = timezone.now()
+        due = list(
+            pending.filter(next_attempt_at__lte=now)
+            .exclude(Exists(queued_before))
+            .select_for_update(skip_locked=True)
+            .order_by('id')[:limit]
+        )
+        if due:
+            CalendarSyncTask.objects.filter(pk__in=[task.pk for task in due]).update(
+                next_attempt_at=now + timedelta(seconds=settings.CALENDAR_SYNC_CLAIM_SECONDS),
+            )
+
+    if not due:
+        return 0, 0
+
+    sent = failed = 0
+    for task, error in zip(due, apply_tasks(api, due)):
+        task.attempts += 1
+        if error is None:
+            sent += 1
+            task.status = CalendarSyncTask.DONE
+            task.last_error = ''
+        else:
+            failed += 1
+            task.last_error = str(error)
+            if task.attempts >= settings.CALENDAR_SYNC_MAX_ATTEMPTS:
+                task.status = CalendarSyncTask.FAILED
+            else:
+                task.next_attempt_at = timezone.now() + retry_delay(task.attempts)
+
+    CalendarSyncTask.objects.bulk_update(due, ['status', 'attempts', 'next_attempt_at', 'last_error'])
+    return sent, failed
@@ -0,0 +1,182 @@
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+from .google_calendar import BatchResult, CalendarAPIError, EventPage, event_body, run_batch
+
+
+class FakeCalendarAPI:
+    """In-memory stand-in for GoogleCalendarAPI, used for local runs and load tests.
+
+    Events live in a process-wide dict so every instance sees the same calendars.
+    FAKE_CALENDAR_LATENCY (seconds) and FAKE_CALENDAR_FAILURE_RATE (0..1) in settings
+    simulate a slow or flaky remote service. Every change is numbered, and the
+    number doubles as the sync token, so listings can be incremental like Google's.
+    """
+    events = {}
+    # (calendar_id, event_id) -> (change number, time) of the last change, deletions included
+    changes = {}
+    change_count = 0
+    calls = 0
+    _lock = threading.Lock()
+
+    @property
+    def latency(self):
+        return getattr(settings, 'FAKE_CALENDAR_LATENCY', 0)
+
+    @property
+    def failure_rate(self):
+        return getattr(settings, 'FAKE_CALENDAR_FAILURE_RATE', 0)
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.events = {}
+            cls.changes = {}
+            cls.change_count = 0
+            cls.calls = 0
+
+    def _changed(self, key):
+        # Callers hold the lock
+        FakeCalendarAPI.change_count += 1
+        self.changes[key] = (FakeCalendarAPI.change_count, timezone.now())
+
+    def _round_trip(self):
+        with self._lock:
+            FakeCalendarAPI.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        self._maybe_fail()
+
+    def _maybe_fail(self):
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise CalendarAPIError("Fake calendar is unavailable", 503)
+
+    def _apply(self, operation):
+        action = operation['action']
+        if action == 'delete':
+            self._delete(operation['calendar_id'], operation['event_id'])
+            return operation['event_id']
+        args = (
+            operation['calendar_id'],
+            operation['summary'],
+            operation['start_time'],
+            operation['end_time'],
+            operation.get('description'),
+        )
+        recurrence = operation.get('recurrence')
+        if action == 'update':
+            self._update(args[0], operation['event_id'], *args[1:], recurrence=recurrence)
+            return operation['event_id']
+        return self._create(*args, event_id=operation.get('event_id'), recurrence=recurrence)
+
+    def create_event(self, calendar_id, summary, start_time, end_time, description=None, event_id=None):
+        self._round_trip()
+        return self._create(calendar_id, summary, start_time, end_time, description, event_id)
+
+    def update_event(self, calendar_id, event_id, summary, start_time, end_time, description=None):
+        self._round_trip()
+        self._update(calendar_id, event_id, summary, start_time, end_time, description)
+
+    def delete_event(self, calendar_id, event_id):
+        self._round_trip()
+        self._delete(calendar_id, event_id)
+
+    def list_events(self, calendar_id, sync_token=None, updated_min=None, page_token=None, page_size=250):
+        """Same contract as GoogleCalendarAPI.list_events; one simulated round trip per page"""
+        self._round_trip()
+        try:
+            since = int(sync_token or 0)
+        except ValueError:
+            raise CalendarAPIError("Failed to list Google Calendar events: sync token is no longer valid", 410)
+        offset = int(page_token or 0)
+
+        with self._lock:
+            changed = sorted(
+                (number, updated, event_id)
+                for (calendar, event_id), (number, updated) in self.changes.items()
+                if calendar == calendar_id and number > since and (not updated_min or updated >= updated_min)
+            )
+            events = []
+            for number, updated, event_id in changed[offset:offset + page_size]:
+                event = self.events.get((calendar_id, event_id))
+                if event is None:
+                    # Changed occurrences are listed as events of their own, like Google does
+                    parent = self._recurring_parent(calendar_id, event_id)
+                    event = parent and parent.get('exceptions', {}).get(event_id)
+                event = dict({'status': 'confirmed'}, **event) if event else {'id': event_id, 'status': 'cancelled'}
+                event['updated'] = updated.isoformat()
+                events.append(event)
+            more = offset + page_size < len(changed)
+            return EventPage(
+                events,
+                next_page_token=str(offset + page_size) if more else None,
+                next_sync_token=None if more else str(FakeCalendarAPI.change_count),
+            )
+
+    def batch(self, operations, retries=2):
+        """Same contract as GoogleCalendarAPI.batch; one simulated round trip per chunk"""
+        return run_batch(self._execute_chunk, operations, retries=retries, backoff=0)
+
+    def _execute_chunk(self, operations, indexes, results):
+        try:
+            self._round_trip()
+        except CalendarAPIError as e:
+            for i in indexes:
+                results[i] = BatchResult(error=e)
+            return
+        for i in indexes:
+            try:
+                self._maybe_fail()
+                results[i] = BatchResult(event_id=self._apply(operations[i]))
+            except CalendarAPIError as e:
+                results[i] = BatchResult(error=e)
+
+    def _create(self, calendar_id, summary, start_time, end_time, description=None, event_id=None, recurrence=None):
+        event_id = event_id or uuid.uuid4().hex
+        with self._lock:
+            if (calendar_id, event_id) in self.events:
+                raise CalendarAPIError("Failed to create Google Calendar event: duplicate id", 409)
+            event = event_body(summary, start_time, end_time, description, recurrence)
+            event['id'] = event_id
+            self.events[(calendar_id, event_id)] = event
+            self._changed((calendar_id, event_id))
+        return event_id
+
+    def _recurring_parent(self, calendar_id, event_id):
+        """The recurring event that an '<id>_<start>' instance id belongs to, if it is stored"""
+        base, _, start = event_id.partition('_')
+        parent = self.events.get((calendar_id, base))
+        if start and parent and parent.get('recurrence'):
+            return parent
+        return None
+
+    def _update(self, calendar_id, event_id, summary, start_time, end_time, description=None, recurrence=None):
+        with self._lock:
+            event = event_body(summary, start_time, end_time, description, recurrence)
+            event['id'] = event_id
+            if (calendar_id, event_id) in self.events:
+                self.events[(calendar_id, event_id)] = event
+                self._changed((calendar_id, event_id))
+                return
+            # Changing one occurrence stores it as an exception of the recurring event
+            parent = self._recurring_parent(calendar_id, event_id)
+            if parent is None:
+                raise CalendarAPIError("Failed to update Google Calendar event: not found", 404)
+            parent.setdefault('exceptions', {})[event_id] = event
+            self._changed((calendar_id, event_id))
+
+    def _delete(self, calendar_id, event_id):
+        with self._lock:
+            if self.events.pop((calendar_id, event_id), None) is not None:
+                self._changed((calendar_id, event_id))
+                return
+            parent = self._recurring_parent(calendar_id, event_id)
+            if parent is None:
+                raise CalendarAPIError("Failed to delete Google Calendar event: not found", 404)
+            parent.setdefault('exceptions', {})[event_id] = {'id': event_id, 'status': 'cancelled'}
+            self._changed((calendar_id, event_id))
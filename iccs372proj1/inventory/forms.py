@@ -2,7 +2,6 @@ from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from .models import Category, InventoryItem
-from django.core.exceptions import ValidationError
 
 
 class UserRegisterForm(UserCreationForm):
@@ -15,14 +14,28 @@ class UserRegisterForm(UserCreationForm):
 
 class InventoryItemForm(forms.ModelForm):
     category = forms.ModelChoiceField(queryset=Category.objects.all(), initial=0)
+    # Quantity the user started editing from; the difference is applied as a stock movement
+    original_quantity = forms.IntegerField(widget=forms.HiddenInput, required=False)
 
     class Meta:
         model = InventoryItem
-        fields = ['name', 'quantity', 'category']
+        fields = ['name', 'quantity', 'low_stock_threshold', 'category']
 
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
+        # Leaving the threshold empty keeps the current one (the default for new items)
+        self.fields['low_stock_threshold'].required = False
+        if self.instance.pk:
+            self.fields['original_quantity'].initial = self.instance.quantity
+        else:
+            del self.fields['original_quantity']
+
+    def clean_low_stock_threshold(self):
+        threshold = self.cleaned_data.get('low_stock_threshold')
+        if threshold is None:
+            return self.instance.low_stock_threshold
+        return threshold
 
     def clean_name(self):
         name = self.cleaned_data.get('name')
@@ -35,8 +48,28 @@ class InventoryItemForm(forms.ModelForm):
         return name
 
 
+class ItemImportForm(forms.Form):
+    FORMAT_CHOICES = [('csv', 'CSV'), ('json', 'JSON')]
+
+    file = forms.FileField(help_text="Columns/keys: name, quantity, category. Existing names are updated.")
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False, help_text="Detected from the file extension when left blank")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = cleaned_data.get('file')
+        if upload and not cleaned_data.get('format'):
+            extension = upload.name.rsplit('.', 1)[-1].lower()
+            if extension in ('json', 'jsonl'):
+                cleaned_data['format'] = 'json'
+            elif extension == 'csv':
+                cleaned_data['format'] = 'csv'
+            else:
+                raise forms.ValidationError("Choose a format; it can't be worked out from the file name.")
+        return cleaned_data
+
+
 from django import forms
-from .models import Reservation
+from .models import Reservation, ReservationSeries
 
 
 class ReservationForm(forms.ModelForm):
@@ -49,28 +82,42 @@ class ReservationForm(forms.ModelForm):
             'purpose': forms.Textarea(attrs={'rows': 3}),
         }
 
-    def clean(self):
-        cleaned_data = super().clean()
-        start_time = cleaned_data.get('start_time')
-        end_time = cleaned_data.get('end_time')
-        room_key = cleaned_data.get('room_key')
-
-        if start_time and end_time and room_key:
-            # Get the instance being updated (if any)
-            instance = getattr(self, 'instance', None)
-
-            # Check for conflicts excluding the current reservation
-            conflicts = Reservation.objects.filter(
-                room_key=room_key,
-                status='confirmed',
-                start_time__lt=end_time,
-                end_time__gt=start_time
-            )
+    # Conflict checking happens in Reservation.clean(), which ModelForm validation runs
 
-            if instance and instance.pk:
-                conflicts = conflicts.exclude(pk=instance.pk)
 
-            if conflicts.exists():
-                raise ValidationError('This time slot conflicts with an existing reservation.')
+class NewReservationForm(ReservationForm):
+    """Reservation form with optional weekly or daily repetition"""
+    repeat = forms.ChoiceField(
+        choices=[('', 'Does not repeat')] + ReservationSeries.FREQUENCY_CHOICES,
+        required=False
+    )
+    repeat_every = forms.IntegerField(min_value=1, initial=1, required=False, help_text="Days or weeks between reservations")
+    occurrences = forms.IntegerField(min_value=1, required=False, help_text="Number of reservations")
+    repeat_until = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+        help_text="Or the last day to book"
+    )
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('repeat') and not cleaned_data.get('occurrences') and not cleaned_data.get('repeat_until'):
+            raise forms.ValidationError("Give either a number of reservations or an end date for the repetition.")
         return cleaned_data
+
+    def series(self):
+        """An unsaved ReservationSeries when repetition was asked for, else None"""
+        if not self.cleaned_data.get('repeat'):
+            return None
+        reservation = self.instance
+        return ReservationSeries(
+            user=reservation.user,
+            room=reservation.room,
+            start_time=reservation.start_time,
+            end_time=reservation.end_time,
+            purpose=reservation.purpose,
+            frequency=self.cleaned_data['repeat'],
+            interval=self.cleaned_data.get('repeat_every') or 1,
+            count=self.cleaned_data.get('occurrences'),
+            until=self.cleaned_data.get('repeat_until'),
+        )
@@ -1,66 +1,291 @@
+import threading
+import time
+from urllib.parse import urljoin
+
+import httplib2
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from .metrics import InstrumentedCalendarAPI
+
+_client = None
+_client_lock = threading.Lock()
+
+# Google Calendar accepts at most 50 calls per batch request
+BATCH_SIZE = 50
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CalendarAPIError(Exception):
+    """Calendar call failed; status holds the HTTP status code when there is one"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def _error_status(error):
+    if isinstance(error, HttpError):
+        return error.resp.status
+    return None
+
+
+class BatchResult:
+    """Outcome of one operation in a batch: the event id on success, the error otherwise"""
+
+    def __init__(self, event_id=None, error=None):
+        self.event_id = event_id
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def status(self):
+        return getattr(self.error, 'status', None)
+
+    @property
+    def retryable(self):
+        return not self.ok and (self.status is None or self.status in RETRYABLE_STATUSES)
+
+
+class EventPage:
+    """One page of an events listing, plus the tokens for the next page or the next incremental listing"""
+
+    def __init__(self, events, next_page_token=None, next_sync_token=None):
+        self.events = events
+        self.next_page_token = next_page_token
+        self.next_sync_token = next_sync_token
+
+
+def event_body(summary, start_time, end_time, description=None, recurrence=None):
+    body = {
+        'summary': summary,
+        'description': description,
+        'start': {
+            'dateTime': start_time.isoformat(),
+            'timeZone': settings.TIME_ZONE,
+        },
+        'end': {
+            'dateTime': end_time.isoformat(),
+            'timeZone': settings.TIME_ZONE,
+        },
+    }
+    # RRULE lines; the timeZone above is what keeps occurrences at the same local time
+    if recurrence:
+        body['recurrence'] = recurrence
+    return body
+
+
+def run_batch(execute_chunk, operations, retries=2, backoff=0.5):
+    """Run operations in chunks of BATCH_SIZE, retrying only the items that failed transiently.
+
+    execute_chunk(operations, indexes, results) must store a BatchResult in
+    results[i] for every index it was given.
+    """
+    results = [None] * len(operations)
+    todo = list(range(len(operations)))
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * (2 ** (attempt - 1)))
+        for offset in range(0, len(todo), BATCH_SIZE):
+            execute_chunk(operations, todo[offset:offset + BATCH_SIZE], results)
+        todo = [i for i in todo if results[i].retryable]
+        if not todo:
+            break
+    return results
+
+
+def default_credentials():
+    """Service account credentials from settings; anonymous when there are none and a stub endpoint is set"""
+    if not settings.GOOGLE_CALENDAR_API_CREDENTIALS and getattr(settings, 'GOOGLE_CALENDAR_API_ENDPOINT', None):
+        return AnonymousCredentials()
+    return service_account.Credentials.from_service_account_info(
+        settings.GOOGLE_CALENDAR_API_CREDENTIALS,
+        scopes=['https://www.googleapis.com/auth/calendar']
+    )
+
+
+def get_calendar_api():
+    """Process-wide calendar client configured by settings.CALENDAR_BACKEND, built on first use.
+
+    Calls through it are timed as external calls (see metrics.py).
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = InstrumentedCalendarAPI(import_string(settings.CALENDAR_BACKEND)())
+    return _client
+
+
+def reset_calendar_api():
+    """Drop the cached client so the next call rebuilds it"""
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def _reset_on_setting_change(setting, **kwargs):
+    if setting.startswith('CALENDAR_') or setting.startswith('GOOGLE_CALENDAR_'):
+        reset_calendar_api()
+
+
+setting_changed.connect(_reset_on_setting_change)
+
 
 class GoogleCalendarAPI:
-    def __init__(self):
-        credentials = service_account.Credentials.from_service_account_info(
-            settings.GOOGLE_CALENDAR_API_CREDENTIALS,
-            scopes=['https://www.googleapis.com/auth/calendar']
+    """Google Calendar client that is safe to share between threads.
+
+    Credentials and the service object are built once; the discovery document comes
+    from the copy bundled with google-api-python-client instead of the network.
+    httplib2 connections are not thread-safe, so each thread gets its own
+    keep-alive connection pool wrapped with the shared credentials, which only
+    fetch a new OAuth token when the current one has expired.
+    """
+
+    def __init__(self, credentials=None, api_endpoint=None):
+        if credentials is None:
+            credentials = default_credentials()
+        self.credentials = credentials
+        api_endpoint = api_endpoint or getattr(settings, 'GOOGLE_CALENDAR_API_ENDPOINT', None)
+        self.service = build(
+            'calendar', 'v3',
+            credentials=credentials,
+            static_discovery=True,
+            cache_discovery=False,
+            client_options={'api_endpoint': api_endpoint} if api_endpoint else None,
         )
-        self.service = build('calendar', 'v3', credentials=credentials)
-
-    def create_event(self, calendar_id, summary, start_time, end_time, description=None):
-        event = {
-            'summary': summary,
-            'description': description,
-            'start': {
-                'dateTime': start_time.isoformat(),
-                'timeZone': settings.TIME_ZONE,
-            },
-            'end': {
-                'dateTime': end_time.isoformat(),
-                'timeZone': settings.TIME_ZONE,
-            },
-        }
+        # new_batch_http_request() always targets the discovery rootUrl, so follow an overridden endpoint by hand
+        self._batch_uri = urljoin(api_endpoint, '/batch/calendar/v3') if api_endpoint else None
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = AuthorizedHttp(
+                self.credentials,
+                http=httplib2.Http(timeout=getattr(settings, 'GOOGLE_CALENDAR_HTTP_TIMEOUT', 10))
+            )
+            self._local.http = http
+        return http
+
+    def create_event(self, calendar_id, summary, start_time, end_time, description=None, event_id=None):
+        event = event_body(summary, start_time, end_time, description)
+        # A client supplied id makes retried inserts idempotent (the retry gets a 409)
+        if event_id:
+            event['id'] = event_id
 
         try:
             event = self.service.events().insert(
                 calendarId=calendar_id,
                 body=event
-            ).execute()
+            ).execute(http=self._http())
             return event['id']
         except Exception as e:
-            raise Exception(f"Failed to create Google Calendar event: {str(e)}")
+            raise CalendarAPIError(f"Failed to create Google Calendar event: {str(e)}", _error_status(e))
 
     def update_event(self, calendar_id, event_id, summary, start_time, end_time, description=None):
-        event = {
-            'summary': summary,
-            'description': description,
-            'start': {
-                'dateTime': start_time.isoformat(),
-                'timeZone': settings.TIME_ZONE,
-            },
-            'end': {
-                'dateTime': end_time.isoformat(),
-                'timeZone': settings.TIME_ZONE,
-            },
-        }
+        event = event_body(summary, start_time, end_time, description)
 
         try:
             self.service.events().update(
                 calendarId=calendar_id,
                 eventId=event_id,
                 body=event
-            ).execute()
+            ).execute(http=self._http())
         except Exception as e:
-            raise Exception(f"Failed to update Google Calendar event: {str(e)}")
+            raise CalendarAPIError(f"Failed to update Google Calendar event: {str(e)}", _error_status(e))
 
     def delete_event(self, calendar_id, event_id):
         try:
             self.service.events().delete(
                 calendarId=calendar_id,
                 eventId=event_id
-            ).execute()
+            ).execute(http=self._http())
+        except Exception as e:
+            raise CalendarAPIError(f"Failed to delete Google Calendar event: {str(e)}", _error_status(e))
+
+    def list_events(self, calendar_id, sync_token=None, updated_min=None, page_token=None, page_size=250):
+        """One page of a calendar's events, removed ones included with status 'cancelled'.
+
+        With sync_token (the next_sync_token of an earlier complete listing) only
+        events changed since are listed; a 410 status means the token expired and
+        a full listing is needed. updated_min lists events changed after a time.
+        Recurring events come back as one event, not expanded into occurrences.
+        """
+        params = {'calendarId': calendar_id, 'showDeleted': True, 'maxResults': page_size}
+        if sync_token:
+            params['syncToken'] = sync_token
+        elif updated_min:
+            params['updatedMin'] = updated_min.isoformat()
+        if page_token:
+            params['pageToken'] = page_token
+
+        try:
+            response = self.service.events().list(**params).execute(http=self._http())
+        except Exception as e:
+            raise CalendarAPIError(f"Failed to list Google Calendar events: {str(e)}", _error_status(e))
+        return EventPage(response.get('items', []), response.get('nextPageToken'), response.get('nextSyncToken'))
+
+    def batch(self, operations, retries=2):
+        """Apply many inserts, updates and deletes using HTTP batch requests.
+
+        Each operation is a dict with 'action' ('create', 'update' or 'delete'),
+        'calendar_id' and 'event_id', plus 'summary', 'start_time', 'end_time',
+        'description' and optionally 'recurrence' for creates and updates. Returns one BatchResult per
+        operation, in order; only items that failed with a transient error are
+        sent again.
+        """
+        return run_batch(self._execute_chunk, operations, retries=retries)
+
+    def _build_request(self, operation):
+        events = self.service.events()
+        if operation['action'] == 'delete':
+            return events.delete(calendarId=operation['calendar_id'], eventId=operation['event_id'])
+
+        event = event_body(
+            operation['summary'],
+            operation['start_time'],
+            operation['end_time'],
+            operation.get('description'),
+            operation.get('recurrence')
+        )
+        if operation['action'] == 'update':
+            return events.update(calendarId=operation['calendar_id'], eventId=operation['event_id'], body=event)
+        if operation.get('event_id'):
+            event['id'] = operation['event_id']
+        return events.insert(calendarId=operation['calendar_id'], body=event)
+
+    def _execute_chunk(self, operations, indexes, results):
+        def callback(request_id, response, exception):
+            i = int(request_id)
+            if exception is not None:
+                message = f"Failed to {operations[i]['action']} Google Calendar event: {str(exception)}"
+                results[i] = BatchResult(error=CalendarAPIError(message, _error_status(exception)))
+            else:
+                results[i] = BatchResult(event_id=(response or {}).get('id', operations[i].get('event_id')))
+
+        if self._batch_uri:
+            batch = BatchHttpRequest(callback=callback, batch_uri=self._batch_uri)
+        else:
+            batch = self.service.new_batch_http_request(callback=callback)
+        for i in indexes:
+            results[i] = None
+            batch.add(self._build_request(operations[i]), request_id=str(i))
+
+        try:
+            batch.execute(http=self._http())
         except Exception as e:
-            raise Exception(f"Failed to delete Google Calendar event: {str(e)}")
\ No newline at end of file
+            # The whole batch failed; every item that did not get an answer is retryable
+            for i in indexes:
+                if results[i] is None:
+                    results[i] = BatchResult(error=CalendarAPIError(f"Calendar batch request failed: {str(e)}", _error_status(e)))
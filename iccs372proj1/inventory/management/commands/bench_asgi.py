@@ -0,0 +1,138 @@
+import asyncio
+import os
+import random
+import time
+from datetime import timedelta
+from itertools import count
+
+import httpx
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from inventory.bench import format_summary, gunicorn_server, isolated_database, summarize
+from inventory.calendar_stub import start_stub_server
+from inventory.models import InventoryItem, Reservation
+from inventory.rooms import lab_rooms
+
+WORDS = ['beaker', 'pipette', 'flask', 'burette', 'centrifuge', 'microscope', 'cuvette', 'spatula']
+# Shared by the cookie and the header; any 32 letters and digits make a valid CSRF secret
+CSRF_TOKEN = 'benchbenchbenchbenchbenchbench00'
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the app with gunicorn in WSGI and in ASGI mode against a slow stub calendar, "
+        "and compare requests per second and tail latency of the reservation, feed and search endpoints"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', default=['wsgi', 'asgi'], choices=['wsgi', 'asgi'])
+        parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes per mode")
+        parser.add_argument('--clients', type=int, default=32, help="Concurrent client connections")
+        parser.add_argument('--duration', type=float, default=15, help="Seconds of load per mode")
+        parser.add_argument('--calendar-latency', type=float, default=0.5, help="Seconds the stub calendar takes per call")
+        parser.add_argument('--database', default='bench_asgi.sqlite3', help="SQLite file for the throwaway database")
+
+    def handle(self, *args, **options):
+        server, endpoint = start_stub_server(latency=options['calendar_latency'])
+        with isolated_database(options['database']):
+            user = User.objects.create_user('bench', password='bench')
+            InventoryItem.objects.bulk_create([
+                InventoryItem(name=f"{random.choice(WORDS)} {random.choice(WORDS)} {n}", quantity=1, user=user)
+                for n in range(2000)
+            ])
+            rooms = [room.key for room in lab_rooms.all()]
+            origin = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+            reservations = Reservation.objects.bulk_create([
+                Reservation(
+                    user=user, room=lab_rooms.get(rooms[n % len(rooms)]), purpose='seed', status='confirmed',
+                    start_time=origin + timedelta(hours=2 * n), end_time=origin + timedelta(hours=2 * n + 1),
+                )
+                for n in range(200)
+            ])
+            client = Client()
+            client.force_login(user)
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+            database = connection.settings_dict['NAME']
+            # Runs start after the seeded reservations so that new bookings never conflict
+            slots = count(400)
+            plan = {
+                'reservation_ids': [r.pk for r in reservations],
+                'rooms': rooms,
+                'origin': origin,
+                'slots': slots,
+            }
+            results = {}
+            for mode in options['modes']:
+                results[mode] = self.run_mode(mode, database, endpoint, session, plan, options)
+        server.shutdown()
+
+        for mode, (samples, errors, wall) in results.items():
+            total = sum(len(latencies) for latencies in samples.values())
+            self.stdout.write(f"\n{mode}: {total / wall:.1f} requests/s, {errors} errors in {wall:.1f}s")
+            self.stdout.write(format_summary("  all requests       ", summarize(sum(samples.values(), []))))
+            for name, latencies in samples.items():
+                self.stdout.write(format_summary(f"  {name:<19}", summarize(latencies)))
+
+    def run_mode(self, mode, database, endpoint, session, plan, options):
+        env = dict(
+            SERVER_MODE=mode,
+            DATABASE_URL=f'sqlite:///{os.path.abspath(database)}',
+            GOOGLE_CALENDAR_API_ENDPOINT=endpoint,
+            GOOGLE_CALENDAR_CREDENTIALS='{}',
+            CALENDAR_BACKEND='inventory.google_calendar.GoogleCalendarAPI',
+            # Refresh remote events on every feed request, so the slow calendar is always in play
+            ROOM_EVENTS_REMOTE_TTL='0',
+        )
+        with gunicorn_server(env, workers=options['workers']) as base_url:
+            self.stdout.write(f"{mode}: serving on {base_url} with {options['workers']} workers")
+            return asyncio.run(self.load(base_url, session, plan, options))
+
+    async def load(self, base_url, session, plan, options):
+        samples = {'create reservation': [], 'update form': [], 'room events': [], 'search suggestions': []}
+        errors = 0
+        deadline = time.perf_counter() + options['duration']
+
+        def request(kind):
+            if kind == 'create reservation':
+                start = timezone.localtime(plan['origin'] + timedelta(hours=2 * next(plan['slots'])))
+                return 'POST', reverse('create-reservation', args=[random.choice(plan['rooms'])]), {
+                    'start_time': start.strftime('%Y-%m-%dT%H:%M'),
+                    'end_time': (start + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M'),
+                    'purpose': 'bench',
+                }
+            if kind == 'update form':
+                return 'GET', reverse('update_reservation', args=[random.choice(plan['reservation_ids'])]), None
+            if kind == 'room events':
+                return 'GET', reverse('room-events', args=[random.choice(plan['rooms'])]), None
+            return 'GET', reverse('search_suggestions') + f"?q={random.choice(WORDS)[:3]}", None
+
+        async def worker(http):
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                kind = random.choices(list(samples), weights=[2, 1, 4, 3])[0]
+                method, url, data = request(kind)
+                began = time.perf_counter()
+                try:
+                    response = await http.request(method, url, data=data)
+                    failed = response.status_code >= 400 or (method == 'POST' and response.status_code != 302)
+                except httpx.HTTPError:
+                    failed = True
+                samples[kind].append(time.perf_counter() - began)
+                errors += failed
+
+        cookies = {settings.SESSION_COOKIE_NAME: session, settings.CSRF_COOKIE_NAME: CSRF_TOKEN}
+        limits = httpx.Limits(max_connections=options['clients'])
+        async with httpx.AsyncClient(
+            base_url=base_url, cookies=cookies, headers={'X-CSRFToken': CSRF_TOKEN}, limits=limits, timeout=60
+        ) as http:
+            began = time.perf_counter()
+            await asyncio.gather(*(worker(http) for _ in range(options['clients'])))
+            wall = time.perf_counter() - began
+        return samples, errors, wall
@@ -0,0 +1,108 @@
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.utils import timezone
+
+from inventory.bench import format_summary, isolated_database, summarize
+from inventory.models import Reservation
+from inventory.rooms import lab_rooms
+
+
+class Command(BaseCommand):
+    help = "Hammer reservation booking from concurrent threads on top of a large reservation table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--existing', type=int, default=100_000, help="Reservations to seed first")
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=200, help="Booking attempts per thread")
+        parser.add_argument('--database', default='bench_booking.sqlite3', help="SQLite file for the throwaway database")
+
+    def handle(self, *args, **options):
+        with isolated_database(options['database']):
+            rooms = [room.pk for room in lab_rooms.all()]
+            user = User.objects.create_user('bench', password='bench')
+            origin = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+            per_room = options['existing'] // len(rooms)
+
+            # Seed hour-long bookings every 90 minutes; the 30 minute gaps stay free
+            seeded = [
+                Reservation(
+                    user=user,
+                    room_id=room_id,
+                    start_time=origin + timedelta(minutes=90 * slot),
+                    end_time=origin + timedelta(minutes=90 * slot + 60),
+                    purpose='seed',
+                    status='confirmed',
+                )
+                for room_id in rooms
+                for slot in range(per_room)
+            ]
+            Reservation.objects.bulk_create(seeded, batch_size=5000)
+            self.stdout.write(f"Seeded {len(seeded)} reservations")
+
+            latencies = []
+            outcomes = {'booked': 0, 'conflict': 0, 'locked': 0}
+            lock = threading.Lock()
+            # Book in a narrow window so threads actually race for the same free gaps
+            window = min(per_room, 50)
+
+            def worker():
+                for _ in range(options['attempts']):
+                    slot = random.randrange(window)
+                    start = origin + timedelta(minutes=90 * slot + random.choice([0, 60, 65]))
+                    reservation = Reservation(
+                        user=user,
+                        room_id=random.choice(rooms),
+                        start_time=start,
+                        end_time=start + timedelta(minutes=25),
+                        purpose='bench',
+                        status='confirmed',
+                    )
+                    began = time.perf_counter()
+                    try:
+                        reservation.full_clean()
+                        reservation.save()
+                        outcome = 'booked'
+                    except ValidationError:
+                        outcome = 'conflict'
+                    except OperationalError:
+                        outcome = 'locked'
+                    elapsed = time.perf_counter() - began
+                    with lock:
+                        latencies.append(elapsed)
+                        outcomes[outcome] += 1
+                connection.close()
+
+            threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            began = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - began
+
+            double_booked = self.count_overlaps(rooms)
+
+        self.stdout.write(format_summary("booking attempt", summarize(latencies)))
+        self.stdout.write(
+            f"{outcomes['booked']} booked, {outcomes['conflict']} rejected as conflicts, "
+            f"{outcomes['locked']} failed on database locks in {wall:.2f}s"
+        )
+        self.stdout.write(f"overlapping confirmed reservations: {double_booked}")
+
+    def count_overlaps(self, rooms):
+        overlaps = 0
+        for room_id in rooms:
+            previous_end = None
+            rows = Reservation.objects.confirmed().filter(room_id=room_id).order_by('start_time')
+            for start, end in rows.values_list('start_time', 'end_time').iterator():
+                if previous_end and start < previous_end:
+                    overlaps += 1
+                previous_end = max(previous_end, end) if previous_end else end
+        return overlaps
@@ -0,0 +1,40 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from google.auth.credentials import AnonymousCredentials
+
+from inventory.bench import format_summary, summarize
+from inventory.calendar_stub import start_stub_server
+from inventory.google_calendar import GoogleCalendarAPI
+
+
+class Command(BaseCommand):
+    help = "Measure per-call overhead of a fresh GoogleCalendarAPI against a reused one, using a local stub server"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200)
+
+    def handle(self, *args, **options):
+        server, endpoint = start_stub_server()
+        start = timezone.now()
+        end = start + timedelta(hours=1)
+
+        def run(make_client):
+            samples = []
+            for _ in range(options['count']):
+                began = time.perf_counter()
+                make_client().create_event('room1@stub', 'Benchmark', start, end, 'bench')
+                samples.append(time.perf_counter() - began)
+            return samples
+
+        # Before: every call site built its own client (credentials, discovery, connection)
+        fresh = run(lambda: GoogleCalendarAPI(credentials=AnonymousCredentials(), api_endpoint=endpoint))
+
+        shared = GoogleCalendarAPI(credentials=AnonymousCredentials(), api_endpoint=endpoint)
+        reused = run(lambda: shared)
+        server.shutdown()
+
+        self.stdout.write(format_summary("new client per call", summarize(fresh)))
+        self.stdout.write(format_summary("shared client      ", summarize(reused)))
@@ -0,0 +1,72 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from inventory.bench import format_summary, isolated_database, summarize
+from inventory.models import Category, InventoryItem
+from inventory.pagination import ORDERINGS, encode_cursor
+
+WORDS = ['beaker', 'pipette', 'flask', 'burette', 'centrifuge', 'microscope', 'cuvette', 'spatula']
+
+
+class Command(BaseCommand):
+    help = "Dashboard page latency (first and deep pages, every ordering) as the inventory grows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000,10000,100000', help="Comma separated item counts, e.g. 1000,1000000")
+        parser.add_argument('--requests', type=int, default=30, help="Requests per page type")
+        parser.add_argument('--cold', action='store_true', help="Clear the cache before every request")
+
+    def handle(self, *args, **options):
+        for scale in [int(n) for n in options['scales'].split(',')]:
+            with isolated_database():
+                self.seed(scale)
+                client = Client()
+                client.force_login(User.objects.get(username='bench'))
+                self.stdout.write(f"--- {scale} items")
+                for ordering_key, fields in ORDERINGS.items():
+                    names = [field.lstrip('-') for field in fields]
+                    # Cursor pointing 90% of the way through this ordering
+                    deep_row = InventoryItem.objects.order_by(*fields).values_list(*names)[scale * 9 // 10]
+                    deep = encode_cursor(ordering_key, list(deep_row))
+                    for label, params in (('first page', {}), ('deep page ', {'after': deep})):
+                        params['quantity_filter'] = ordering_key
+                        samples = []
+                        for _ in range(options['requests']):
+                            if options['cold']:
+                                cache.clear()
+                            began = time.perf_counter()
+                            response = client.get(reverse('dashboard'), params)
+                            samples.append(time.perf_counter() - began)
+                            assert response.status_code == 200
+                        self.stdout.write(format_summary(f"{ordering_key or 'id':>11} {label}", summarize(samples)))
+
+                for query in ('flask', 'micro', f'cuvette {scale // 2:07d}'):
+                    samples = []
+                    for _ in range(options['requests']):
+                        if options['cold']:
+                            cache.clear()
+                        began = time.perf_counter()
+                        client.get(reverse('dashboard'), {'q': query})
+                        samples.append(time.perf_counter() - began)
+                    self.stdout.write(format_summary(f"search {query!r}", summarize(samples)))
+
+    def seed(self, scale):
+        user = User.objects.create_user('bench', password='bench')
+        categories = Category.objects.bulk_create([Category(name=f'Category {n}') for n in range(20)])
+        batch = []
+        for n in range(scale):
+            batch.append(InventoryItem(
+                name=f'{WORDS[n % len(WORDS)]} {n:07d}',
+                quantity=(n * 7919) % 500,
+                category=categories[n % len(categories)],
+                user=user,
+            ))
+            if len(batch) == 10000:
+                InventoryItem.objects.bulk_create(batch)
+                batch = []
+        InventoryItem.objects.bulk_create(batch)
@@ -0,0 +1,120 @@
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection
+from django.utils import timezone
+
+from iccs372proj1.database import sqlite_options
+from inventory.bench import format_summary, isolated_database, summarize
+from inventory.models import InventoryItem, Reservation
+from inventory.rooms import lab_rooms
+from inventory.stock import check_out
+
+# Connection settings compared: what every deployment ran with before, and the tuned profile
+PROFILES = {
+    'default': lambda: {'OPTIONS': {}, 'CONN_MAX_AGE': 0},
+    'tuned': lambda: {'OPTIONS': sqlite_options(settings.DB_BUSY_TIMEOUT), 'CONN_MAX_AGE': 60},
+}
+OPERATIONS = ['book room', 'check out', 'read items']
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent bookings, stock check-outs and item reads against an on-disk SQLite database "
+        "with the old and the tuned connection profile, and compare throughput, latency and lock errors"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=list(PROFILES))
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--operations', type=int, default=300, help="Operations per thread")
+        parser.add_argument('--database', default='bench_db_writes.sqlite3', help="SQLite file for the throwaway database")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("bench_db_writes compares SQLite profiles; run it with a sqlite DATABASE_URL")
+
+        original = {key: connection.settings_dict[key] for key in ('OPTIONS', 'CONN_MAX_AGE')}
+        results = {}
+        try:
+            for profile in options['profiles']:
+                connection.close()
+                connection.settings_dict.update(PROFILES[profile]())
+                results[profile] = self.run_profile(options)
+        finally:
+            connection.close()
+            connection.settings_dict.update(original)
+
+        for profile, (latencies, outcomes, wall) in results.items():
+            total = sum(len(samples) for samples in latencies.values())
+            self.stdout.write(
+                f"\n{profile}: {total / wall:.1f} operations/s, {outcomes['booked']} booked, "
+                f"{outcomes['conflict']} conflicts, {outcomes['locked']} failed on database locks in {wall:.2f}s"
+            )
+            for kind, samples in latencies.items():
+                self.stdout.write(format_summary(f"  {kind:<10}", summarize(samples)))
+
+    def run_profile(self, options):
+        with isolated_database(options['database']):
+            user = User.objects.create_user('bench', password='bench')
+            rooms = [room.pk for room in lab_rooms.all()]
+            items = [
+                item.pk for item in InventoryItem.objects.bulk_create([
+                    InventoryItem(name=f"bench item {n}", quantity=1_000_000, user=user) for n in range(200)
+                ])
+            ]
+            origin = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+            latencies = {kind: [] for kind in OPERATIONS}
+            outcomes = {'booked': 0, 'conflict': 0, 'locked': 0}
+            lock = threading.Lock()
+
+            def operate(kind):
+                if kind == 'book room':
+                    start = origin + timedelta(hours=random.randrange(5000))
+                    reservation = Reservation(
+                        user=user, room_id=random.choice(rooms), purpose='bench', status='confirmed',
+                        start_time=start, end_time=start + timedelta(minutes=50),
+                    )
+                    reservation.full_clean()
+                    reservation.save()
+                    return 'booked'
+                if kind == 'check out':
+                    check_out(random.choice(items), 1, user=user)
+                    return None
+                list(InventoryItem.objects.select_related('category').order_by('-last_updated')[:50])
+                return None
+
+            def worker():
+                for _ in range(options['operations']):
+                    kind = random.choices(OPERATIONS, weights=[2, 3, 5])[0]
+                    began = time.perf_counter()
+                    try:
+                        outcome = operate(kind)
+                    except ValidationError:
+                        outcome = 'conflict'
+                    except OperationalError:
+                        outcome = 'locked'
+                    elapsed = time.perf_counter() - began
+                    with lock:
+                        latencies[kind].append(elapsed)
+                        if outcome:
+                            outcomes[outcome] += 1
+                    # Each operation stands for a request; the request_finished handler does the same
+                    close_old_connections()
+                connection.close()
+
+            threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            began = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - began
+        return latencies, outcomes, wall
@@ -0,0 +1,140 @@
+import os
+import re
+import time
+from datetime import timedelta
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from inventory.bench import format_summary, gunicorn_server, isolated_database, summarize
+from inventory.models import InventoryItem, Reservation
+from inventory.rooms import lab_rooms
+
+# (label, route, needs a login)
+PAGES = [
+    ('index', 'index', False),
+    ('login', 'login', False),
+    ('dashboard', 'dashboard', True),
+    ('room calendar', 'room-calendar', True),
+    ('my reservations', 'reservation_list', True),
+]
+CSS_URL = re.compile(r'url\(["\']?([^"\')]+)["\']?\)')
+
+
+class AssetLinks(HTMLParser):
+    """Stylesheets and scripts a page loads"""
+
+    def __init__(self):
+        super().__init__()
+        self.urls = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'link' and attrs.get('rel') == 'stylesheet' and attrs.get('href'):
+            self.urls.append(attrs['href'])
+        elif tag == 'script' and attrs.get('src'):
+            self.urls.append(attrs['src'])
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the app with gunicorn after collectstatic and measure, for each page, the time to the "
+        "first byte and how many bytes a first and a repeat visit download"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=50, help="Requests per page for the first-byte timing")
+        parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+        parser.add_argument('--database', default='bench_pages.sqlite3', help="SQLite file for the throwaway database")
+
+    def handle(self, *args, **options):
+        with isolated_database(options['database']):
+            env = {
+                'DATABASE_URL': f"sqlite:///{os.path.abspath(connection.settings_dict['NAME'])}",
+                'CALENDAR_BACKEND': 'inventory.fake_calendar.FakeCalendarAPI',
+            }
+            session = self.seed()
+            with gunicorn_server(env, workers=options['workers']) as base_url:
+                results = [self.measure(base_url, session, page, options) for page in PAGES]
+
+        self.stdout.write(
+            f"\n{'page':<16} {'html':>8} {'assets':>7} {'first visit':>12} {'repeat visit':>13} {'third-party':>12}"
+        )
+        for label, weight, _ in results:
+            self.stdout.write(
+                f"{label:<16} {weight['html'] / 1024:7.1f}K {weight['assets']:7} {weight['first'] / 1024:11.1f}K "
+                f"{weight['repeat'] / 1024:12.1f}K {weight['third_party']:12}"
+            )
+        self.stdout.write("\nTime to first byte of the HTML:")
+        for label, _, first_bytes in results:
+            self.stdout.write(format_summary(f"  {label:<16}", summarize(first_bytes)))
+
+    def seed(self):
+        """Seed a user with items and reservations; returns a session cookie value for them"""
+        user = User.objects.create_user('bench', password='bench')
+        InventoryItem.objects.bulk_create([
+            InventoryItem(name=f"bench item {n}", quantity=n % 20, user=user) for n in range(500)
+        ])
+        origin = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        rooms = lab_rooms.all()
+        Reservation.objects.bulk_create([
+            Reservation(
+                user=user, room=rooms[n % len(rooms)], purpose='seed', status='confirmed',
+                start_time=origin + timedelta(hours=2 * n), end_time=origin + timedelta(hours=2 * n + 1),
+            )
+            for n in range(50)
+        ])
+        client = Client()
+        client.force_login(user)
+        return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def measure(self, base_url, session, page, options):
+        label, route, needs_login = page
+        cookies = {settings.SESSION_COOKIE_NAME: session} if needs_login else {}
+        headers = {'Accept-Encoding': 'br, gzip'}
+        with httpx.Client(base_url=base_url, cookies=cookies, headers=headers, timeout=30) as http:
+            first_bytes = []
+            for _ in range(options['rounds']):
+                began = time.perf_counter()
+                with http.stream('GET', reverse(route)) as response:
+                    chunks = response.iter_bytes()
+                    first = next(chunks, b'')
+                    first_bytes.append(time.perf_counter() - began)
+                    html = first + b''.join(chunks)
+
+            links = AssetLinks()
+            links.feed(html.decode())
+            weight = {'html': len(html), 'assets': 0, 'first': len(html), 'repeat': len(html), 'third_party': 0}
+            pending = [urljoin(base_url + reverse(route), url) for url in links.urls]
+            seen = set()
+            while pending:
+                url = pending.pop()
+                if url in seen:
+                    continue
+                seen.add(url)
+                if urlsplit(url).netloc != urlsplit(base_url).netloc:
+                    # Costs a DNS lookup and a TLS handshake with another host; not fetched here
+                    weight['third_party'] += 1
+                    continue
+                with http.stream('GET', url) as response:
+                    # Compressed bytes, as they travel
+                    transferred = sum(len(chunk) for chunk in response.iter_raw())
+                weight['assets'] += 1
+                weight['first'] += transferred
+                if 'immutable' not in response.headers.get('Cache-Control', ''):
+                    # Asked for again on the next visit, or at least revalidated
+                    weight['repeat'] += transferred
+                if urlsplit(url).path.endswith('.css'):
+                    # Fonts and images the stylesheet pulls in
+                    for reference in CSS_URL.findall(http.get(url).text):
+                        if not reference.startswith('data:'):
+                            pending.append(urljoin(url, reference))
+        return label, weight, first_bytes
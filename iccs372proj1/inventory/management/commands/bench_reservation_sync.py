@@ -0,0 +1,68 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+
+from inventory.bench import format_summary, isolated_database, summarize
+from inventory.calendar_sync import apply_task, drain_outbox
+from inventory.fake_calendar import FakeCalendarAPI
+from inventory.models import CalendarSyncTask, LabRoom, Reservation
+
+
+class Command(BaseCommand):
+    help = "Compare reservation save latency with inline calendar sync against the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.15, help="Simulated calendar round trip in seconds")
+
+    def handle(self, *args, **options):
+        with override_settings(FAKE_CALENDAR_LATENCY=options['latency']), isolated_database():
+            FakeCalendarAPI.reset()
+            api = FakeCalendarAPI()
+            user = User.objects.create_user('bench', password='bench')
+            room = LabRoom.objects.get(key='room1')
+            start = timezone.now() + timedelta(days=1)
+
+            def book(i):
+                return Reservation(
+                    user=user,
+                    room=room,
+                    start_time=start + timedelta(hours=i),
+                    end_time=start + timedelta(hours=i, minutes=30),
+                    purpose='benchmark',
+                    status='confirmed',
+                )
+
+            # Before: the calendar insert happened inside the request
+            inline = []
+            for i in range(options['count']):
+                began = time.perf_counter()
+                reservation = book(i)
+                reservation.save()
+                apply_task(api, reservation.sync_tasks.get())
+                inline.append(time.perf_counter() - began)
+            CalendarSyncTask.objects.update(status=CalendarSyncTask.DONE)
+
+            # After: the request only writes the reservation and its outbox row
+            outbox = []
+            for i in range(options['count'], options['count'] * 2):
+                began = time.perf_counter()
+                book(i).save()
+                outbox.append(time.perf_counter() - began)
+
+            began = time.perf_counter()
+            sent = 0
+            while True:
+                batch, _ = drain_outbox(api)
+                if not batch:
+                    break
+                sent += batch
+            drained = time.perf_counter() - began
+
+        self.stdout.write(format_summary("inline sync per request", summarize(inline)))
+        self.stdout.write(format_summary("outbox per request     ", summarize(outbox)))
+        self.stdout.write(f"worker drained {sent} task(s) in {drained:.2f}s")
@@ -0,0 +1,85 @@
+import random
+import string
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from inventory.bench import format_summary, isolated_database, summarize
+from inventory.models import InventoryItem
+from inventory.suggest import suggestion_index
+
+WORDS = ['beaker', 'pipette', 'flask', 'burette', 'centrifuge', 'microscope', 'cuvette', 'spatula',
+         'funnel', 'thermometer', 'crucible', 'desiccator', 'petri', 'dish', 'glove', 'goggles']
+
+
+class Command(BaseCommand):
+    help = "Load-test the search_suggestions endpoint and compare the index with the old icontains query"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100_000)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=4)
+
+    def handle(self, *args, **options):
+        with isolated_database('bench_suggestions.sqlite3'):
+            user = User.objects.create_user('bench', password='bench')
+            InventoryItem.objects.bulk_create([
+                InventoryItem(name=f"{random.choice(WORDS)} {random.choice(WORDS)} {n}", quantity=1, user=user)
+                for n in range(options['items'])
+            ], batch_size=10000)
+            suggestion_index.invalidate()
+
+            queries = [self.keystrokes() for _ in range(options['requests'])]
+
+            began = time.perf_counter()
+            suggestion_index.search('warm', user.id)
+            self.stdout.write(f"index build: {time.perf_counter() - began:.2f}s")
+
+            old, new = [], []
+            for query in queries[:200]:
+                began = time.perf_counter()
+                list(InventoryItem.objects.filter(name__icontains=query, user=user).values('name')[:5])
+                old.append(time.perf_counter() - began)
+                began = time.perf_counter()
+                suggestion_index.search(query, user.id)
+                new.append(time.perf_counter() - began)
+            self.stdout.write(format_summary("icontains query", summarize(old)))
+            self.stdout.write(format_summary("index lookup   ", summarize(new)))
+
+            samples = []
+            lock = threading.Lock()
+
+            def worker(chunk):
+                client = Client()
+                client.force_login(user)
+                for query in chunk:
+                    began = time.perf_counter()
+                    client.get(reverse('search_suggestions'), {'q': query})
+                    with lock:
+                        samples.append(time.perf_counter() - began)
+                connection.close()
+
+            threads = [threading.Thread(target=worker, args=(queries[i::options['threads']],))
+                       for i in range(options['threads'])]
+            began = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - began
+            self.stdout.write(format_summary("endpoint       ", summarize(samples)))
+            self.stdout.write(f"{len(samples) / wall:.0f} requests/s with {options['threads']} threads")
+
+    def keystrokes(self):
+        word = random.choice(WORDS)
+        prefix = word[:random.randint(1, len(word))]
+        # Every fifth query has a typo
+        if len(prefix) > 3 and random.random() < 0.2:
+            i = random.randrange(len(prefix))
+            prefix = prefix[:i] + random.choice(string.ascii_lowercase) + prefix[i + 1:]
+        return prefix
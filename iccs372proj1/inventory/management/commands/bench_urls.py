@@ -0,0 +1,368 @@
+import io
+import json
+import platform
+import random
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+from itertools import count
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from inventory.availability import refresh_spans
+from inventory.bench import isolated_database, regressions, summarize
+from inventory.fake_calendar import FakeCalendarAPI
+from inventory.models import Category, InventoryItem, Reservation
+from inventory.rooms import lab_rooms
+from inventory.suggest import suggestion_index
+
+WORDS = ['beaker', 'pipette', 'flask', 'burette', 'centrifuge', 'microscope', 'cuvette', 'spatula']
+
+# Synthetic data per scale
+SCALES = {
+    'small': {'users': 5, 'categories': 10, 'items': 1_000, 'reservations': 500},
+    'medium': {'users': 50, 'categories': 50, 'items': 20_000, 'reservations': 10_000},
+    'large': {'users': 200, 'categories': 200, 'items': 200_000, 'reservations': 100_000},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every route in inventory/urls.py from concurrent clients on seeded data and report latency "
+        "percentiles, queries and memory per route; save the results as a JSON baseline or compare with one"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='small', help=f"Comma separated, from {', '.join(SCALES)}")
+        parser.add_argument('--clients', type=int, default=4, help="Concurrent clients (threads)")
+        parser.add_argument('--rounds', type=int, default=20, help="Requests per route per client")
+        parser.add_argument('--save', help="Write the results to this JSON file")
+        parser.add_argument('--compare', help="Baseline JSON file; fail if a route got slower or runs more queries")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p95 growth over the baseline (0.2 = 20%%)")
+        parser.add_argument('--database', default='bench_urls.sqlite3', help="SQLite file for the throwaway database")
+
+    def handle(self, *args, **options):
+        scales = options['scales'].split(',')
+        unknown = set(scales) - set(SCALES)
+        if unknown:
+            raise CommandError(f"Unknown scale(s): {', '.join(sorted(unknown))}")
+        baseline = self.load_baseline(options['compare']) if options['compare'] else None
+        self.check_coverage()
+
+        results = {
+            'created': timezone.now().isoformat(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'clients': options['clients'],
+            'rounds': options['rounds'],
+            'scales': {},
+        }
+        # Reservations sync to the in-memory calendar; nothing leaves the machine
+        with override_settings(CALENDAR_BACKEND='inventory.fake_calendar.FakeCalendarAPI'):
+            for scale in scales:
+                results['scales'][scale] = self.run_scale(scale, options)
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Saved results to {options['save']}")
+        if baseline is not None:
+            found = regressions(baseline, results, tolerance=options['tolerance'])
+            for line in found:
+                self.stderr.write(f"REGRESSION {line}")
+            if found:
+                raise CommandError(f"{len(found)} regression(s) against {options['compare']}")
+            self.stdout.write(f"No regressions against {options['compare']}")
+
+    def load_baseline(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read baseline {path}: {e}")
+
+    def check_coverage(self):
+        """Every named route of the app must have a scenario, so new views can't go unmeasured"""
+        named = {pattern.name for pattern in get_resolver('inventory.urls').url_patterns if pattern.name}
+        missing = named - {route for route, _, _, _ in self.scenarios(None)}
+        if missing:
+            raise CommandError(f"No benchmark scenario for: {', '.join(sorted(missing))}")
+
+    def run_scale(self, scale, options):
+        sizes = SCALES[scale]
+        with isolated_database(options['database']):
+            cache.clear()
+            FakeCalendarAPI.reset()
+            suggestion_index.invalidate()
+            began = time.perf_counter()
+            users = self.seed(sizes)
+            self.stdout.write(f"--- {scale}: seeded {sizes} in {time.perf_counter() - began:.1f}s")
+
+            states = [ClientState(users[n % len(users)], n, options['rounds']) for n in range(options['clients'])]
+            # Queries and peak memory of one warm request per scenario, measured alone
+            profile = self.profile(states[0])
+
+            samples = {label: [] for label in profile}
+            errors = {label: 0 for label in profile}
+            reasons = {}
+            lock = threading.Lock()
+
+            def run(state):
+                work = [label for label in profile for _ in range(options['rounds'])]
+                random.shuffle(work)
+                scenarios = {label: (method, build) for label, method, build in self.labelled(state)}
+                for label in work:
+                    method, build = scenarios[label]
+                    elapsed, error = self.timed(method, build)
+                    with lock:
+                        samples[label].append(elapsed)
+                        if error:
+                            errors[label] += 1
+                            reasons.setdefault(label, error)
+                connection.close()
+
+            threads = [threading.Thread(target=run, args=(state,)) for state in states]
+            began = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - began
+
+        routes = {}
+        for label, latencies in samples.items():
+            routes[label] = dict(summarize(latencies), errors=errors[label], **profile[label])
+            self.stdout.write(
+                f"{label:<40} p50={routes[label]['p50_ms']:>8}ms p95={routes[label]['p95_ms']:>8}ms "
+                f"p99={routes[label]['p99_ms']:>8}ms queries={routes[label]['queries']:>3} "
+                f"peak={routes[label]['peak_kib']:>7}KiB errors={errors[label]}"
+                + (f" ({reasons[label]})" if label in reasons else '')
+            )
+        total = sum(len(latencies) for latencies in samples.values())
+        max_rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write(f"{total} requests in {wall:.1f}s ({total / wall:.1f}/s), max RSS {max_rss_kib // 1024}MiB")
+        return {'seed': sizes, 'requests_per_second': round(total / wall, 1), 'max_rss_kib': max_rss_kib, 'routes': routes}
+
+    def profile(self, state):
+        profile = {}
+        for label, method, build in self.labelled(state):
+            # The second request shows the steady state (warm caches, room cache loaded)
+            self.timed(method, build)
+            profile[label] = {}
+            self.timed(method, build, measure=self.measure(profile[label]))
+        return profile
+
+    @contextmanager
+    def measure(self, into):
+        """Record the queries and the peak of Python allocations of the block in the dict"""
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                yield
+            into['queries'] = len(queries)
+            into['peak_kib'] = tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            tracemalloc.stop()
+
+    def labelled(self, state):
+        return [(f"{method} {route}{variant}", method, build) for route, method, variant, build in self.scenarios(state)]
+
+    def timed(self, method, build, measure=None):
+        """Send one request; returns (seconds, None or why it did not get the expected answer)"""
+        began = time.perf_counter()
+        try:
+            client, url, data, expected = build()
+            with measure or nullcontext():
+                began = time.perf_counter()
+                if method == 'POST':
+                    response = client.post(url, data)
+                else:
+                    response = client.get(url, data)
+                if response.streaming:
+                    # An export is only done once the whole file has been produced
+                    b''.join(response.streaming_content)
+        except OperationalError as e:
+            # SQLite lets one writer in at a time; a request that gave up waiting failed
+            return time.perf_counter() - began, str(e)
+        elapsed = time.perf_counter() - began
+        if response.status_code != expected:
+            return elapsed, f"status {response.status_code}, expected {expected}"
+        return elapsed, None
+
+    def scenarios(self, state):
+        """(route name, method, query variant, build) per scenario; build() gives (client, url, data, expected status)"""
+        s = state
+
+        def get(name, *args, params=None, expected=200):
+            return lambda: (s.client, reverse(name, args=args), params or {}, expected)
+
+        return [
+            ('index', 'GET', '', get('index')),
+            ('dashboard', 'GET', '', get('dashboard')),
+            ('dashboard', 'GET', '?q', lambda: (s.client, reverse('dashboard'), {'q': random.choice(WORDS)}, 200)),
+            ('dashboard', 'GET', '?category_filter', lambda: (s.client, reverse('dashboard'), {'category_filter': s.category_id}, 200)),
+            ('dashboard', 'GET', '?quantity_filter', get('dashboard', params={'quantity_filter': 'high_to_low'})),
+            ('dashboard_cache_stats', 'GET', '', get('dashboard_cache_stats')),
+            ('metrics', 'GET', '', get('metrics')),
+            ('add-item', 'GET', '', get('add-item')),
+            ('add-item', 'POST', '', lambda: (s.client, reverse('add-item'), s.new_item(), 302)),
+            ('edit-item', 'GET', '', lambda: (s.client, reverse('edit-item', args=[s.item_id]), {}, 200)),
+            ('edit-item', 'POST', '', lambda: (s.client, reverse('edit-item', args=[s.item_id]), s.edited_item(), 302)),
+            ('delete-item', 'GET', '', lambda: (s.client, reverse('delete-item', args=[s.item_id]), {}, 200)),
+            ('delete-item', 'POST', '', lambda: (s.client, reverse('delete-item', args=[s.doomed_items.pop()]), {}, 302)),
+            ('import-items', 'GET', '', get('import-items')),
+            ('import-items', 'POST', '', lambda: (s.client, reverse('import-items'), s.import_file(), 302)),
+            ('export-items', 'GET', '', get('export-items')),
+            ('signup', 'GET', '', get('signup')),
+            ('login', 'GET', '', get('login')),
+            ('logout', 'POST', '', lambda: (s.logged_in_client(), reverse('logout'), {}, 302)),
+            ('search_suggestions', 'GET', '', lambda: (s.client, reverse('search_suggestions'), {'q': random.choice(WORDS)[:3]}, 200)),
+            ('room-calendar', 'GET', '', get('room-calendar')),
+            ('room-events', 'GET', '', lambda: (s.client, reverse('room-events', args=[s.room_key()]), {}, 200)),
+            ('availability', 'GET', '', get('availability')),
+            ('create-reservation', 'GET', '', lambda: (s.client, reverse('create-reservation', args=[s.room_key()]), {}, 200)),
+            ('create-reservation', 'POST', '', lambda: (s.client, reverse('create-reservation', args=[s.room_key()]), s.new_slot(), 302)),
+            ('update_reservation', 'GET', '', lambda: (s.client, reverse('update_reservation', args=[s.reservation_id]), {}, 200)),
+            ('update_reservation', 'POST', '', lambda: (s.client, reverse('update_reservation', args=[s.reservation_id]), s.new_slot(), 302)),
+            ('delete_reservation', 'GET', '', lambda: (s.client, reverse('delete_reservation', args=[s.reservation_id]), {}, 200)),
+            ('delete_reservation', 'POST', '', lambda: (s.client, reverse('delete_reservation', args=[s.doomed_reservations.pop()]), {}, 302)),
+            ('reservation_list', 'GET', '', get('reservation_list')),
+            ('reservation_list', 'GET', '?show_past&status', get('reservation_list', params={'show_past': 'true', 'status': 'confirmed'})),
+        ]
+
+    def seed(self, sizes):
+        # One hash for everyone; hashing per user would dominate seeding
+        password = make_password('bench')
+        users = User.objects.bulk_create([
+            # Staff, so the cache stats and metrics endpoints answer too
+            User(username=f'bench{n}', password=password, is_staff=True) for n in range(sizes['users'])
+        ])
+        categories = Category.objects.bulk_create([Category(name=f'Category {n}') for n in range(sizes['categories'])])
+        batch = []
+        for n in range(sizes['items']):
+            batch.append(InventoryItem(
+                name=f'{WORDS[n % len(WORDS)]} {n:07d}',
+                quantity=(n * 7919) % 500,
+                category=categories[n % len(categories)],
+                user=users[n % len(users)],
+            ))
+            if len(batch) == 10000:
+                InventoryItem.objects.bulk_create(batch)
+                batch = []
+        InventoryItem.objects.bulk_create(batch)
+
+        rooms = lab_rooms.all()
+        # Hour-long bookings every two hours per room, half of them already past
+        origin = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=sizes['reservations'] // len(rooms))
+        reservations = [
+            Reservation(
+                user=users[n % len(users)],
+                room=rooms[n % len(rooms)],
+                calendar_id=rooms[n % len(rooms)].calendar_id,
+                start_time=origin + timedelta(hours=2 * (n // len(rooms))),
+                end_time=origin + timedelta(hours=2 * (n // len(rooms)) + 1),
+                purpose=f'Seeded booking {n}',
+                status='confirmed',
+            )
+            for n in range(sizes['reservations'])
+        ]
+        Reservation.objects.bulk_create(reservations, batch_size=5000)
+        refresh_spans({(r.room_id, r.start_time, r.end_time) for r in reservations})
+        return users
+
+
+# New reservations start past the seeded ones; each one gets its own two-hour slot
+_slots = count(1)
+_slots_lock = threading.Lock()
+
+
+class ClientState:
+    """A logged-in client plus the rows its write scenarios use up or change"""
+
+    def __init__(self, user, number, rounds):
+        self.user = user
+        self.number = number
+        self.client = Client()
+        self.client.force_login(user)
+        self.category_id = Category.objects.order_by('?').values_list('pk', flat=True).first()
+        self.item_id = InventoryItem.objects.create(
+            name=f'bench client {number}', quantity=100, category_id=self.category_id, user=user
+        ).pk
+        self.quantity = 100
+        self.created = count()
+        # Profiling sends two of every request, on top of the timed rounds
+        doomed = rounds + 2
+        self.doomed_items = [
+            item.pk for item in InventoryItem.objects.bulk_create([
+                InventoryItem(name=f'bench client {number} doomed {n}', quantity=1, category_id=self.category_id, user=user)
+                for n in range(doomed)
+            ])
+        ]
+        self.reservation_id = self.book()
+        self.doomed_reservations = [self.book() for _ in range(doomed)]
+
+    def slot(self):
+        with _slots_lock:
+            n = next(_slots)
+        return timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=3650, hours=2 * n)
+
+    def book(self):
+        start = self.slot()
+        room = lab_rooms.all()[0]
+        return Reservation.objects.create(
+            user=self.user, room=room, calendar_id=room.calendar_id, start_time=start,
+            end_time=start + timedelta(hours=1), purpose='bench', status='confirmed',
+        ).pk
+
+    def room_key(self):
+        return random.choice(lab_rooms.all()).key
+
+    def new_slot(self):
+        start = timezone.localtime(self.slot())
+        return {
+            'start_time': start.strftime('%Y-%m-%dT%H:%M'),
+            'end_time': (start + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M'),
+            'purpose': 'bench',
+        }
+
+    def new_item(self):
+        return {
+            'name': f'bench client {self.number} item {next(self.created)}',
+            'quantity': 10,
+            'category': self.category_id,
+        }
+
+    def edited_item(self):
+        data = {
+            'name': f'bench client {self.number}',
+            'quantity': self.quantity + 1,
+            'original_quantity': self.quantity,
+            'category': self.category_id,
+        }
+        self.quantity += 1
+        return data
+
+    def import_file(self):
+        batch = next(self.created)
+        rows = '\n'.join(f'bench client {self.number} import {batch}-{n},{n},Imported' for n in range(20))
+        upload = io.BytesIO(f'name,quantity,category\n{rows}\n'.encode())
+        upload.name = 'items.csv'
+        return {'file': upload, 'format': 'csv'}
+
+    def logged_in_client(self):
+        # A throwaway session, so logging out doesn't end the one the other scenarios use
+        client = Client()
+        client.force_login(self.user)
+        return client
@@ -0,0 +1,21 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from inventory.bulk import export_csv, export_json
+
+
+class Command(BaseCommand):
+    help = "Write every inventory item as CSV or JSON, streaming rows from the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help="Output file (standard output when omitted)")
+        parser.add_argument('--format', choices=['csv', 'json'], default='csv')
+
+    def handle(self, *args, **options):
+        chunks = export_json() if options['format'] == 'json' else export_csv()
+        if options['path']:
+            with open(options['path'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(chunks)
+        else:
+            sys.stdout.writelines(chunks)
@@ -0,0 +1,33 @@
+import csv
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.bulk import BATCH_SIZE, import_items, read_records
+
+
+class Command(BaseCommand):
+    help = "Create or update inventory items from a CSV or JSON (array or JSON Lines) file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help="Username recorded as the owner of new items")
+        parser.add_argument('--format', choices=['csv', 'json'], help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}")
+
+        file_format = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'json')
+        with open(options['path'], 'rb') as f:
+            try:
+                result = import_items(read_records(f, file_format), user, batch_size=options['batch_size'])
+            except (ValueError, UnicodeDecodeError, csv.Error) as e:
+                raise CommandError(f"Could not read {options['path']}: {e}")
+
+        for error in result.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(f"Import finished: {result}"))
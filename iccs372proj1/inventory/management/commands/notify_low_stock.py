@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.alerts import send_pending_alerts
+
+
+class Command(BaseCommand):
+    help = "Send queued low-stock alerts as batched digests (run a single worker process)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once nothing is left to send")
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds to wait between digests")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        while True:
+            processed, reported = send_pending_alerts(limit=options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} alert(s), reported {reported} item(s)")
+            # Keep going straight away while there is a backlog
+            if processed == options['batch_size']:
+                continue
+            if options['once']:
+                break
+            # Waiting between digests is what batches alerts raised close together
+            time.sleep(options['interval'])
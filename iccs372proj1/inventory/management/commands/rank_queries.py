@@ -0,0 +1,71 @@
+import json
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Rank the N+1 candidates and slow statements in a QUERY_INSPECTOR_LOG by the total time "
+        "they cost, e.g. over a load-test run"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('log', help="File the query inspector wrote its findings to")
+        parser.add_argument('--top', type=int, default=10, help="Offenders to show per kind")
+
+    def handle(self, *args, **options):
+        offenders = {}
+        try:
+            with open(options['log']) as log:
+                for line in log:
+                    try:
+                        finding = json.loads(line)
+                    except ValueError:
+                        continue
+                    if finding.get('event') not in ('n_plus_one', 'slow_query'):
+                        continue
+                    self.add(offenders, finding)
+        except OSError as e:
+            raise CommandError(f"Can't read {options['log']}: {e}")
+
+        for event, title in (('n_plus_one', 'N+1 candidates'), ('slow_query', 'Slow statements')):
+            ranked = sorted(
+                (offender for (kind, _), offender in offenders.items() if kind == event),
+                key=lambda offender: offender['ms'], reverse=True,
+            )
+            self.stdout.write(f"{title} ({len(ranked)} distinct):")
+            for offender in ranked[:options['top']]:
+                self.stdout.write(
+                    f"  {offender['ms']:9.1f}ms  {offender['statements']:6} statements in {offender['requests']:5} "
+                    f"requests  worst {offender['max_ms']:.1f}ms  [{offender['fingerprint']}]"
+                )
+                self.stdout.write(f"      {offender['sql'][:160]}")
+                for where, times in offender['origins'].most_common(3):
+                    self.stdout.write(f"      {times:5}x {where}")
+                self.stdout.write(f"      views: {', '.join(view for view, _ in offender['views'].most_common(3))}")
+
+    def add(self, offenders, finding):
+        offender = offenders.setdefault((finding['event'], finding['fingerprint']), {
+            'fingerprint': finding['fingerprint'],
+            'sql': finding['sql'],
+            'requests': 0,
+            'statements': 0,
+            'ms': 0.0,
+            'max_ms': 0.0,
+            'views': Counter(),
+            'origins': Counter(),
+        })
+        offender['requests'] += 1
+        offender['statements'] += finding.get('count', 1)
+        offender['ms'] += finding['ms']
+        offender['max_ms'] = max(offender['max_ms'], finding['ms'])
+        offender['views'][finding.get('view') or finding.get('path')] += 1
+        if finding['event'] == 'n_plus_one':
+            for origin in finding['origins']:
+                offender['origins'][self.where(origin)] += origin['count']
+        else:
+            offender['origins'][self.where(finding)] += 1
+
+    def where(self, origin):
+        return ' via '.join(part for part in (origin['template'], origin['code']) if part) or 'unknown'
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from inventory.availability import refresh_spans
+from inventory.models import Reservation, RoomOccupancy
+
+
+class Command(BaseCommand):
+    help = "Rebuild every room occupancy bitmap from the confirmed reservations (run once after migrating)"
+
+    def handle(self, *args, **options):
+        RoomOccupancy.objects.all().delete()
+        spans = set(Reservation.objects.confirmed().values_list('room_id', 'start_time', 'end_time').iterator())
+        refresh_spans(spans)
+        self.stdout.write(f"Rebuilt {RoomOccupancy.objects.count()} room-day bitmap(s)")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from inventory.google_calendar import get_calendar_api
+from inventory.reconcile import PAGE_SIZE, calendar_ids, reconcile_calendar
+
+
+class Command(BaseCommand):
+    help = "Compare reservations with the remote calendars and queue repairs for the sync worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calendar', action='append', dest='calendars', help="Only this calendar id (repeatable)")
+        parser.add_argument('--full', action='store_true', help="Ignore the stored sync tokens and list everything")
+        parser.add_argument('--updated-min', help="Only look at events changed after this ISO 8601 time")
+        parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Report differences without queueing repairs")
+
+    def handle(self, *args, **options):
+        updated_min = None
+        if options['updated_min']:
+            updated_min = parse_datetime(options['updated_min'])
+            if updated_min is None or updated_min.tzinfo is None:
+                raise CommandError("--updated-min needs a date and time with a UTC offset")
+
+        api = get_calendar_api()
+        for calendar_id in options['calendars'] or calendar_ids():
+            result = reconcile_calendar(
+                api, calendar_id,
+                full=options['full'],
+                updated_min=updated_min,
+                page_size=options['page_size'],
+                dry_run=options['dry_run'],
+            )
+            self.stdout.write(str(result))
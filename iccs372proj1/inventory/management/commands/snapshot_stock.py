@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from inventory.stock import take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Snapshot the quantity of every item that moved since its last snapshot (run periodically, e.g. nightly)"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Wrote {take_snapshots()} stock snapshot(s)")
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.calendar_sync import drain_outbox
+from inventory.google_calendar import get_calendar_api
+
+
+class Command(BaseCommand):
+    help = "Send queued reservation changes to Google Calendar (any number of worker processes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once nothing is left to send")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep when the outbox is idle")
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        api = get_calendar_api()
+        while True:
+            sent, failed = drain_outbox(api, limit=options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f"Sent {sent} calendar change(s), {failed} failed")
+            # Keep going straight away while there is a backlog
+            if sent:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,245 @@
+"""Request timings for the Server-Timing header and the Prometheus /metrics endpoint.
+
+PerformanceMiddleware times every request and counts it per view, which
+costs two clock reads. A PERF_SAMPLE_RATE share of the requests is looked at
+closely: their SQL (through record_query), their calendar calls (through
+InstrumentedCalendarAPI) and their template rendering are timed too and sent
+back in a Server-Timing header.
+
+record_query is an execute wrapper on every connection, added when it opens
+(signals.watch_queries): async views run their SQL on a thread of their own,
+whose connections a wrapper added around the request would never reach. It
+finds the request's timings in a context variable, which sync_to_async
+carries into that thread, and does nothing for requests that are not sampled.
+
+The totals are prometheus_client metrics. Under gunicorn every worker writes
+them to its own files in PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py sets the
+directory up), and render_metrics() adds up the files of all workers, so a
+scrape answered by any one worker reports the whole server. Without that
+directory, as under runserver, the totals are this process's.
+"""
+import inspect
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, disable_created_metrics, generate_latest, multiprocess
+)
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = ContextVar('request_timings', default=None)
+# Multiprocess mode has no *_created series; leave them out in a single process too
+disable_created_metrics()
+# Kept out of prometheus_client's global registry, which would also export process and GC metrics
+registry = CollectorRegistry()
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time to answer a request, by view.',
+    ['view'], buckets=DURATION_BUCKETS, registry=registry,
+)
+REQUESTS = Counter(
+    'http_requests', 'Requests answered, by view, method and status class.',
+    ['view', 'method', 'status'], registry=registry,
+)
+SAMPLED = {
+    what: Counter(f'http_sampled_{what}', help_text, ['view'], registry=registry)
+    for what, help_text in (
+        ('requests', 'Requests sampled for detailed timing.'),
+        ('db_queries', 'SQL statements run by sampled requests.'),
+        ('db_seconds', 'Time sampled requests spent in SQL.'),
+        ('external_calls', 'Calendar calls made by sampled requests.'),
+        ('external_seconds', 'Time sampled requests spent in calendar calls.'),
+        ('template_seconds', 'Time sampled requests spent rendering templates.'),
+    )
+}
+EXTERNAL = {
+    what: Counter(f'external_{what}', help_text, ['service', 'operation'], registry=registry)
+    for what, help_text in (
+        ('calls', 'Calls to external services, in requests and in the background.'),
+        ('seconds', 'Time spent in calls to external services.'),
+        ('errors', 'Calls to external services that raised an error.'),
+    )
+}
+DASHBOARD_CACHE = {
+    what: Counter(f'dashboard_cache_{what}', f'Dashboard fragment cache {what}.', ['fragment'], registry=registry)
+    for what in ('hits', 'misses')
+}
+
+
+class RequestTimings:
+    """What one sampled request spent, filled in while it runs"""
+    TOTALS = ('requests', 'db_queries', 'db_seconds', 'external_calls', 'external_seconds', 'template_seconds')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.external_calls = 0
+        self.external_seconds = 0.0
+        self.template_seconds = 0.0
+        self._template_depth = 0
+
+    def server_timing(self, total):
+        """Value for the Server-Timing header; durations in milliseconds"""
+        return ', '.join([
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"',
+            f'calendar;dur={self.external_seconds * 1000:.1f};desc="{self.external_calls} calls"',
+            f'tpl;dur={self.template_seconds * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    began = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_queries += 1
+        timings.db_seconds += time.perf_counter() - began
+
+
+@contextmanager
+def external_call(service, operation):
+    """Time a call to another service, for the current request (if sampled) and the process totals"""
+    began = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - began
+        timings = _current.get()
+        if timings is not None:
+            timings.external_calls += 1
+            timings.external_seconds += elapsed
+        EXTERNAL['calls'].labels(service, operation).inc()
+        EXTERNAL['seconds'].labels(service, operation).inc(elapsed)
+        if failed:
+            EXTERNAL['errors'].labels(service, operation).inc()
+
+
+class InstrumentedCalendarAPI:
+    """Wraps a calendar client (sync or async) so that its calls are timed as external calls"""
+    CALLS = {'create_event', 'update_event', 'delete_event', 'list_events', 'batch'}
+
+    def __init__(self, api):
+        self.api = api
+
+    def __getattr__(self, name):
+        attr = getattr(self.api, name)
+        if name not in self.CALLS:
+            return attr
+
+        if inspect.iscoroutinefunction(attr):
+            async def call(*args, **kwargs):
+                with external_call('calendar', name):
+                    return await attr(*args, **kwargs)
+        else:
+            def call(*args, **kwargs):
+                with external_call('calendar', name):
+                    return attr(*args, **kwargs)
+        return call
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return super().render(context, request)
+        # Templates rendered from within another one (includes, crispy forms) count once
+        timings._template_depth += 1
+        began = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings._template_depth -= 1
+            if not timings._template_depth:
+                timings.template_seconds += time.perf_counter() - began
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for sampled requests"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        began = time.perf_counter()
+        with self.sampled() as timings:
+            response = self.get_response(request)
+        return self.finish(request, response, began, timings)
+
+    async def __acall__(self, request):
+        began = time.perf_counter()
+        with self.sampled() as timings:
+            response = await self.get_response(request)
+        return self.finish(request, response, began, timings)
+
+    @contextmanager
+    def sampled(self):
+        """For a PERF_SAMPLE_RATE share of requests, time what the body spends; yields the timings, or None"""
+        if random.random() >= settings.PERF_SAMPLE_RATE:
+            yield None
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            yield timings
+        finally:
+            _current.reset(token)
+
+    def finish(self, request, response, began, timings):
+        elapsed = time.perf_counter() - began
+        self.record(request, response, elapsed, timings)
+        if timings is not None:
+            response['Server-Timing'] = timings.server_timing(elapsed)
+        return response
+
+    def record(self, request, response, elapsed, timings=None):
+        # Views, not paths, so that ids in URLs don't make a series each
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        REQUEST_DURATION.labels(view).observe(elapsed)
+        REQUESTS.labels(view, request.method, f'{response.status_code // 100}xx').inc()
+        if timings is not None:
+            SAMPLED['requests'].labels(view).inc()
+            for what in RequestTimings.TOTALS[1:]:
+                SAMPLED[what].labels(view).inc(getattr(timings, what))
+
+
+def render_metrics():
+    """Totals of every worker (or of this process) in the Prometheus text exposition format"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Read fresh from the workers' files on every scrape
+        combined = CollectorRegistry()
+        multiprocess.MultiProcessCollector(combined)
+        return generate_latest(combined).decode()
+    return generate_latest(registry).decode()
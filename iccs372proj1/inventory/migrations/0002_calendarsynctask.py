@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarSyncTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=10)),
+                ('calendar_id', models.CharField(max_length=255)),
+                ('event_id', models.CharField(help_text='Google Calendar event ID, also the idempotency key for inserts', max_length=255)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('reservation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sync_tasks', to='inventory.reservation')),
+            ],
+            options={
+                'verbose_name': 'Calendar Sync Task',
+                'verbose_name_plural': 'Calendar Sync Tasks',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='calsync_status_id_idx')],
+            },
+        ),
+    ]
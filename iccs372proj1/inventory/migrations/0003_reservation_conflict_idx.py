@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def add_overlap_constraint(apps, schema_editor):
+    # Range exclusion constraints are PostgreSQL only; other backends check in Reservation.save()
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        "ALTER TABLE inventory_reservation ADD CONSTRAINT reservation_no_overlap "
+        "EXCLUDE USING gist (room_key WITH =, tstzrange(start_time, end_time, '[)') WITH &&) "
+        "WHERE (status = 'confirmed')"
+    )
+
+
+def remove_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE inventory_reservation DROP CONSTRAINT IF EXISTS reservation_no_overlap')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_calendarsynctask'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['room_key', 'status', 'start_time', 'end_time'], name='reservation_conflict_idx'),
+        ),
+        migrations.RunPython(add_overlap_constraint, remove_overlap_constraint),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_reservation_conflict_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('room_key', models.CharField(max_length=50)),
+                ('day', models.DateField()),
+                ('slots', models.BinaryField(max_length=12)),
+            ],
+            options={
+                'verbose_name': 'Room Occupancy',
+                'verbose_name_plural': 'Room Occupancy',
+                'constraints': [models.UniqueConstraint(fields=('room_key', 'day'), name='room_occupancy_room_day_uniq')],
+            },
+        ),
+    ]
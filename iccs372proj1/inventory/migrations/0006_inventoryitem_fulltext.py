@@ -0,0 +1,58 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE inventory_item_fts USING fts5("
+    "name, content='inventory_inventoryitem', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER inventory_item_fts_ai AFTER INSERT ON inventory_inventoryitem BEGIN "
+    "INSERT INTO inventory_item_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER inventory_item_fts_ad AFTER DELETE ON inventory_inventoryitem BEGIN "
+    "INSERT INTO inventory_item_fts(inventory_item_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER inventory_item_fts_au AFTER UPDATE OF name ON inventory_inventoryitem BEGIN "
+    "INSERT INTO inventory_item_fts(inventory_item_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO inventory_item_fts(rowid, name) VALUES (new.id, new.name); END",
+    "INSERT INTO inventory_item_fts(inventory_item_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS inventory_item_fts_au",
+    "DROP TRIGGER IF EXISTS inventory_item_fts_ad",
+    "DROP TRIGGER IF EXISTS inventory_item_fts_ai",
+    "DROP TABLE IF EXISTS inventory_item_fts",
+]
+
+
+def postgres_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    return GinIndex(SearchVector('name', config='simple'), name='inventory_item_name_search')
+
+
+def add_search_index(apps, schema_editor):
+    # Triggers keep the FTS table in sync with every write, including bulk_create and update()
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_FORWARD:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('inventory', 'InventoryItem'), postgres_index())
+
+
+def remove_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_BACKWARD:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('inventory', 'InventoryItem'), postgres_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_inventoryitem_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_index, remove_search_index),
+    ]
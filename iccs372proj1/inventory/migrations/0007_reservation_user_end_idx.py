@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_inventoryitem_fulltext'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['user', 'end_time', 'start_time'], name='reservation_user_end_idx'),
+        ),
+    ]
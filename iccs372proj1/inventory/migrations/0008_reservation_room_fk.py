@@ -0,0 +1,155 @@
+# Generated by Django 5.1.5 on 2026-10-17 01:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.text import slugify
+
+# The rooms that used to be configured in settings.LAB_ROOMS
+INITIAL_ROOMS = {
+    'room1': {'name': 'Lab Room 1', 'calendar_id': 'c_494b497eabb29d3866a26954c964cc4d37eecc550bd43644e10ecbf458a3917d@group.calendar.google.com'},
+    'room2': {'name': 'Lab Room 2', 'calendar_id': 'c_3a3bfa9453191b6c5d4a2bb91e65da3e27ac4cbb68df71b79544de8f91e53c82@group.calendar.google.com'},
+    'room3': {'name': 'Lab Room 3', 'calendar_id': 'c_e06857ebb2c6cf25350feb85d269f570e4753ecd3fdb7537807e43fcc94f7799@group.calendar.google.com'},
+    'room4': {'name': 'Lab Room 4', 'calendar_id': 'c_08b064952f4fec9e0ae24b91644b2f98165c085d7b29abc9066ff867d3947e09@group.calendar.google.com'},
+    'room5': {'name': 'Lab Room 5', 'calendar_id': 'c_e1502d41091c7caf280fd10f8e362a7de2ec24e738a88bad835ed9818a02d794@group.calendar.google.com'},
+}
+
+
+def create_rooms(apps, schema_editor):
+    LabRoom = apps.get_model('inventory', 'LabRoom')
+    Reservation = apps.get_model('inventory', 'Reservation')
+    RoomOccupancy = apps.get_model('inventory', 'RoomOccupancy')
+
+    for key, data in INITIAL_ROOMS.items():
+        room = LabRoom.objects.filter(name=data['name']).first() or LabRoom(name=data['name'])
+        room.key = key
+        if not room.calendar_id:
+            room.calendar_id = data['calendar_id']
+        room.save()
+
+    # Rooms created through the admin before they had a key
+    for room in LabRoom.objects.filter(key__isnull=True):
+        room.key = slugify(room.name)[:40] or 'room'
+        if LabRoom.objects.filter(key=room.key).exists():
+            room.key = f'{room.key}-{room.pk}'
+        room.save()
+
+    # Keep reservations whose key was never configured rather than dropping them
+    known = set(LabRoom.objects.values_list('key', flat=True))
+    used = set(Reservation.objects.values_list('room_key', flat=True))
+    used |= set(RoomOccupancy.objects.values_list('room_key', flat=True))
+    for key in sorted(used - known):
+        LabRoom.objects.create(key=key, name=key)
+
+
+def link_rooms(apps, schema_editor):
+    LabRoom = apps.get_model('inventory', 'LabRoom')
+    Reservation = apps.get_model('inventory', 'Reservation')
+    RoomOccupancy = apps.get_model('inventory', 'RoomOccupancy')
+    for room in LabRoom.objects.all():
+        Reservation.objects.filter(room_key=room.key).update(room=room)
+        RoomOccupancy.objects.filter(room_key=room.key).update(room=room)
+
+
+def unlink_rooms(apps, schema_editor):
+    LabRoom = apps.get_model('inventory', 'LabRoom')
+    Reservation = apps.get_model('inventory', 'Reservation')
+    RoomOccupancy = apps.get_model('inventory', 'RoomOccupancy')
+    for room in LabRoom.objects.all():
+        Reservation.objects.filter(room=room).update(room_key=room.key)
+        RoomOccupancy.objects.filter(room=room).update(room_key=room.key)
+
+
+def drop_key_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE inventory_reservation DROP CONSTRAINT IF EXISTS reservation_no_overlap')
+
+
+def add_key_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "ALTER TABLE inventory_reservation ADD CONSTRAINT reservation_no_overlap "
+        "EXCLUDE USING gist (room_key WITH =, tstzrange(start_time, end_time, '[)') WITH &&) "
+        "WHERE (status = 'confirmed')"
+    )
+
+
+def add_room_overlap_constraint(apps, schema_editor):
+    # Range exclusion constraints are PostgreSQL only; other backends check in Reservation.save()
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        "ALTER TABLE inventory_reservation ADD CONSTRAINT reservation_no_overlap "
+        "EXCLUDE USING gist (room_id WITH =, tstzrange(start_time, end_time, '[)') WITH &&) "
+        "WHERE (status = 'confirmed')"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_reservation_user_end_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labroom',
+            name='key',
+            field=models.SlugField(null=True, max_length=50, help_text="Short identifier used in URLs (e.g., 'room1')"),
+        ),
+        migrations.RunPython(create_rooms, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='labroom',
+            name='key',
+            field=models.SlugField(max_length=50, unique=True, help_text="Short identifier used in URLs (e.g., 'room1')"),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='room',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='reservations', to='inventory.labroom'),
+        ),
+        migrations.AddField(
+            model_name='roomoccupancy',
+            name='room',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='inventory.labroom'),
+        ),
+        migrations.RunPython(link_rooms, unlink_rooms),
+        migrations.RunPython(drop_key_overlap_constraint, add_key_overlap_constraint),
+        migrations.RemoveIndex(
+            model_name='reservation',
+            name='reservation_conflict_idx',
+        ),
+        migrations.RemoveConstraint(
+            model_name='roomoccupancy',
+            name='room_occupancy_room_day_uniq',
+        ),
+        migrations.RemoveField(
+            model_name='reservation',
+            name='room_key',
+        ),
+        migrations.RemoveField(
+            model_name='roomoccupancy',
+            name='room_key',
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='room',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='reservations', to='inventory.labroom'),
+        ),
+        migrations.AlterField(
+            model_name='roomoccupancy',
+            name='room',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='inventory.labroom'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['room', 'status', 'start_time', 'end_time'], name='reservation_conflict_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='roomoccupancy',
+            constraint=models.UniqueConstraint(fields=('room', 'day'), name='room_occupancy_room_day_uniq'),
+        ),
+        migrations.RunPython(add_room_overlap_constraint, drop_key_overlap_constraint),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+ADJUST = 3
+
+
+def record_opening_balances(apps, schema_editor):
+    # Every existing quantity becomes one adjustment, so the ledger sums to the current stock
+    InventoryItem = apps.get_model('inventory', 'InventoryItem')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    batch = []
+    for item_id, quantity in InventoryItem.objects.filter(quantity__gt=0).values_list('id', 'quantity').iterator():
+        batch.append(StockMovement(item_id=item_id, kind=ADJUST, delta=quantity))
+        if len(batch) == 5000:
+            StockMovement.objects.bulk_create(batch)
+            batch = []
+    StockMovement.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_reservation_room_fk'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Check-in'), (2, 'Check-out'), (3, 'Adjustment')])),
+                ('delta', models.IntegerField(help_text='Signed change in quantity')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='inventory.inventoryitem')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Stock Movement',
+                'verbose_name_plural': 'Stock Movements',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['item', 'created_at'], name='stock_move_item_time_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('movement_id', models.BigIntegerField(help_text='Last ledger entry included in the quantity')),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='inventory.inventoryitem')),
+            ],
+            options={
+                'verbose_name': 'Stock Snapshot',
+                'verbose_name_plural': 'Stock Snapshots',
+                'indexes': [models.Index(fields=['item', 'taken_at'], name='stock_snap_item_time_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:56
+
+from importlib import import_module
+
+import django.db.models.deletion
+import django.utils.timezone
+import inventory.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+fulltext = import_module('inventory.migrations.0006_inventoryitem_fulltext')
+
+
+def restore_search_triggers(apps, schema_editor):
+    # SQLite rebuilds the table to add a field with a callable default, which drops its triggers
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in fulltext.SQLITE_FORWARD:
+            if statement.startswith('CREATE TRIGGER'):
+                schema_editor.execute(statement.replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS', 1))
+
+
+def set_low_flags(apps, schema_editor):
+    InventoryItem = apps.get_model('inventory', 'InventoryItem')
+    InventoryItem.objects.filter(quantity__lte=models.F('low_stock_threshold')).update(is_low=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_stockmovement_stocksnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Removing the fields on the way back rebuilds the table too
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.CreateModel(
+            name='LowStockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('threshold', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Low Stock Alert',
+                'verbose_name_plural': 'Low Stock Alerts',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='is_low',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='low_stock_threshold',
+            field=models.PositiveIntegerField(default=inventory.models.default_low_stock_threshold, help_text='The item counts as low on stock at or below this quantity'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(condition=models.Q(('is_low', True)), fields=['id'], name='inv_item_low_idx'),
+        ),
+        migrations.AddField(
+            model_name='lowstockalert',
+            name='item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='low_stock_alerts', to='inventory.inventoryitem'),
+        ),
+        migrations.AddIndex(
+            model_name='lowstockalert',
+            index=models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['id'], name='low_alert_pending_idx'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(set_low_flags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.5 on 2026-10-17 01:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_inventoryitem_low_stock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calendar_id', models.CharField(blank=True, help_text='Google Calendar ID for the room', max_length=255)),
+                ('start_time', models.DateTimeField(help_text='Start of the first occurrence')),
+                ('end_time', models.DateTimeField(help_text='End of the first occurrence')),
+                ('purpose', models.TextField(help_text='Purpose of the reservations')),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly')], default='weekly', max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1, help_text='Repeat every this many days or weeks')),
+                ('count', models.PositiveSmallIntegerField(blank=True, help_text='Number of occurrences', null=True)),
+                ('until', models.DateField(blank=True, help_text='Last day an occurrence may start on', null=True)),
+                ('event_id', models.CharField(blank=True, help_text='Google Calendar ID of the recurring event', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='series', to='inventory.labroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservation_series', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reservation Series',
+                'verbose_name_plural': 'Reservation Series',
+                'ordering': ['-start_time'],
+            },
+        ),
+        migrations.AddField(
+            model_name='calendarsynctask',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sync_tasks', to='inventory.reservationseries'),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservations', to='inventory.reservationseries'),
+        ),
+    ]
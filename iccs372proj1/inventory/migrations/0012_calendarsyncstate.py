@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-17 01:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_reservationseries'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calendar_id', models.CharField(max_length=255, unique=True)),
+                ('sync_token', models.TextField(blank=True, help_text='nextSyncToken of the last complete listing; empty forces a full listing')),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Calendar Sync State',
+                'verbose_name_plural': 'Calendar Sync States',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['event_id'], name='reservation_event_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-17 02:10
+
+from django.db import migrations
+
+from inventory.availability import days_between, slot_mask
+
+
+def backfill_occupancy(apps, schema_editor):
+    """Build the bitmaps of the reservations made before 0004 created the table"""
+    Reservation = apps.get_model('inventory', 'Reservation')
+    RoomOccupancy = apps.get_model('inventory', 'RoomOccupancy')
+
+    bitmaps = {}
+    reservations = Reservation.objects.filter(status='confirmed').values_list('room_id', 'start_time', 'end_time')
+    for room_id, start_time, end_time in reservations.iterator():
+        for day in days_between(start_time, end_time):
+            key = (room_id, day)
+            bitmaps[key] = bitmaps.get(key, 0) | slot_mask(day, start_time, end_time)
+
+    RoomOccupancy.objects.all().delete()
+    RoomOccupancy.objects.bulk_create(
+        [
+            RoomOccupancy(room_id=room_id, day=day, slots=bits.to_bytes(12, 'little'))
+            for (room_id, day), bits in bitmaps.items() if bits
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_calendarsyncstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
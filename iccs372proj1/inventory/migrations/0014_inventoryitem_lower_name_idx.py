@@ -0,0 +1,20 @@
+# Generated by Django 5.1.5 on 2026-10-17 02:06
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_backfill_room_occupancy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='inv_item_lower_name_idx'),
+        ),
+    ]
@@ -1,11 +1,14 @@
-from django.db import models
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, connection, models, transaction
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db.models.functions import Lower
 from django.utils import timezone
-from datetime import timedelta
-from django.conf import settings
+from datetime import timedelta, timezone as dt_timezone
 
-from .google_calendar import GoogleCalendarAPI
+from .rooms import lab_rooms
 
 
 class Category(models.Model):
@@ -20,9 +23,37 @@ class Category(models.Model):
         return self.name
 
 
+def default_low_stock_threshold():
+    return settings.LOW_QUANTITY
+
+
+def low_stock_expression(delta=0):
+    """SQL for "quantity + delta is at or below the item's threshold", usable in UPDATE"""
+    return models.Case(
+        models.When(quantity__lte=models.F('low_stock_threshold') - delta, then=models.Value(True)),
+        default=models.Value(False),
+        output_field=models.BooleanField(),
+    )
+
+
+class InventoryItemQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # save() is skipped, so derive the low-stock flag here
+        objs = list(objs)
+        for item in objs:
+            item.is_low = item.is_low_stock()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class InventoryItem(models.Model):
     name = models.CharField(max_length=200, unique=True)
     quantity = models.PositiveIntegerField()
+    low_stock_threshold = models.PositiveIntegerField(
+        default=default_low_stock_threshold,
+        help_text="The item counts as low on stock at or below this quantity"
+    )
+    # Kept in step with quantity and threshold on every write, so reads never compare them
+    is_low = models.BooleanField(default=False, editable=False)
     category = models.ForeignKey(
         'Category',
         on_delete=models.SET_NULL,
@@ -38,21 +69,164 @@ class InventoryItem(models.Model):
         related_name='inventory_items'
     )
 
+    objects = InventoryItemQuerySet.as_manager()
+
     class Meta:
         ordering = ['-date_created']
         verbose_name = 'Inventory Item'
         verbose_name_plural = 'Inventory Items'
+        # Support the dashboard's keyset orderings, with and without a category filter
+        indexes = [
+            models.Index(fields=['quantity', 'id'], name='inv_item_qty_id_idx'),
+            models.Index(fields=['category', 'id'], name='inv_item_cat_id_idx'),
+            models.Index(fields=['category', 'quantity', 'id'], name='inv_item_cat_qty_id_idx'),
+            # Only low items are indexed, so counting them stays cheap however large the table gets
+            models.Index(fields=['id'], condition=models.Q(is_low=True), name='inv_item_low_idx'),
+            # Imports match existing items by lower-cased name
+            models.Index(Lower('name'), name='inv_item_lower_name_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_is_low = instance.__dict__.get('is_low')
+        return instance
 
     def __str__(self):
         return f"{self.name} ({self.quantity})"
 
-    def is_low_stock(self, threshold=5):
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'quantity', 'low_stock_threshold'} & set(update_fields):
+            self.is_low = self.is_low_stock()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'is_low'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Alert when the item crosses into low stock, not on every save while it stays low
+            if self.is_low and not getattr(self, '_loaded_is_low', False):
+                LowStockAlert.raise_for(self)
+        self._loaded_is_low = self.is_low
+
+    def is_low_stock(self, threshold=None):
         """Check if item is in low stock"""
+        if threshold is None:
+            threshold = self.low_stock_threshold
         return self.quantity <= threshold
 
+    @classmethod
+    def refresh_low_stock(cls, item_ids):
+        """Recompute is_low in SQL for the given items, alerting for those that became low"""
+        items = cls.objects.filter(pk__in=item_ids)
+        crossed = items.filter(is_low=False, quantity__lte=models.F('low_stock_threshold'))
+        LowStockAlert.objects.bulk_create([
+            LowStockAlert(item_id=item_id, quantity=quantity, threshold=threshold)
+            for item_id, quantity, threshold in crossed.values_list('pk', 'quantity', 'low_stock_threshold')
+        ])
+        items.update(is_low=low_stock_expression())
+
+
+class LowStockAlert(models.Model):
+    """Outbox entry: an item fell to or below its threshold; notify_low_stock sends these in batches"""
+    item = models.ForeignKey(
+        InventoryItem,
+        on_delete=models.CASCADE,
+        related_name='low_stock_alerts'
+    )
+    quantity = models.PositiveIntegerField()
+    threshold = models.PositiveIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+    notified_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Low Stock Alert'
+        verbose_name_plural = 'Low Stock Alerts'
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(notified_at__isnull=True), name='low_alert_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Item {self.item_id} at {self.quantity} (threshold {self.threshold})"
+
+    @classmethod
+    def raise_for(cls, item):
+        return cls.objects.create(item=item, quantity=item.quantity, threshold=item.low_stock_threshold)
+
+
+class StockMovement(models.Model):
+    """Append-only ledger entry for one change to an item's quantity"""
+    CHECK_IN = 1
+    CHECK_OUT = 2
+    ADJUST = 3
+    KIND_CHOICES = [
+        (CHECK_IN, 'Check-in'),
+        (CHECK_OUT, 'Check-out'),
+        (ADJUST, 'Adjustment'),
+    ]
+
+    item = models.ForeignKey(
+        InventoryItem,
+        on_delete=models.CASCADE,
+        related_name='movements'
+    )
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    delta = models.IntegerField(help_text="Signed change in quantity")
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+'
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Stock Movement'
+        verbose_name_plural = 'Stock Movements'
+        indexes = [
+            models.Index(fields=['item', 'created_at'], name='stock_move_item_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.delta:+d} (item {self.item_id})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Stock movements are append-only")
+        super().save(*args, **kwargs)
+
+
+class StockSnapshot(models.Model):
+    """An item's quantity after every movement up to and including `movement_id`"""
+    item = models.ForeignKey(
+        InventoryItem,
+        on_delete=models.CASCADE,
+        related_name='snapshots'
+    )
+    quantity = models.PositiveIntegerField()
+    movement_id = models.BigIntegerField(help_text="Last ledger entry included in the quantity")
+    taken_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Stock Snapshot'
+        verbose_name_plural = 'Stock Snapshots'
+        indexes = [
+            models.Index(fields=['item', 'taken_at'], name='stock_snap_item_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"Item {self.item_id}: {self.quantity} at {self.taken_at:%Y-%m-%d %H:%M}"
+
 
 class LabRoom(models.Model):
     """Lab room model"""
+    key = models.SlugField(
+        max_length=50,
+        unique=True,
+        help_text="Short identifier used in URLs (e.g., 'room1')"
+    )
     name = models.CharField(max_length=100, unique=True)
     calendar_id = models.CharField(
         max_length=255,
@@ -84,12 +258,175 @@ class LabRoom(models.Model):
 
     def is_available_at(self, start_time, end_time):
         """Check if room is available during specified time period"""
-        conflicting_reservations = self.reservations.filter(
+        return not Reservation.objects.overlapping(self, start_time, end_time).exists()
+
+
+# Name of the PostgreSQL exclusion constraint that rejects overlapping confirmed bookings
+RESERVATION_OVERLAP_CONSTRAINT = 'reservation_no_overlap'
+
+
+class ReservationQuerySet(models.QuerySet):
+    def confirmed(self):
+        return self.filter(status='confirmed')
+
+    def overlapping(self, room, start_time, end_time, exclude_pk=None):
+        """Confirmed reservations in the room (a LabRoom or its id) that overlap [start_time, end_time).
+
+        This is the single conflict check for bookings; it is answered from
+        reservation_conflict_idx.
+        """
+        conflicts = self.filter(
+            room=room,
             status='confirmed',
             start_time__lt=end_time,
             end_time__gt=start_time
         )
-        return not conflicting_reservations.exists()
+        if exclude_pk:
+            conflicts = conflicts.exclude(pk=exclude_pk)
+        return conflicts
+
+
+def validate_slot(room, start_time, end_time):
+    """Rules every booking has to follow, for single reservations and series alike"""
+    if not start_time or not end_time:
+        raise ValidationError("Both start and end times are required.")
+
+    # Check if the room exists and can be booked
+    if room is None:
+        raise ValidationError("Invalid room selection.")
+    if not room.is_available:
+        raise ValidationError("This room is not available for booking.")
+
+    # Check if end time is after start time
+    if end_time <= start_time:
+        raise ValidationError("End time must be after start time.")
+
+    # Check if start time is in the future
+    if start_time < timezone.now():
+        raise ValidationError("Cannot create reservations in the past.")
+
+    # Check if duration is within allowed limits (e.g., 4 hours maximum)
+    max_duration = timedelta(hours=4)
+    if (end_time - start_time) > max_duration:
+        raise ValidationError("Reservation duration cannot exceed 4 hours.")
+
+
+class ReservationSeries(models.Model):
+    """A repeating booking: the first occurrence plus an RRULE-style daily or weekly rule"""
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    FREQUENCY_CHOICES = [
+        (DAILY, 'Daily'),
+        (WEEKLY, 'Weekly'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='reservation_series'
+    )
+    room = models.ForeignKey(
+        LabRoom,
+        on_delete=models.PROTECT,
+        related_name='series'
+    )
+    calendar_id = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="Google Calendar ID for the room"
+    )
+    start_time = models.DateTimeField(help_text="Start of the first occurrence")
+    end_time = models.DateTimeField(help_text="End of the first occurrence")
+    purpose = models.TextField(
+        help_text="Purpose of the reservations"
+    )
+    frequency = models.CharField(
+        max_length=10,
+        choices=FREQUENCY_CHOICES,
+        default=WEEKLY
+    )
+    interval = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Repeat every this many days or weeks"
+    )
+    count = models.PositiveSmallIntegerField(
+        blank=True,
+        null=True,
+        help_text="Number of occurrences"
+    )
+    until = models.DateField(
+        blank=True,
+        null=True,
+        help_text="Last day an occurrence may start on"
+    )
+    event_id = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="Google Calendar ID of the recurring event"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-start_time']
+        verbose_name = 'Reservation Series'
+        verbose_name_plural = 'Reservation Series'
+
+    def __str__(self):
+        return f"{self.room_name} - {self.get_frequency_display()} from {self.start_time.strftime('%Y-%m-%d %H:%M')}"
+
+    def occurrences(self):
+        """(start_time, end_time) of every occurrence; the local wall-clock time stays the same across DST changes"""
+        step = timedelta(days=self.interval * (7 if self.frequency == self.WEEKLY else 1))
+        duration = self.end_time - self.start_time
+        first = timezone.localtime(self.start_time).replace(tzinfo=None)
+        # One past the limit is enough for clean() to tell the series is too long
+        limit = self.count or settings.RESERVATION_SERIES_MAX_OCCURRENCES + 1
+        spans = []
+        while len(spans) < limit:
+            start = first + step * len(spans)
+            if self.until and start.date() > self.until:
+                break
+            start = timezone.make_aware(start)
+            spans.append((start, start + duration))
+        return spans
+
+    def recurrence(self):
+        """RFC 5545 rule for the calendar event; book_series() stores the expanded count, so COUNT is exact"""
+        return [f"RRULE:FREQ={self.frequency.upper()};INTERVAL={self.interval};COUNT={self.count}"]
+
+    def instance_event_id(self, start_time):
+        """Google's id for one occurrence of the recurring event: '<event id>_<original start in UTC>'"""
+        return f"{self.event_id}_{start_time.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')}"
+
+    def calendar_event_data(self):
+        """Summary and description used for the Google Calendar event"""
+        return {
+            'summary': f"Room Reservation - {self.room_name}",
+            'description': f"Reserved by: {self.user.username}\nPurpose: {self.purpose}",
+        }
+
+    def clean(self):
+        """Validate the rule and the first occurrence; conflicts are checked for all of them by book_series()"""
+        validate_slot(self.lab_room, self.start_time, self.end_time)
+        if not self.count and not self.until:
+            raise ValidationError("Give either a number of occurrences or an end date.")
+        if self.interval < 1:
+            raise ValidationError("The repeat interval must be at least 1.")
+        if self.until and self.until < timezone.localtime(self.start_time).date():
+            raise ValidationError("The end date cannot be before the first reservation.")
+        limit = settings.RESERVATION_SERIES_MAX_OCCURRENCES
+        if (self.count or 0) > limit or len(self.occurrences()) > limit:
+            raise ValidationError(f"A series cannot have more than {limit} reservations.")
+
+    @property
+    def lab_room(self):
+        """The series' room from the in-process room cache, without a query"""
+        return lab_rooms.get_by_id(self.room_id)
+
+    @property
+    def room_name(self):
+        room = self.lab_room
+        return room.name if room else 'Unknown Room'
 
 
 class Reservation(models.Model):
@@ -105,10 +442,10 @@ class Reservation(models.Model):
         on_delete=models.CASCADE,
         related_name='reservations'
     )
-    room_key = models.CharField(
-        max_length=50,
-        default='room1',  # Set default value to 'room1'
-        help_text="The room identifier (e.g., 'room1', 'room2')"
+    room = models.ForeignKey(
+        LabRoom,
+        on_delete=models.PROTECT,
+        related_name='reservations'
     )
     calendar_id = models.CharField(
         max_length=255,
@@ -130,127 +467,133 @@ class Reservation(models.Model):
         blank=True,
         help_text="Google Calendar event ID"
     )
+    # Occurrences of a series use the id of their instance of the series' recurring event
+    series = models.ForeignKey(
+        ReservationSeries,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='reservations'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ReservationQuerySet.as_manager()
+
     class Meta:
         ordering = ['-start_time']
         verbose_name = 'Reservation'
         verbose_name_plural = 'Reservations'
+        indexes = [
+            models.Index(
+                fields=['room', 'status', 'start_time', 'end_time'],
+                name='reservation_conflict_idx'
+            ),
+            # "My reservations": one user's upcoming bookings
+            models.Index(fields=['user', 'end_time', 'start_time'], name='reservation_user_end_idx'),
+            # Reconciliation joins remote calendar events to reservations by event id
+            models.Index(fields=['event_id'], name='reservation_event_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was booked when loaded so signal handlers can see what changed
+        instance._loaded_span = instance.booked_span()
+        return instance
+
+    def booked_span(self):
+        """(room_id, start_time, end_time) while this reservation holds the room, else None"""
+        fields = self.__dict__
+        if fields.get('status') != 'confirmed' or not fields.get('start_time') or not fields.get('end_time'):
+            return None
+        return fields.get('room_id'), fields['start_time'], fields['end_time']
 
     def __str__(self):
         """String representation of the reservation"""
-        room_name = settings.LAB_ROOMS[self.room_key]['name']
-        return f"{room_name} - {self.user.username} - {self.start_time.strftime('%Y-%m-%d %H:%M')}"
+        return f"{self.room_name} - {self.user.username} - {self.start_time.strftime('%Y-%m-%d %H:%M')}"
 
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
+        # Set calendar_id from the room if not already set
+        if not self.calendar_id and self.lab_room:
+            self.calendar_id = self.lab_room.calendar_id
 
-        # Set calendar_id from settings if not already set
-        if not self.calendar_id and self.room_key in settings.LAB_ROOMS:
-            self.calendar_id = settings.LAB_ROOMS[self.room_key]['calendar_id']
-
-        # Create or update Google Calendar event
+        # The calendar event is written later by the sync worker; here we only record
+        # the pending change in the same transaction as the reservation itself
+        action = None
         if self.status == 'confirmed':
-            calendar_api = GoogleCalendarAPI()
-            event_summary = f"Room Reservation - {self.room_name}"
-            event_description = f"Reserved by: {self.user.username}\nPurpose: {self.purpose}"
-
-            try:
-                if is_new or not self.event_id:
-                    # Create new event
-                    self.event_id = calendar_api.create_event(
-                        self.calendar_id,
-                        event_summary,
-                        self.start_time,
-                        self.end_time,
-                        event_description
-                    )
-                else:
-                    # Update existing event
-                    calendar_api.update_event(
-                        self.calendar_id,
-                        self.event_id,
-                        event_summary,
-                        self.start_time,
-                        self.end_time,
-                        event_description
-                    )
-            except Exception as e:
-                raise ValidationError(f"Calendar sync failed: {str(e)}")
-
-        super().save(*args, **kwargs)
+            if not self.event_id:
+                self.event_id = CalendarSyncTask.new_event_id()
+                action = CalendarSyncTask.CREATE
+            else:
+                action = CalendarSyncTask.UPDATE
+
+        try:
+            with transaction.atomic():
+                # PostgreSQL enforces this with an exclusion constraint; elsewhere the
+                # check runs inside the write transaction, right before the insert
+                if self.status == 'confirmed' and connection.vendor != 'postgresql' and self.has_conflicts():
+                    raise ValidationError("This time slot conflicts with an existing reservation.")
+                super().save(*args, **kwargs)
+                if action:
+                    CalendarSyncTask.enqueue(self, action)
+        except IntegrityError as e:
+            if RESERVATION_OVERLAP_CONSTRAINT in str(e):
+                raise ValidationError("This time slot conflicts with an existing reservation.")
+            raise
 
     def delete(self, *args, **kwargs):
-        # Delete Google Calendar event if it exists
-        if self.event_id:
-            try:
-                calendar_api = GoogleCalendarAPI()
-                calendar_api.delete_event(self.calendar_id, self.event_id)
-            except Exception as e:
-                # Log the error but continue with deletion
-                print(f"Failed to delete Google Calendar event: {str(e)}")
-
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            # Queue removal of the Google Calendar event if it exists
+            if self.event_id:
+                CalendarSyncTask.enqueue(self, CalendarSyncTask.DELETE)
+            return super().delete(*args, **kwargs)
 
     def cancel(self):
         """Cancel the reservation"""
         if self.status != 'cancelled':
-            # Delete Google Calendar event if it exists
-            if self.event_id:
-                try:
-                    calendar_api = GoogleCalendarAPI()
-                    calendar_api.delete_event(self.calendar_id, self.event_id)
+            with transaction.atomic():
+                # Queue removal of the Google Calendar event if it exists
+                if self.event_id:
+                    CalendarSyncTask.enqueue(self, CalendarSyncTask.DELETE)
                     self.event_id = ''
-                except Exception as e:
-                    raise ValidationError(f"Failed to cancel calendar event: {str(e)}")
 
-            self.status = 'cancelled'
-            self.save()
+                self.status = 'cancelled'
+                self.save()
             return True
         return False
 
+    def calendar_event_data(self):
+        """Summary and description used for the Google Calendar event"""
+        return {
+            'summary': f"Room Reservation - {self.room_name}",
+            'description': f"Reserved by: {self.user.username}\nPurpose: {self.purpose}",
+        }
+
     def clean(self):
         """Validate the reservation"""
-        if not self.start_time or not self.end_time:
-            raise ValidationError("Both start and end times are required.")
-
-        # Check if room_key is valid
-        if self.room_key not in settings.LAB_ROOMS:
-            raise ValidationError("Invalid room selection.")
-
-        # Check if end time is after start time
-        if self.end_time <= self.start_time:
-            raise ValidationError("End time must be after start time.")
-
-        # Check if start time is in the future
-        if self.start_time < timezone.now():
-            raise ValidationError("Cannot create reservations in the past.")
-
-        # Check if duration is within allowed limits (e.g., 4 hours maximum)
-        max_duration = timedelta(hours=4)
-        if (self.end_time - self.start_time) > max_duration:
-            raise ValidationError("Reservation duration cannot exceed 4 hours.")
+        validate_slot(self.lab_room, self.start_time, self.end_time)
 
         # Check for conflicts with existing reservations
-        conflicts = Reservation.objects.filter(
-            room_key=self.room_key,
-            status='confirmed',
-            start_time__lt=self.end_time,
-            end_time__gt=self.start_time
-        )
+        if self.has_conflicts():
+            raise ValidationError("This time slot conflicts with an existing reservation.")
 
-        # Exclude current reservation when checking conflicts (for updates)
-        if self.pk:
-            conflicts = conflicts.exclude(pk=self.pk)
+    def has_conflicts(self):
+        """Check whether another confirmed reservation overlaps this one"""
+        return Reservation.objects.overlapping(
+            self.room_id, self.start_time, self.end_time, exclude_pk=self.pk
+        ).exists()
 
-        if conflicts.exists():
-            raise ValidationError("This time slot conflicts with an existing reservation.")
+    @property
+    def lab_room(self):
+        """The reservation's room from the in-process room cache, without a query"""
+        return lab_rooms.get_by_id(self.room_id)
 
     @property
     def room_name(self):
         """Get the friendly name of the room"""
-        return settings.LAB_ROOMS[self.room_key]['name']
+        room = self.lab_room
+        return room.name if room else 'Unknown Room'
 
     @property
     def duration(self):
@@ -267,10 +610,10 @@ class Reservation(models.Model):
         )
 
     @classmethod
-    def get_upcoming_reservations(cls, room_key):
+    def get_upcoming_reservations(cls, room):
         """Get all upcoming reservations for a specific room"""
         return cls.objects.filter(
-            room_key=room_key,
+            room=room,
             status='confirmed',
             end_time__gte=timezone.now()
         ).order_by('start_time')
@@ -283,12 +626,149 @@ class Reservation(models.Model):
         ).order_by('-start_time')
 
     @classmethod
-    def is_room_available(cls, room_key, start_time, end_time):
+    def is_room_available(cls, room, start_time, end_time):
         """Check if a room is available during the specified time period"""
-        conflicts = cls.objects.filter(
-            room_key=room_key,
-            status='confirmed',
-            start_time__lt=end_time,
-            end_time__gt=start_time
+        return not cls.objects.overlapping(room, start_time, end_time).exists()
+
+
+class RoomOccupancy(models.Model):
+    """Bitmap of the booked 15 minute slots of one room on one local day"""
+    room = models.ForeignKey(
+        LabRoom,
+        on_delete=models.CASCADE,
+        related_name='occupancy'
+    )
+    day = models.DateField()
+    slots = models.BinaryField(max_length=12)
+
+    class Meta:
+        verbose_name = 'Room Occupancy'
+        verbose_name_plural = 'Room Occupancy'
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'day'], name='room_occupancy_room_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.room_id} {self.day}"
+
+    @staticmethod
+    def pack(bits):
+        return bits.to_bytes(12, 'little')
+
+    @staticmethod
+    def unpack(slots):
+        return int.from_bytes(bytes(slots), 'little')
+
+
+class CalendarSyncTask(models.Model):
+    """Outbox entry for a Google Calendar change that still has to be sent"""
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTION_CHOICES = [
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    ]
+
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    reservation = models.ForeignKey(
+        Reservation,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='sync_tasks'
+    )
+    series = models.ForeignKey(
+        ReservationSeries,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='sync_tasks'
+    )
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    calendar_id = models.CharField(max_length=255)
+    event_id = models.CharField(
+        max_length=255,
+        help_text="Google Calendar event ID, also the idempotency key for inserts"
+    )
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Calendar Sync Task'
+        verbose_name_plural = 'Calendar Sync Tasks'
+        indexes = [
+            models.Index(fields=['status', 'id'], name='calsync_status_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.action} {self.event_id} ({self.status})"
+
+    @staticmethod
+    def new_event_id():
+        """Client-side event id; hex digits are valid in Google's base32hex id alphabet"""
+        return uuid.uuid4().hex
+
+    @classmethod
+    def for_change(cls, reservation, action):
+        """Unsaved outbox entry for a reservation, or for a whole series as one recurring event"""
+        is_series = isinstance(reservation, ReservationSeries)
+        payload = {}
+        if action != cls.DELETE:
+            payload = reservation.calendar_event_data()
+            payload['start_time'] = reservation.start_time.isoformat()
+            payload['end_time'] = reservation.end_time.isoformat()
+            if is_series:
+                payload['recurrence'] = reservation.recurrence()
+
+        return cls(
+            reservation=None if is_series else reservation,
+            series=reservation if is_series else None,
+            action=action,
+            calendar_id=reservation.calendar_id,
+            event_id=reservation.event_id,
+            payload=payload,
         )
-        return not conflicts.exists()
+
+    @classmethod
+    def enqueue(cls, reservation, action):
+        """Record a pending calendar change for the reservation (or series)"""
+        task = cls.for_change(reservation, action)
+        task.save()
+        return task
+
+
+class CalendarSyncState(models.Model):
+    """Where the last reconciliation of one calendar got to"""
+    calendar_id = models.CharField(max_length=255, unique=True)
+    sync_token = models.TextField(
+        blank=True,
+        help_text="nextSyncToken of the last complete listing; empty forces a full listing"
+    )
+    synced_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Calendar Sync State'
+        verbose_name_plural = 'Calendar Sync States'
+
+    def __str__(self):
+        return self.calendar_id
@@ -0,0 +1,157 @@
+"""Pagination helpers.
+
+Keyset (seek) pagination for the inventory dashboard:
+
+Instead of OFFSET, each page asks for the rows after (or before) the last row
+it showed, which an index on the ordering columns answers in the same time
+whatever page the user is on. Cursors are opaque strings that carry the
+ordering they were made for, so one taken under a different sort order is
+ignored, as is one whose values do not fit the columns they stand for.
+"""
+import base64
+import json
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Dashboard orderings; every one ends with id so the sort order is total
+ORDERINGS = {
+    '': ('id',),
+    'low_to_high': ('quantity', 'id'),
+    'high_to_low': ('-quantity', '-id'),
+}
+
+# Best full-text matches first; needs the search_rank annotation from inventory.search
+RELEVANCE = 'relevance'
+KEYSETS = {**ORDERINGS, RELEVANCE: ('search_rank', 'id')}
+
+# Type of the value a cursor holds for each keyset column
+KEY_TYPES = {'id': int, 'quantity': int, 'search_rank': float}
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def encode_cursor(ordering_key, values):
+    data = json.dumps([ordering_key, list(values)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def _fits(name, value):
+    # JSON booleans decode to bool, which is an int subclass
+    if isinstance(value, bool):
+        return False
+    if KEY_TYPES[name] is float:
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    return isinstance(value, KEY_TYPES[name])
+
+
+def decode_cursor(ordering_key, cursor):
+    """Key values stored in the cursor, or None when it is missing, invalid or for another ordering"""
+    if not cursor:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_ordering, values = json.loads(data)
+    except (ValueError, TypeError):
+        return None
+    fields = KEYSETS[ordering_key]
+    if cursor_ordering != ordering_key or not isinstance(values, list) or len(values) != len(fields):
+        return None
+    if not all(_fits(field.lstrip('-'), value) for field, value in zip(fields, values)):
+        return None
+    return values
+
+
+def _seek(fields, values, forward):
+    """Rows strictly after `values` in the (field, ...) ordering, or strictly before when forward is False"""
+    condition = Q()
+    equal = Q()
+    for field, value in zip(fields, values):
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    # Bound the leading column too, so the database can start an index range scan at the cursor
+    name = fields[0].lstrip('-')
+    lookup = 'lte' if fields[0].startswith('-') == forward else 'gte'
+    return Q(**{f'{name}__{lookup}': values[0]}) & condition
+
+
+def _reverse(fields):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in fields]
+
+
+def keyset_page(queryset, ordering_key='', after=None, before=None, per_page=50):
+    """One page of `queryset` in the given dashboard ordering, starting after/before a cursor"""
+    ordering_key = ordering_key if ordering_key in KEYSETS else ''
+    fields = KEYSETS[ordering_key]
+    names = [field.lstrip('-') for field in fields]
+
+    before_values = decode_cursor(ordering_key, before)
+    after_values = None if before_values else decode_cursor(ordering_key, after)
+
+    if before_values:
+        # Walk backwards from the cursor, then put the rows back in display order
+        rows = list(queryset.filter(_seek(fields, before_values, forward=False)).order_by(*_reverse(fields))[:per_page + 1])
+        has_more = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        has_previous, has_next = has_more, True
+    else:
+        if after_values:
+            queryset = queryset.filter(_seek(fields, after_values, forward=True))
+        rows = list(queryset.order_by(*fields)[:per_page + 1])
+        items = rows[:per_page]
+        has_previous, has_next = after_values is not None, len(rows) > per_page
+
+    def cursor_for(item):
+        return encode_cursor(ordering_key, [getattr(item, name) for name in names])
+
+    return KeysetPage(
+        items,
+        next_cursor=cursor_for(items[-1]) if items and has_next else None,
+        previous_cursor=cursor_for(items[0]) if items and has_previous else None,
+    )
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator that remembers large counts for a short while.
+
+    Counting a long history costs a scan of the user's rows on every page
+    view. Once a count reaches PAGINATOR_CACHED_COUNT_THRESHOLD it is cached
+    under cache_key for PAGINATOR_CACHED_COUNT_TTL seconds, so the page total
+    may lag behind for that long; smaller counts are always exact.
+    """
+
+    def __init__(self, *args, cache_key=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_key = cache_key
+
+    @cached_property
+    def count(self):
+        if not self.cache_key:
+            return super().count
+        key = f'paginator-count:{self.cache_key}'
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            if count >= settings.PAGINATOR_CACHED_COUNT_THRESHOLD:
+                cache.set(key, count, settings.PAGINATOR_CACHED_COUNT_TTL)
+        return count
@@ -0,0 +1,188 @@
+"""N+1 and slow query detection for development and staging (QUERY_INSPECTOR=true).
+
+QueryInspectorMiddleware watches every statement a request runs through
+inspect_query, an execute wrapper on every connection that hands them to the
+request's RequestInspector (see metrics.record_query for why). Statements are
+fingerprinted by their SQL, which Django keeps apart from the parameters, with
+IN lists collapsed, so the same query for different rows shares a fingerprint.
+A fingerprint that runs QUERY_INSPECTOR_REPEAT_THRESHOLD times or more in one
+request is reported as an N+1 candidate, with where its statements came from:
+the template line being rendered and the innermost frame of this project's
+code. Statements slower than QUERY_INSPECTOR_SLOW_MS are reported with their
+EXPLAIN plan.
+
+Findings go to the inventory.querycheck logger, one JSON object per line, so
+the log of a whole load-test run can be ranked with rank_queries.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Django writes IN lookups as "IN (%s, %s, ...)" with one placeholder per value
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+# Our own wrappers are never where a query comes from
+INSTRUMENTATION = {os.path.abspath(__file__), os.path.abspath(metrics.__file__)}
+
+_inspector = ContextVar('query_inspector', default=None)
+
+
+def fingerprint(sql):
+    """(short hash, normalized SQL) shared by every run of the same query"""
+    normalized = IN_LIST.sub('(%s...)', sql)
+    return hashlib.md5(normalized.encode()).hexdigest()[:12], normalized
+
+
+def origin(frame):
+    """(template line, project code line) that led to the statement executing in frame; either may be None"""
+    project_dir = str(settings.BASE_DIR)
+    template = code = None
+    while frame is not None and not (template and code):
+        if template is None and frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            if token is not None:
+                template = f"{node.origin.template_name or node.origin.name}:{token.lineno}"
+        if code is None:
+            filename = os.path.abspath(frame.f_code.co_filename)
+            if filename.startswith(project_dir) and filename not in INSTRUMENTATION and 'site-packages' not in filename:
+                code = f"{os.path.relpath(filename, project_dir)}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return template, code
+
+
+def inspect_query(execute, sql, params, many, context):
+    inspector = _inspector.get()
+    if inspector is None:
+        return execute(sql, params, many, context)
+    return inspector(execute, sql, params, many, context)
+
+
+class RequestInspector:
+    """execute_wrapper that collects the statements of one request"""
+
+    def __init__(self):
+        self.statements = {}
+        self.slow = []
+        self._explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self._explaining:
+            return execute(sql, params, many, context)
+        began = time.perf_counter()
+        result = execute(sql, params, many, context)
+        elapsed_ms = (time.perf_counter() - began) * 1000
+
+        key, normalized = fingerprint(sql)
+        where = origin(sys._getframe(1))
+        entry = self.statements.setdefault(key, {'sql': normalized, 'count': 0, 'ms': 0.0, 'origins': Counter()})
+        entry['count'] += 1
+        entry['ms'] += elapsed_ms
+        entry['origins'][where] += 1
+        if elapsed_ms >= settings.QUERY_INSPECTOR_SLOW_MS:
+            self.slow.append({
+                'event': 'slow_query',
+                'fingerprint': key,
+                'sql': normalized,
+                'ms': round(elapsed_ms, 3),
+                'template': where[0],
+                'code': where[1],
+                'plan': self.explain(context['connection'], sql, params) if not many else None,
+            })
+        return result
+
+    def explain(self, connection, sql, params):
+        """EXPLAIN output for a SELECT, one line per row; None for other statements"""
+        if not sql.lstrip().upper().startswith('SELECT'):
+            return None
+        self._explaining = True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+                return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+        except DatabaseError as e:
+            return [f"EXPLAIN failed: {e}"]
+        finally:
+            self._explaining = False
+
+    def findings(self):
+        """N+1 candidates, then slow statements, as dicts ready to be logged"""
+        found = []
+        for key, entry in self.statements.items():
+            if entry['count'] < settings.QUERY_INSPECTOR_REPEAT_THRESHOLD:
+                continue
+            found.append({
+                'event': 'n_plus_one',
+                'fingerprint': key,
+                'sql': entry['sql'],
+                'count': entry['count'],
+                'ms': round(entry['ms'], 3),
+                'origins': [
+                    {'template': template, 'code': code, 'count': count}
+                    for (template, code), count in entry['origins'].most_common(3)
+                ],
+            })
+        return found + self.slow
+
+
+class QueryInspectorMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTOR:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        inspector = RequestInspector()
+        with self.watching(inspector):
+            response = self.get_response(request)
+        self.report(request, inspector)
+        return response
+
+    async def __acall__(self, request):
+        inspector = RequestInspector()
+        with self.watching(inspector):
+            response = await self.get_response(request)
+        self.report(request, inspector)
+        return response
+
+    @contextmanager
+    def watching(self, inspector):
+        token = _inspector.set(inspector)
+        try:
+            yield
+        finally:
+            _inspector.reset(token)
+
+    def report(self, request, inspector):
+        match = request.resolver_match
+        for finding in inspector.findings():
+            finding.update(
+                view=match.view_name if match else None,
+                view_func=match._func_path if match else None,
+                method=request.method,
+                path=request.path,
+            )
+            logger.warning(json.dumps(finding, sort_keys=True))
@@ -0,0 +1,256 @@
+"""Find and repair drift between local reservations and the remote calendars.
+
+Each calendar is listed page by page. After the first complete listing only
+the changes since the stored sync token are fetched. Every page is
+hash-joined on event id against the reservations and series that own those
+events, with one indexed query per side. The repairs are queued in the
+CalendarSyncTask outbox in bulk, so the sync worker sends them in batches
+with its usual retries and ordering. Only one page of events is held at a
+time. A full listing also keeps the ids it has seen, to find local bookings
+whose event never reached the calendar.
+
+Events with ids this app did not issue are left alone, as are changed
+occurrences of recurring events and anything the outbox still has to send.
+"""
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .calendar_sync import is_instance_id, is_issued_id
+from .google_calendar import CalendarAPIError, event_body
+from .models import CalendarSyncState, CalendarSyncTask, Reservation, ReservationSeries
+from .rooms import lab_rooms
+
+PAGE_SIZE = 500
+# Local ids are checked against a full listing in chunks of this size
+LOCAL_CHUNK = 2000
+# All that building or comparing an event body needs
+BOOKING_FIELDS = ('room_id', 'calendar_id', 'event_id', 'start_time', 'end_time', 'purpose', 'user__username')
+
+
+class ReconcileResult:
+    """What one reconciliation found, per kind of difference"""
+
+    def __init__(self, calendar_id):
+        self.calendar_id = calendar_id
+        self.full = False
+        self.checked = 0
+        self.orphaned = 0
+        self.missing = 0
+        self.changed = 0
+
+    @property
+    def repaired(self):
+        return self.orphaned + self.missing + self.changed
+
+    def __str__(self):
+        listing = "full" if self.full else "incremental"
+        return (
+            f"{self.calendar_id} ({listing}): {self.checked} event(s) checked, {self.orphaned} orphaned, "
+            f"{self.missing} missing, {self.changed} changed"
+        )
+
+
+def _instant(when):
+    return datetime.fromisoformat(when['dateTime']) if when.get('dateTime') else when.get('date')
+
+
+def fingerprint(event):
+    """The parts of an event body that a reservation decides, comparable across time zones"""
+    return (
+        event.get('summary') or '',
+        event.get('description') or '',
+        _instant(event.get('start', {})),
+        _instant(event.get('end', {})),
+        tuple(event.get('recurrence') or ()),
+    )
+
+
+def local_fingerprint(booking):
+    data = booking.calendar_event_data()
+    recurrence = booking.recurrence() if isinstance(booking, ReservationSeries) else None
+    return fingerprint(event_body(data['summary'], booking.start_time, booking.end_time, data['description'], recurrence))
+
+
+def calendar_ids():
+    """Calendars that reservations are synced to"""
+    return sorted({room.calendar_id for room in lab_rooms.all() if room.calendar_id})
+
+
+def _pending(event_ids):
+    return set(
+        CalendarSyncTask.objects.filter(status=CalendarSyncTask.PENDING, event_id__in=event_ids)
+        .values_list('event_id', flat=True)
+    )
+
+
+def _owners(calendar_id, event_ids):
+    """Confirmed single reservations and series that own the given event ids, keyed by event id"""
+    owners = {
+        reservation.event_id: reservation
+        for reservation in Reservation.objects.filter(
+            calendar_id=calendar_id, event_id__in=event_ids, status='confirmed', series__isnull=True
+        ).select_related('user').only(*BOOKING_FIELDS, 'status')
+    }
+    owners.update(
+        (series.event_id, series)
+        for series in ReservationSeries.objects.filter(calendar_id=calendar_id, event_id__in=event_ids)
+        .select_related('user')
+    )
+    return owners
+
+
+def _recreate(bookings):
+    """Outbox entries that put bookings back on the calendar under fresh event ids.
+
+    A removed event's id stays taken on Google's side, so a new id is used;
+    occurrences of a recreated series follow it to their new instance ids.
+    """
+    tasks = []
+    now = timezone.now()
+    for booking in bookings:
+        old_id = booking.event_id
+        booking.event_id = CalendarSyncTask.new_event_id()
+        if isinstance(booking, ReservationSeries):
+            booking.save(update_fields=['event_id'])
+            tasks.append(CalendarSyncTask.for_change(booking, CalendarSyncTask.CREATE))
+            tasks += _restore_occurrences(booking, old_id)
+        else:
+            Reservation.objects.filter(pk=booking.pk).update(event_id=booking.event_id, updated_at=now)
+            tasks.append(CalendarSyncTask.for_change(booking, CalendarSyncTask.CREATE))
+    return tasks
+
+
+def _restore_occurrences(series, old_id):
+    """Repoint a recreated series' occurrences and re-apply their cancellations and moves"""
+    occurrences = {}
+    for reservation in series.reservations.filter(status='confirmed').exclude(event_id=''):
+        reservation.event_id = series.event_id + reservation.event_id[len(old_id):]
+        occurrences[reservation.event_id] = reservation
+    Reservation.objects.bulk_update(occurrences.values(), ['event_id'])
+
+    tasks = []
+    for start, end in series.occurrences():
+        instance_id = series.instance_event_id(start)
+        reservation = occurrences.get(instance_id)
+        if reservation is None:
+            # Cancelled or deleted since the series was booked
+            tasks.append(CalendarSyncTask(
+                series=series, action=CalendarSyncTask.DELETE,
+                calendar_id=series.calendar_id, event_id=instance_id,
+            ))
+        elif (reservation.start_time, reservation.end_time) != (start, end):
+            tasks.append(CalendarSyncTask.for_change(reservation, CalendarSyncTask.UPDATE))
+    return tasks
+
+
+def reconcile_page(calendar_id, events, result, seen=None, dry_run=False):
+    """Compare one page of remote events with their local owners and queue the repairs"""
+    remote = {event['id']: event for event in events if not is_instance_id(event['id'])}
+    result.checked += len(remote)
+    if seen is not None:
+        seen.update(event_id for event_id, event in remote.items() if event.get('status') != 'cancelled')
+    if not remote:
+        return
+
+    # The page is the build side of the join; the outbox is already fixing anything pending
+    pending = _pending(remote)
+    owners = _owners(calendar_id, remote)
+    now = timezone.now()
+
+    tasks, lost = [], []
+    for event_id, event in remote.items():
+        if event_id in pending:
+            continue
+        owner = owners.get(event_id)
+        cancelled = event.get('status') == 'cancelled'
+        if owner is None:
+            if not cancelled and is_issued_id(event_id):
+                result.orphaned += 1
+                tasks.append(CalendarSyncTask(action=CalendarSyncTask.DELETE, calendar_id=calendar_id, event_id=event_id))
+        elif cancelled:
+            if _still_booked(owner, now):
+                result.missing += 1
+                lost.append(owner)
+        elif fingerprint(event) != local_fingerprint(owner):
+            result.changed += 1
+            tasks.append(CalendarSyncTask.for_change(owner, CalendarSyncTask.UPDATE))
+
+    if not dry_run:
+        with transaction.atomic():
+            CalendarSyncTask.objects.bulk_create(tasks + _recreate(lost))
+
+
+def _still_booked(owner, now):
+    """Only bookings that have not ended yet are worth putting back"""
+    if isinstance(owner, ReservationSeries):
+        return owner.reservations.filter(status='confirmed', end_time__gt=now).exists()
+    return owner.end_time > now
+
+
+def reconcile_unseen(calendar_id, seen, result, dry_run=False):
+    """After a full listing: recreate events of current bookings that the calendar does not have"""
+    now = timezone.now()
+    single = (
+        Reservation.objects.filter(calendar_id=calendar_id, status='confirmed', series__isnull=True, end_time__gt=now)
+        .exclude(event_id='').values_list('event_id', flat=True)
+    )
+    series = (
+        ReservationSeries.objects.filter(
+            calendar_id=calendar_id, reservations__status='confirmed', reservations__end_time__gt=now
+        ).exclude(event_id='').values_list('event_id', flat=True).distinct()
+    )
+    for queryset in (single, series):
+        chunk = []
+        for event_id in queryset.iterator(chunk_size=LOCAL_CHUNK):
+            if event_id not in seen:
+                chunk.append(event_id)
+            if len(chunk) == LOCAL_CHUNK:
+                _recreate_missing(calendar_id, chunk, result, dry_run)
+                chunk = []
+        _recreate_missing(calendar_id, chunk, result, dry_run)
+
+
+def _recreate_missing(calendar_id, event_ids, result, dry_run):
+    missing = set(event_ids) - _pending(event_ids) if event_ids else set()
+    if not missing:
+        return
+    result.missing += len(missing)
+    if not dry_run:
+        with transaction.atomic():
+            CalendarSyncTask.objects.bulk_create(_recreate(_owners(calendar_id, missing).values()))
+
+
+def reconcile_calendar(api, calendar_id, full=False, updated_min=None, page_size=PAGE_SIZE, dry_run=False):
+    """List one calendar (incrementally when a sync token is stored) and queue repairs; returns a ReconcileResult"""
+    state, _ = CalendarSyncState.objects.get_or_create(calendar_id=calendar_id)
+    sync_token = None if full or updated_min else state.sync_token or None
+    result = ReconcileResult(calendar_id)
+    result.full = sync_token is None and updated_min is None
+    seen = set() if result.full else None
+
+    page_token = None
+    while True:
+        try:
+            page = api.list_events(
+                calendar_id, sync_token=sync_token, updated_min=updated_min,
+                page_token=page_token, page_size=page_size
+            )
+        except CalendarAPIError as e:
+            if e.status == 410 and sync_token:
+                # The token expired; start over with a full listing
+                return reconcile_calendar(api, calendar_id, full=True, page_size=page_size, dry_run=dry_run)
+            raise
+        reconcile_page(calendar_id, page.events, result, seen, dry_run)
+        page_token = page.next_page_token
+        if not page_token:
+            break
+
+    if seen is not None:
+        reconcile_unseen(calendar_id, seen, result, dry_run)
+    if not dry_run:
+        state.sync_token = page.next_sync_token or ''
+        state.synced_at = timezone.now()
+        state.save()
+    return result
@@ -0,0 +1,126 @@
+"""Read replicas for the read-only views.
+
+DATABASE_REPLICA_URLS adds replica databases as replica1, replica2, ...
+Views that only read set replica_reads = True; ReplicaMiddleware lets their
+GET and HEAD requests read from one replica, picked per request. Everything
+else reads from and writes to the primary (default): other views, reads in a
+transaction (booking conflict checks run in one), and every read after the
+request has written something.
+
+Replicas lag behind the primary. After a request writes, the browser gets a
+cookie that keeps its reads on the primary for REPLICA_STICKY_SECONDS, so
+users see their own changes. Cache entries keyed by a version (cache.cached)
+are filled from the primary with primary(), or a lagging replica could store
+old rows under the new version.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Set on responses to requests that wrote; while present, reads go to the primary
+PIN_COOKIE = 'read_primary'
+
+_current = ContextVar('replica_request', default=None)
+
+
+class _RequestState:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+@contextmanager
+def replica_reads(alias=None):
+    """Track writes for the body, and let it read from alias until it writes"""
+    state = _RequestState()
+    state.replica = alias
+    token = _current.set(state)
+    try:
+        yield state
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def primary():
+    """Read from the primary within the body, even in a request that may use a replica"""
+    state = _current.get()
+    replica = state.replica if state else None
+    if state:
+        state.replica = None
+    try:
+        yield
+    finally:
+        if state:
+            state.replica = replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None or state.replica is None or state.wrote:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get the schema by replication
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with replica_reads() as state:
+            response = self.get_response(request)
+        return self.pin(request, response, state)
+
+    async def __acall__(self, request):
+        with replica_reads() as state:
+            response = await self.get_response(request)
+        return self.pin(request, response, state)
+
+    def pin(self, request, response, state):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                secure=request.is_secure(), httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        if (
+            getattr(view, 'replica_reads', False)
+            and request.method in ('GET', 'HEAD')
+            and PIN_COOKIE not in request.COOKIES
+        ):
+            _current.get().replica = random.choice(settings.DATABASE_REPLICAS)
@@ -0,0 +1,258 @@
+"""Room events as FullCalendar JSON, so the room calendar page needs no embedded Google Calendar.
+
+Reservations come straight from the database. Events that other people put
+on a room's calendar are merged in from a cached copy. The copy is refreshed
+in the background with incremental (sync token) listings once it is
+ROOM_EVENTS_REMOTE_TTL seconds old: in a thread, or under an ASGI server as a
+task on its event loop using the async calendar client. A request never waits
+for Google; until the first refresh lands it simply shows the reservations.
+
+The ETag is built from the database: the count, highest id and latest
+updated_at of the reservations in the range, which every worker reads alike.
+Together with a digest of the remote copy's events, it lets a revalidation
+that finds nothing new be answered with one aggregate query instead of
+serialising the reservations.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime, time as day_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils import timezone
+
+from .async_calendar import get_async_calendar_api
+from .calendar_sync import is_instance_id, is_issued_id
+from .google_calendar import get_calendar_api
+from .models import Reservation
+
+logger = logging.getLogger(__name__)
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+# Refresh tasks still running; the event loop itself only keeps weak references
+_tasks = set()
+
+
+def _remote_key(calendar_id):
+    return f'room-events:remote:{calendar_id}'
+
+
+def _moment(when):
+    """Aware datetime for a Google start/end, which holds either dateTime or an all-day date"""
+    if when.get('dateTime'):
+        return datetime.fromisoformat(when['dateTime'])
+    return timezone.make_aware(datetime.combine(datetime.fromisoformat(when['date']).date(), day_time.min))
+
+
+def remote_entry(event):
+    """(FullCalendar event, start timestamp, end timestamp) for a remote event; None for events we don't show"""
+    event_id = event['id']
+    # Our own events are shown from the reservations, and changed occurrences aren't expanded
+    if event.get('status') == 'cancelled' or is_issued_id(event_id) or is_instance_id(event_id):
+        return None
+    start, end = _moment(event['start']), _moment(event['end'])
+    data = {
+        'id': f'remote-{event_id}',
+        'title': event.get('summary') or 'Busy',
+        'start': event['start'].get('dateTime') or event['start']['date'],
+        'end': event['end'].get('dateTime') or event['end']['date'],
+        'allDay': 'date' in event['start'],
+        'editable': False,
+        'extendedProps': {'source': 'remote'},
+    }
+    rules = [line for line in event.get('recurrence') or () if line.startswith(('RRULE', 'EXDATE', 'RDATE'))]
+    if rules:
+        # Expanded into occurrences in the browser, by static/js/room_calendar.js
+        dtstart = start.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        data['rrule'] = '\n'.join([f'DTSTART:{dtstart}'] + rules)
+        data['duration'] = int((end - start).total_seconds() * 1000)
+        return data, start.timestamp(), None
+    return data, start.timestamp(), end.timestamp()
+
+
+def _merge_page(events, page):
+    """Apply one listing page to the cached events; True if any shown event changed"""
+    changed = False
+    for event in page.events:
+        shown = remote_entry(event)
+        if shown is not None:
+            events[event['id']] = shown
+            changed = True
+        elif events.pop(event['id'], None) is not None:
+            changed = True
+    return changed
+
+
+def _digest(events):
+    """Hash of the events' content; the same in every worker that holds the same events"""
+    return hashlib.md5(json.dumps(events, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _updated_entry(entry, events, changed, sync_token):
+    return {
+        'events': events,
+        'sync_token': sync_token,
+        'version': entry['version'] + (1 if changed else 0),
+        'digest': _digest(events) if changed or 'digest' not in entry else entry['digest'],
+        'fetched_at': time.time(),
+    }
+
+
+def refresh_remote_events(calendar_id, api=None):
+    """Bring the cached copy of a calendar's remote events up to date and return it"""
+    api = api or get_calendar_api()
+    entry = cache.get(_remote_key(calendar_id)) or {'events': {}, 'sync_token': None, 'version': 0}
+    events = dict(entry['events'])
+    changed = False
+    page_token = None
+    while True:
+        page = api.list_events(calendar_id, sync_token=entry['sync_token'], page_token=page_token)
+        changed = _merge_page(events, page) or changed
+        page_token = page.next_page_token
+        if not page_token:
+            break
+
+    entry = _updated_entry(entry, events, changed, page.next_sync_token)
+    cache.set(_remote_key(calendar_id), entry, timeout=None)
+    return entry
+
+
+async def arefresh_remote_events(calendar_id, api=None):
+    """refresh_remote_events() for coroutines, listing with the async calendar client"""
+    api = api or get_async_calendar_api()
+    entry = await cache.aget(_remote_key(calendar_id)) or {'events': {}, 'sync_token': None, 'version': 0}
+    events = dict(entry['events'])
+    changed = False
+    page_token = None
+    while True:
+        page = await api.list_events(calendar_id, sync_token=entry['sync_token'], page_token=page_token)
+        changed = _merge_page(events, page) or changed
+        page_token = page.next_page_token
+        if not page_token:
+            break
+
+    entry = _updated_entry(entry, events, changed, page.next_sync_token)
+    await cache.aset(_remote_key(calendar_id), entry, timeout=None)
+    return entry
+
+
+def _refresh_failed(calendar_id, error):
+    if getattr(error, 'status', None) == 410:
+        # The sync token expired; the next refresh starts over
+        cache.delete(_remote_key(calendar_id))
+    logger.warning("Could not refresh remote events of %s: %s", calendar_id, error)
+
+
+def _refresh_in_background(calendar_id):
+    try:
+        refresh_remote_events(calendar_id)
+    except Exception as e:
+        _refresh_failed(calendar_id, e)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(calendar_id)
+
+
+async def _arefresh_in_background(calendar_id):
+    try:
+        await arefresh_remote_events(calendar_id)
+    except Exception as e:
+        _refresh_failed(calendar_id, e)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(calendar_id)
+
+
+def _needs_refresh(calendar_id, entry):
+    """True if the copy is missing or stale and no refresh of it is running yet (the caller starts one)"""
+    if entry is not None and time.time() - entry['fetched_at'] < settings.ROOM_EVENTS_REMOTE_TTL:
+        return False
+    with _refreshing_lock:
+        start = calendar_id not in _refreshing
+        _refreshing.add(calendar_id)
+    return start
+
+
+def remote_events(calendar_id):
+    """The cached copy (or None), starting a background refresh if it is missing or stale"""
+    entry = cache.get(_remote_key(calendar_id))
+    if _needs_refresh(calendar_id, entry):
+        threading.Thread(target=_refresh_in_background, args=(calendar_id,), daemon=True).start()
+    return entry
+
+
+async def aremote_events(calendar_id):
+    """remote_events() for an ASGI server, whose event loop outlives the request and runs the refresh"""
+    entry = await cache.aget(_remote_key(calendar_id))
+    if _needs_refresh(calendar_id, entry):
+        task = asyncio.create_task(_arefresh_in_background(calendar_id))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+    return entry
+
+
+def etag(room, start, end, user, remote):
+    """Tag of the feed room_events() returns, from the state of its rows rather than a per-process counter"""
+    state = Reservation.objects.overlapping(room.pk, start, end).aggregate(
+        count=Count('pk'), last_id=Max('pk'), updated=Max('updated_at')
+    )
+    parts = (
+        room.pk, start.isoformat(), end.isoformat(), user.pk,
+        state['count'], state['last_id'], state['updated'] and state['updated'].isoformat(),
+        remote and remote.get('digest'),
+    )
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def room_events(room, start, end, user, remote=None):
+    """FullCalendar events for the room between start and end: its reservations plus remote events"""
+    events = []
+    reservations = (
+        Reservation.objects.overlapping(room.pk, start, end)
+        .select_related('user')
+        .only('start_time', 'end_time', 'purpose', 'status', 'room_id', 'user__username')
+        .order_by('start_time')
+    )
+    for reservation in reservations:
+        mine = reservation.user_id == user.pk
+        event = {
+            'id': f'reservation-{reservation.pk}',
+            'title': reservation.purpose.splitlines()[0][:80] if reservation.purpose else 'Reserved',
+            'start': timezone.localtime(reservation.start_time).isoformat(),
+            'end': timezone.localtime(reservation.end_time).isoformat(),
+            'editable': False,
+            'extendedProps': {'source': 'local', 'reservedBy': reservation.user.username, 'mine': mine},
+        }
+        if mine:
+            event['url'] = reverse('update_reservation', args=[reservation.pk])
+        events.append(event)
+
+    start_ts, end_ts = start.timestamp(), end.timestamp()
+    for data, event_start, event_end in (remote or {}).get('events', {}).values():
+        # Recurring events have no end here; the browser expands and clips them
+        if event_start < end_ts and (event_end is None or event_end > start_ts):
+            events.append(data)
+    return events
+
+
+def parse_range(start, end):
+    """Aware (start, end) from FullCalendar's ?start=&end= (dates or ISO 8601 times); this week by default"""
+    def moment(value):
+        # An unescaped '+' in the offset arrives as a space
+        parsed = datetime.fromisoformat(value.replace(' ', '+').replace('Z', '+00:00'))
+        return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+    if start:
+        start = moment(start)
+    else:
+        today = timezone.localdate()
+        start = timezone.make_aware(datetime.combine(today - timedelta(days=today.weekday()), day_time.min))
+    end = moment(end) if end else start + timedelta(days=7)
+    return start, end
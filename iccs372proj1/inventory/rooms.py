@@ -0,0 +1,48 @@
+"""In-process cache of the lab rooms.
+
+Rooms change rarely and are needed on almost every reservation page, so the
+whole table is loaded once and served from memory. Saving or deleting a room
+drops the cache in this process (see signals.py); other processes pick up the
+change after LAB_ROOM_CACHE_TTL seconds.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+
+class RoomCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms = None
+        self._loaded_at = 0
+
+    def _load(self):
+        ttl = getattr(settings, 'LAB_ROOM_CACHE_TTL', 60)
+        with self._lock:
+            if self._rooms is None or time.monotonic() - self._loaded_at >= ttl:
+                from .models import LabRoom
+
+                rooms = list(LabRoom.objects.order_by('name'))
+                self._rooms = (rooms, {room.key: room for room in rooms}, {room.pk: room for room in rooms})
+                self._loaded_at = time.monotonic()
+            return self._rooms
+
+    def all(self):
+        """Every room, ordered by name"""
+        return list(self._load()[0])
+
+    def get(self, key):
+        """Room with this key, or None"""
+        return self._load()[1].get(key)
+
+    def get_by_id(self, room_id):
+        """Room with this primary key, or None"""
+        return self._load()[2].get(room_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._rooms = None
+
+
+lab_rooms = RoomCache()
@@ -0,0 +1,73 @@
+"""Full-text search over inventory item names for the dashboard's q filter.
+
+The backend follows the database: SQLite uses the inventory_item_fts FTS5
+table (kept in sync by triggers), PostgreSQL a GIN-indexed tsvector
+expression, anything else falls back to a substring match. Every backend
+annotates matches with `search_rank`, where lower means more relevant.
+
+Both full-text backends match the same way: every word of the query has to
+appear, and the last one only as a prefix, since the user may still be
+typing. Quotes, OR and a leading - carry no special meaning on either.
+"""
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'inventory_item_fts'
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+class SQLiteSearch:
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        # Every term must match, the last one as a prefix since the user may still be typing
+        match = ' '.join(f'"{term}"' for term in terms[:-1])
+        match = f'{match} "{terms[-1]}"*'.strip()
+        table = queryset.model._meta.db_table
+        # Join the FTS table once so bm25() is computed in the same pass as the MATCH
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        ).annotate(search_rank=RawSQL(f'bm25({FTS_TABLE})', [], output_field=FloatField()))
+
+
+def prefix_tsquery(terms):
+    """tsquery text requiring every term, the last as a prefix; search_terms() leaves nothing to quote"""
+    return ' & '.join([*terms[:-1], f'{terms[-1]}:*'])
+
+
+class PostgresSearch:
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        # Same expression as the inventory_item_name_search GIN index, so the index is used
+        vector = SearchVector('name', config='simple')
+        search_query = SearchQuery(prefix_tsquery(search_terms(query)), config='simple', search_type='raw')
+        return queryset.annotate(search_vector=vector).filter(search_vector=search_query).annotate(
+            search_rank=-SearchRank(F('search_vector'), search_query)
+        )
+
+
+class SubstringSearch:
+    def search(self, queryset, query):
+        return queryset.filter(name__icontains=query).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearch,
+    'postgresql': PostgresSearch,
+}
+
+
+def search_items(queryset, query):
+    """Filter an InventoryItem queryset to full-text matches for query, annotated with search_rank"""
+    if not search_terms(query):
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+    vendor = connections[queryset.db].vendor
+    return BACKENDS.get(vendor, SubstringSearch)().search(queryset, query)
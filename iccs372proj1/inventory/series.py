@@ -0,0 +1,95 @@
+"""Booking a recurring reservation as a single unit.
+
+Every occurrence is checked against the room's confirmed bookings with one
+range query and a sorted sweep instead of one conflict query each. The
+occurrences are inserted with a single bulk_create, and the calendar gets one
+recurring event rather than one event per occurrence.
+"""
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .availability import refresh_spans
+from .models import RESERVATION_OVERLAP_CONSTRAINT, CalendarSyncTask, Reservation
+
+
+def merge_intervals(intervals):
+    """Union of (start, end) pairs sorted by start, as disjoint sorted intervals"""
+    merged = []
+    for start, end in intervals:
+        if merged and start < merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def find_conflicts(room_id, spans):
+    """The spans (sorted by start, non-overlapping) that a confirmed reservation in the room overlaps"""
+    if not spans:
+        return []
+    booked = merge_intervals(
+        Reservation.objects.overlapping(room_id, spans[0][0], spans[-1][1])
+        .order_by('start_time')
+        .values_list('start_time', 'end_time')
+    )
+
+    # Both lists are sorted and disjoint, so one pass over each is enough
+    conflicts = []
+    i = 0
+    for start, end in spans:
+        while i < len(booked) and booked[i][1] <= start:
+            i += 1
+        if i < len(booked) and booked[i][0] < end:
+            conflicts.append((start, end))
+    return conflicts
+
+
+def conflict_message(conflicts):
+    days = ', '.join(start.strftime('%Y-%m-%d') for start, _ in conflicts[:5])
+    more = f" and {len(conflicts) - 5} more" if len(conflicts) > 5 else ''
+    return f"These dates conflict with existing reservations: {days}{more}."
+
+
+def book_series(series):
+    """Validate a new series and book all its occurrences at once; returns the created reservations.
+
+    Raises ValidationError, and books nothing, if any occurrence conflicts.
+    """
+    series.full_clean(exclude=['user', 'room', 'count', 'event_id', 'calendar_id'])
+    spans = series.occurrences()
+    if not series.calendar_id and series.lab_room:
+        series.calendar_id = series.lab_room.calendar_id
+
+    try:
+        with transaction.atomic():
+            # Checked inside the write transaction, right before the insert; on PostgreSQL
+            # the exclusion constraint still has the final say
+            conflicts = find_conflicts(series.room_id, spans)
+            if conflicts:
+                raise ValidationError(conflict_message(conflicts))
+
+            series.count = len(spans)
+            series.event_id = CalendarSyncTask.new_event_id()
+            series.save()
+            reservations = Reservation.objects.bulk_create([
+                Reservation(
+                    user_id=series.user_id,
+                    room_id=series.room_id,
+                    calendar_id=series.calendar_id,
+                    start_time=start,
+                    end_time=end,
+                    purpose=series.purpose,
+                    status='confirmed',
+                    event_id=series.instance_event_id(start),
+                    series=series,
+                )
+                for start, end in spans
+            ])
+            CalendarSyncTask.enqueue(series, CalendarSyncTask.CREATE)
+            # bulk_create sends no post_save, so refresh the occupancy bitmaps here
+            refresh_spans({(series.room_id, start, end) for start, end in spans})
+    except IntegrityError as e:
+        if RESERVATION_OVERLAP_CONSTRAINT in str(e):
+            raise ValidationError("These dates conflict with existing reservations.")
+        raise
+    return reservations
@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .availability import refresh_spans
+from .cache import bump_inventory_version
+from .metrics import record_query
+from .models import Category, InventoryItem, LabRoom, Reservation
+from .querycheck import inspect_query
+from .rooms import lab_rooms
+from .suggest import suggestion_index
+
+
+@receiver(connection_created)
+def watch_queries(sender, connection, **kwargs):
+    """Let the request middleware see the statements of every connection, whichever thread opened it"""
+    for wrapper in (record_query, inspect_query):
+        if wrapper not in connection.execute_wrappers:
+            # Below any execute_wrapper() block already open, which pops the last wrapper when it ends
+            connection.execute_wrappers.insert(0, wrapper)
+
+
+@receiver(post_save, sender=Reservation)
+def update_occupancy_on_save(sender, instance, raw=False, **kwargs):
+    """Refresh the room-days a reservation left or entered; runs inside Reservation.save()'s transaction"""
+    if raw:
+        return
+    old_span = getattr(instance, '_loaded_span', None)
+    new_span = instance.booked_span()
+    if old_span != new_span:
+        refresh_spans({span for span in (old_span, new_span) if span})
+    instance._loaded_span = new_span
+
+
+@receiver(post_delete, sender=Reservation)
+def update_occupancy_on_delete(sender, instance, **kwargs):
+    spans = {getattr(instance, '_loaded_span', None), instance.booked_span()}
+    refresh_spans({span for span in spans if span})
+
+
+@receiver(post_save, sender=InventoryItem)
+def update_suggestions_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pk, name, user_id = instance.pk, instance.name, instance.user_id
+        transaction.on_commit(lambda: suggestion_index.update(pk, name, user_id))
+
+
+@receiver(post_delete, sender=InventoryItem)
+def update_suggestions_on_delete(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: suggestion_index.remove(pk))
+
+
+@receiver(post_save, sender=InventoryItem)
+@receiver(post_delete, sender=InventoryItem)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_dashboard_cache(sender, **kwargs):
+    # After commit, so a reader can't cache the old rows under the new version
+    transaction.on_commit(bump_inventory_version)
+
+
+@receiver(post_save, sender=LabRoom)
+@receiver(post_delete, sender=LabRoom)
+def invalidate_room_cache(sender, **kwargs):
+    transaction.on_commit(lab_rooms.invalidate)
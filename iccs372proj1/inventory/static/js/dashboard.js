@@ -0,0 +1,26 @@
+// Open and close the filter sidebar
+document.getElementById("filterButton").addEventListener("click", function() {
+    document.getElementById("filterSidebar").classList.toggle("open");
+});
+
+document.getElementById("closeSidebarButton").addEventListener("click", function() {
+    document.getElementById("filterSidebar").classList.remove("open");
+});
+
+// Picking a filter submits it through the hidden form, which keeps the other filter
+document.getElementById("quantityFilter").addEventListener("change", function(event) {
+    event.preventDefault();
+    document.getElementById("hiddenQuantityFilter").value = this.value;
+    document.getElementById("filterForm").submit();
+});
+
+document.getElementById("categoryFilter").addEventListener("change", function(event) {
+    event.preventDefault();
+    document.getElementById("hiddenCategoryFilter").value = this.value;
+    document.getElementById("filterForm").submit();
+});
+
+document.getElementById("clearFiltersButton").addEventListener("click", function() {
+    // The dashboard without any filters
+    window.location.href = document.getElementById("filterForm").action;
+});
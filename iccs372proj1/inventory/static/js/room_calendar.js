@@ -0,0 +1,67 @@
+const selector = document.getElementById('roomSelector');
+let calendar = null;
+
+function selectedOption() {
+    return selector.options[selector.selectedIndex];
+}
+
+// Recurring remote events arrive as one event with an rrule and a duration in milliseconds;
+// this turns them into their occurrences between start and end
+function expand(event, start, end) {
+    if (!event.rrule) {
+        return [event];
+    }
+    const {rrule: rules, duration, ...occurrence} = event;
+    const set = rrule.rrulestr(rules, {forceset: true});
+    // Occurrences that began before the range may still run into it
+    return set.between(new Date(start.getTime() - duration), end, true).map((begins) => ({
+        ...occurrence,
+        start: begins,
+        end: new Date(begins.getTime() + duration),
+    }));
+}
+
+function roomEvents(url) {
+    return function (info, success, failure) {
+        const query = new URLSearchParams({start: info.startStr, end: info.endStr});
+        // Events come from our own feed; the browser revalidates it with an ETag
+        fetch(`${url}?${query}`, {credentials: 'same-origin'})
+            .then((response) => response.ok ? response.json() : Promise.reject(new Error(response.statusText)))
+            .then((events) => success(events.flatMap((event) => expand(event, info.start, info.end))))
+            .catch(failure);
+    };
+}
+
+function changeRoom() {
+    const option = selectedOption();
+    if (!option) {
+        return;
+    }
+    calendar.removeAllEventSources();
+    calendar.addEventSource(roomEvents(option.dataset.eventsUrl));
+
+    // Update booking button URL; the button is only there when rooms are configured
+    const bookButton = document.getElementById('bookRoomButton');
+    if (bookButton) {
+        bookButton.href = option.dataset.bookUrl;
+    }
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+    calendar = new FullCalendar.Calendar(document.getElementById('calendar'), {
+        initialView: 'timeGridWeek',
+        firstDay: 1,
+        height: 600,
+        nowIndicator: true,
+        headerToolbar: {left: 'prev,next today', center: 'title', right: 'timeGridWeek,dayGridMonth'},
+        eventDidMount: function (info) {
+            const props = info.event.extendedProps;
+            if (props.reservedBy) {
+                info.el.title = `Reserved by ${props.reservedBy}`;
+            }
+        },
+    });
+    calendar.render();
+    selector.addEventListener('change', changeRoom);
+    changeRoom();
+});
@@ -0,0 +1,153 @@
+"""Stock movements: the only code that changes an item's quantity after it is created.
+
+Each movement applies its delta in SQL (quantity = quantity + n), so concurrent
+check-ins and check-outs add up instead of overwriting each other, and writes
+one row to the append-only StockMovement ledger in the same transaction. The
+same UPDATE keeps the item's is_low flag current, and crossing the threshold
+queues a LowStockAlert.
+Check-outs only succeed while enough stock is left; the guard is part of the
+UPDATE, so no row lock is needed. Setting an absolute count does need the
+current value and locks the row with select_for_update.
+
+Quantities at a point in time come from the newest StockSnapshot before it
+plus the movements after that snapshot, so the ledger is never replayed from
+the beginning. A snapshot is only taken while it holds the item's row lock:
+every movement updates that row in its own transaction, so none can be in
+flight with a lower id than the one the snapshot records.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .cache import bump_inventory_version
+from .models import InventoryItem, LowStockAlert, StockMovement, StockSnapshot, low_stock_expression
+
+# Items locked and snapshotted per transaction by take_snapshots()
+SNAPSHOT_CHUNK = 2000
+
+
+def _apply(item, delta, kind, user=None):
+    item_id = getattr(item, 'pk', item)
+    with transaction.atomic():
+        items = InventoryItem.objects.filter(pk=item_id)
+        if delta < 0:
+            items = items.filter(quantity__gte=-delta)
+        updated = items.update(
+            quantity=F('quantity') + delta,
+            is_low=low_stock_expression(delta),
+            last_updated=timezone.now(),
+        )
+        if not updated:
+            if not InventoryItem.objects.filter(pk=item_id).exists():
+                raise InventoryItem.DoesNotExist(f"Inventory item {item_id} does not exist.")
+            raise ValidationError("Not enough stock to remove %(count)d.", params={'count': -delta})
+        movement = StockMovement.objects.create(item_id=item_id, kind=kind, delta=delta, user=user)
+
+        # The row is ours until commit, so this reads exactly what the UPDATE wrote
+        quantity, threshold, is_low, last_updated = InventoryItem.objects.values_list(
+            'quantity', 'low_stock_threshold', 'is_low', 'last_updated'
+        ).get(pk=item_id)
+        if is_low and quantity - delta > threshold:
+            LowStockAlert.objects.create(item_id=item_id, quantity=quantity, threshold=threshold)
+        # update() skips post_save, so invalidate the dashboard here
+        transaction.on_commit(bump_inventory_version)
+
+    if isinstance(item, InventoryItem):
+        item.quantity, item.is_low, item.last_updated = quantity, is_low, last_updated
+        item._loaded_is_low = is_low
+    return movement
+
+
+def check_in(item, quantity, user=None):
+    """Add received stock"""
+    if quantity <= 0:
+        raise ValidationError("Check-in quantity must be positive.")
+    return _apply(item, quantity, StockMovement.CHECK_IN, user)
+
+
+def check_out(item, quantity, user=None):
+    """Remove stock that is taken out; fails if not enough is left"""
+    if quantity <= 0:
+        raise ValidationError("Check-out quantity must be positive.")
+    return _apply(item, -quantity, StockMovement.CHECK_OUT, user)
+
+
+def adjust(item, delta, user=None):
+    """Correct the quantity by a signed amount; returns None when delta is 0"""
+    if not delta:
+        return None
+    return _apply(item, delta, StockMovement.ADJUST, user)
+
+
+def set_quantity(item, quantity, user=None):
+    """Record a stock count: adjust by whatever the counted quantity differs from the current one"""
+    if quantity < 0:
+        raise ValidationError("Quantity cannot be negative.")
+    item_id = getattr(item, 'pk', item)
+    with transaction.atomic():
+        current = InventoryItem.objects.select_for_update().values_list('quantity', flat=True).get(pk=item_id)
+        return adjust(item, quantity - current, user)
+
+
+def set_threshold(item, threshold):
+    """Change an item's low-stock threshold and re-evaluate its flag against the stored quantity"""
+    item_id = getattr(item, 'pk', item)
+    with transaction.atomic():
+        InventoryItem.objects.filter(pk=item_id).update(low_stock_threshold=threshold)
+        InventoryItem.refresh_low_stock([item_id])
+        transaction.on_commit(bump_inventory_version)
+
+
+def record_opening(item, user=None):
+    """Ledger entry for the stock a new item was created with"""
+    if item.quantity:
+        return StockMovement.objects.create(item=item, kind=StockMovement.ADJUST, delta=item.quantity, user=user)
+    return None
+
+
+def quantity_at(item, when):
+    """Quantity of an item at a past moment"""
+    item_id = getattr(item, 'pk', item)
+    snapshot = StockSnapshot.objects.filter(item_id=item_id, taken_at__lte=when).order_by('-taken_at').first()
+    movements = StockMovement.objects.filter(item_id=item_id)
+    if snapshot is None:
+        # No snapshot that early: the ledger starts at zero for every item
+        base, movements = 0, movements.filter(created_at__lte=when)
+    else:
+        base, movements = snapshot.quantity, movements.filter(id__gt=snapshot.movement_id, created_at__lte=when)
+    return base + (movements.aggregate(total=Sum('delta'))['total'] or 0)
+
+
+def take_snapshots():
+    """Snapshot every item that moved since its last snapshot; returns how many were written"""
+    last_movement = StockMovement.objects.filter(item=OuterRef('pk')).order_by('-id').values('id')[:1]
+    last_snapshot = StockSnapshot.objects.filter(item=OuterRef('pk')).order_by('-taken_at').values('movement_id')[:1]
+    items = InventoryItem.objects.annotate(
+        last_movement=Subquery(last_movement),
+        last_snapshot=Subquery(last_snapshot),
+    ).filter(last_movement__isnull=False)
+
+    written, after = 0, 0
+    while True:
+        # Chunks keep the locks short; check-ins and check-outs of other items carry on
+        with transaction.atomic():
+            locked = list(
+                InventoryItem.objects.select_for_update().filter(pk__gt=after)
+                .order_by('pk').values_list('pk', flat=True)[:SNAPSHOT_CHUNK]
+            )
+            if not locked:
+                return written
+            # A new statement, read once the locks are granted: movements that were in flight
+            # have committed, and the quantity matches the ledger position it is stored with
+            now = timezone.now()
+            snapshots = [
+                StockSnapshot(item_id=item_id, quantity=quantity, movement_id=movement_id, taken_at=now)
+                for item_id, quantity, movement_id, snapshot_id in items.filter(pk__in=locked).values_list(
+                    'pk', 'quantity', 'last_movement', 'last_snapshot'
+                )
+                if movement_id != snapshot_id
+            ]
+            StockSnapshot.objects.bulk_create(snapshots)
+        written += len(snapshots)
+        after = locked[-1]
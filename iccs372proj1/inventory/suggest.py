@@ -0,0 +1,216 @@
+"""In-process autocomplete index for SearchSuggestions.
+
+Each user's names are kept in two sorted lists of (key, item id) pairs: one
+keyed by the whole lower-cased name and one by each word. A prefix lookup is
+a bisect plus a scan that stops after `limit` hits. Typo tolerance works on
+the word vocabulary rather than on items: a trigram map finds vocabulary
+words whose beginning looks like the query, and their items are then read
+from the word list. Model signals keep the index current for writes made in
+this process; it is also rebuilt every SUGGESTION_INDEX_TTL seconds to pick
+up writes made by other workers.
+
+One thread at a time rebuilds, reading the items without holding the lock,
+while the others keep answering from the old index (or wait for the first
+one). Changes that arrive during the rebuild are applied to the old index and
+replayed onto the new one before it is swapped in.
+"""
+import bisect
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+# Minimum trigram (Jaccard) similarity between the query and the start of a word
+FUZZY_THRESHOLD = 0.4
+
+
+def words(name):
+    return set(name.lower().split())
+
+
+def trigrams(text):
+    padded = f"  {text}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _prefixed(keys, prefix):
+    """Yield item ids whose key starts with prefix, in key order"""
+    i = bisect.bisect_left(keys, (prefix,))
+    while i < len(keys) and keys[i][0].startswith(prefix):
+        yield keys[i][1]
+        i += 1
+
+
+class _UserIndex:
+    def __init__(self, names=()):
+        self.names = dict(names)
+        self.name_keys = sorted((name.lower(), item_id) for item_id, name in self.names.items())
+        self.word_keys = sorted((word, item_id) for item_id, name in self.names.items() for word in words(name))
+        self.vocabulary = Counter(word for word, _ in self.word_keys)
+        self.grams = {}
+        for word in self.vocabulary:
+            self._add_word(word)
+
+    def _add_word(self, word):
+        for gram in trigrams(word):
+            self.grams.setdefault(gram, set()).add(word)
+
+    def add(self, item_id, name):
+        self.names[item_id] = name
+        bisect.insort(self.name_keys, (name.lower(), item_id))
+        for word in words(name):
+            bisect.insort(self.word_keys, (word, item_id))
+            self.vocabulary[word] += 1
+            if self.vocabulary[word] == 1:
+                self._add_word(word)
+
+    def remove(self, item_id):
+        name = self.names.pop(item_id, None)
+        if name is None:
+            return
+        self._discard(self.name_keys, (name.lower(), item_id))
+        for word in words(name):
+            self._discard(self.word_keys, (word, item_id))
+            self.vocabulary[word] -= 1
+            if not self.vocabulary[word]:
+                del self.vocabulary[word]
+                for gram in trigrams(word):
+                    self.grams.get(gram, set()).discard(word)
+
+    @staticmethod
+    def _discard(keys, key):
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+
+    def search(self, query, limit):
+        query = query.lower()
+        found = []
+
+        def take(item_ids):
+            for item_id in item_ids:
+                if len(found) >= limit:
+                    return
+                if item_id not in found:
+                    found.append(item_id)
+
+        # Ranked: whole-name prefix, then prefix of a later word, then close misspellings
+        take(_prefixed(self.name_keys, query))
+        take(_prefixed(self.word_keys, query))
+        if len(found) < limit and len(query) >= 4 and ' ' not in query:
+            for word in self._similar_words(query):
+                take(_prefixed(self.word_keys, word))
+        return [self.names[item_id] for item_id in found]
+
+    def _similar_words(self, query):
+        query_grams = trigrams(query)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.grams.get(gram, ()))
+        scored = []
+        for word, count in shared.items():
+            # Compare with the start of the word, since the user is still typing
+            word_grams = trigrams(word[:len(query)])
+            common = len(query_grams & word_grams)
+            similarity = common / (len(query_grams) + len(word_grams) - common)
+            if similarity >= FUZZY_THRESHOLD:
+                scored.append((-similarity, word))
+        return [word for _, word in sorted(scored)]
+
+
+class SuggestionIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built = threading.Condition(self._lock)
+        self._users = None
+        self._owner = {}
+        self._built_at = 0
+        self._rebuilding = False
+        # Changes made while a rebuild reads the items, replayed onto its result
+        self._pending = None
+        # Bumped by invalidate(), so a rebuild that started earlier is not swapped in
+        self._generation = 0
+
+    def _current(self):
+        """The index to search, rebuilt by this thread when it is missing or expired and nobody else is on it"""
+        ttl = getattr(settings, 'SUGGESTION_INDEX_TTL', 300)
+        with self._lock:
+            while True:
+                if self._users is not None and (self._rebuilding or time.monotonic() - self._built_at < ttl):
+                    return self._users
+                if not self._rebuilding:
+                    break
+                self._built.wait()
+            self._rebuilding = True
+            self._pending = []
+            generation = self._generation
+
+        try:
+            users, owner = self._load()
+        except BaseException:
+            with self._lock:
+                self._end_rebuild()
+            raise
+        with self._lock:
+            for change in self._pending:
+                self._apply(users, owner, *change)
+            if generation == self._generation:
+                self._users, self._owner, self._built_at = users, owner, time.monotonic()
+            self._end_rebuild()
+        return users
+
+    def _end_rebuild(self):
+        # Callers hold the lock
+        self._rebuilding = False
+        self._pending = None
+        self._built.notify_all()
+
+    @staticmethod
+    def _load():
+        from .models import InventoryItem
+
+        names, owner = {}, {}
+        for item_id, name, user_id in InventoryItem.objects.values_list('id', 'name', 'user_id').iterator():
+            names.setdefault(user_id, []).append((item_id, name))
+            owner[item_id] = user_id
+        return {user_id: _UserIndex(user_names) for user_id, user_names in names.items()}, owner
+
+    @staticmethod
+    def _apply(users, owner, item_id, name=None, user_id=None):
+        """Index an item under its new name, or drop it when name is None"""
+        old_user = owner.pop(item_id, None)
+        if old_user in users:
+            users[old_user].remove(item_id)
+        if name is not None:
+            users.setdefault(user_id, _UserIndex()).add(item_id, name)
+            owner[item_id] = user_id
+
+    def search(self, query, user_id, limit=5):
+        """Best matching item names of one user, prefix matches first, then close misspellings"""
+        users = self._current()
+        with self._lock:
+            index = users.get(user_id)
+            return index.search(query, limit) if index else []
+
+    def update(self, item_id, name, user_id):
+        self._change(item_id, name, user_id)
+
+    def remove(self, item_id):
+        self._change(item_id)
+
+    def _change(self, *change):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(change)
+            if self._users is not None:
+                self._apply(self._users, self._owner, *change)
+
+    def invalidate(self):
+        """Rebuild on next use, e.g. after bulk writes that bypass model signals"""
+        with self._lock:
+            self._users = None
+            self._generation += 1
+
+
+suggestion_index = SuggestionIndex()
@@ -1,3 +1,1506 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import warnings
+from datetime import datetime, time, timedelta
+from importlib import import_module
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, router, transaction
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.core.cache import cache
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.exceptions import ValidationError
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from google.auth.credentials import AnonymousCredentials
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from iccs372proj1.database import database_config
+
+from .alerts import send_pending_alerts
+from .async_calendar import AsyncGoogleCalendarAPI
+from .availability import FULL_DAY, free_slots, refresh_occupancy, slot_mask
+from .bench import regressions
+from .bulk import _iter_json_array, import_items
+from .cache import cache_stats, reset_cache_stats
+from .calendar_stub import start_stub_server
+from .calendar_sync import _settled, drain_outbox, task_operation
+from .fake_calendar import FakeCalendarAPI
+from .google_calendar import (
+    BATCH_SIZE, BatchResult, CalendarAPIError, GoogleCalendarAPI, get_calendar_api, reset_calendar_api, run_batch
+)
+from .metrics import PerformanceMiddleware, render_metrics
+from .reconcile import reconcile_calendar
+from .room_events import arefresh_remote_events, refresh_remote_events
+from .models import (
+    RESERVATION_OVERLAP_CONSTRAINT, CalendarSyncState, CalendarSyncTask, Category, InventoryItem, LabRoom, LowStockAlert,
+    Reservation, RoomOccupancy, StockMovement, StockSnapshot
+)
+from .pagination import ORDERINGS, RELEVANCE, keyset_page
+from .querycheck import QueryInspectorMiddleware, RequestInspector, fingerprint
+from .replicas import PIN_COOKIE, ReplicaMiddleware, primary, replica_reads
+from .rooms import lab_rooms
+from .search import prefix_tsquery, search_items, search_terms
+from .stock import check_in, check_out, quantity_at, record_opening, set_quantity, set_threshold, take_snapshots
+from .suggest import SuggestionIndex, suggestion_index
+from .views import AddItem, Dashboard
+
+# Maximum number of SQL queries each view may run, independent of how many rows it shows.
+# Raising a budget should be a deliberate decision made in review.
+QUERY_BUDGETS = {
+    # session, user, low-stock count, items (category joined), categories
+    'dashboard': 5,
+    # session, user; table, categories and low-stock count come from the cache
+    'dashboard_cached': 2,
+    # session, user, paginator count, page
+    'reservation_list': 4,
+}
+
+# For tests that render pages: the hashed storage needs a collectstatic manifest, these link the plain names
+UNHASHED_STORAGES = {
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(STORAGES=UNHASHED_STORAGES)
+class QueryBudgetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Room metadata is cached per process; load it up front so budgets only count per-request queries
+        lab_rooms.invalidate()
+        lab_rooms.all()
+        self.user = User.objects.create_user('budget', password='budget-pass')
+        self.client.force_login(self.user)
+
+    def assertWithinBudget(self, view_name, url):
+        with self.assertNumQueries(QUERY_BUDGETS[view_name]):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+
+class DashboardQueryBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        categories = [Category.objects.create(name=f'Category {n}') for n in range(3)]
+        InventoryItem.objects.bulk_create([
+            InventoryItem(name=f'Item {n}', quantity=n, category=categories[n % 3], user=self.user)
+            for n in range(30)
+        ])
+
+    def test_dashboard_query_count_does_not_grow_with_items(self):
+        response = self.assertWithinBudget('dashboard', reverse('dashboard'))
+        self.assertContains(response, 'Category 2')
+        self.assertContains(response, 'table-danger', count=4)
+
+    def test_filtered_dashboard_stays_within_budget(self):
+        category = Category.objects.get(name='Category 1')
+        url = f"{reverse('dashboard')}?q=Item&quantity_filter=low_to_high&category_filter={category.pk}"
+        self.assertWithinBudget('dashboard', url)
+
+
+class DashboardCacheTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        reset_cache_stats()
+        self.category = Category.objects.create(name='Glassware')
+        self.item = InventoryItem.objects.create(name='Beaker', quantity=10, category=self.category, user=self.user)
+
+    def test_repeat_views_are_served_from_cache(self):
+        self.assertWithinBudget('dashboard', reverse('dashboard'))
+        response = self.assertWithinBudget('dashboard_cached', reverse('dashboard'))
+        self.assertContains(response, 'Beaker')
+        self.assertContains(response, 'Glassware')
+        self.assertEqual(cache_stats()['item_table'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    @override_settings(DASHBOARD_CACHE_ENABLED=False)
+    def test_fragments_are_not_cached_when_workers_cannot_share_them(self):
+        self.client.get(reverse('dashboard'))
+        self.assertWithinBudget('dashboard', reverse('dashboard'))
+        self.assertEqual(cache_stats(), {})
+
+    def test_different_filters_are_cached_separately(self):
+        self.client.get(reverse('dashboard'))
+        # Only the table is rendered again; categories and the low-stock count are shared
+        with self.assertNumQueries(QUERY_BUDGETS['dashboard_cached'] + 1):
+            self.client.get(reverse('dashboard') + '?quantity_filter=low_to_high')
+
+    def test_item_and_category_changes_invalidate(self):
+        self.client.get(reverse('dashboard'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.quantity = 1
+            self.item.save()
+        response = self.assertWithinBudget('dashboard', reverse('dashboard'))
+        self.assertContains(response, 'table-danger')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Plasticware')
+        self.assertContains(self.client.get(reverse('dashboard')), 'Plasticware')
+
+    def test_stats_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse('dashboard_cache_stats')).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get(reverse('dashboard'))
+        self.assertIn('categories', self.client.get(reverse('dashboard_cache_stats')).json())
+
+
+@override_settings(PERF_SAMPLE_RATE=1, CALENDAR_BACKEND='inventory.fake_calendar.FakeCalendarAPI')
+class PerformanceMetricsTests(QueryBudgetTestCase):
+    def test_sampled_requests_report_server_timing(self):
+        response = self.client.get(reverse('dashboard'))
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{QUERY_BUDGETS["dashboard"]} queries"', timing)
+        self.assertIn('desc="0 calls"', timing)
+        self.assertRegex(timing, r'tpl;dur=[0-9.]+, total;dur=[0-9.]+$')
+
+        with override_settings(PERF_SAMPLE_RATE=0):
+            self.assertNotIn('Server-Timing', self.client.get(reverse('dashboard')))
+
+    def test_metrics_need_staff_or_the_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape-me'):
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+    def test_metrics_cover_views_queries_calendar_calls_and_cache(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get(reverse('dashboard'))
+        Reservation.objects.create(
+            user=self.user, room=lab_rooms.get('room1'), purpose='Metrics', status='confirmed',
+            start_time=timezone.now() + timedelta(days=1), end_time=timezone.now() + timedelta(days=1, hours=1),
+        )
+        FakeCalendarAPI.reset()
+        drain_outbox()
+
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('http_requests_total{method="GET",status="2xx",view="dashboard"}', metrics)
+        self.assertIn('http_request_duration_seconds_bucket{le="+Inf",view="dashboard"}', metrics)
+        self.assertRegex(metrics, r'http_sampled_db_queries_total\{view="dashboard"\} [1-9]')
+        self.assertIn('external_calls_total{operation="batch",service="calendar"}', metrics)
+        self.assertIn('dashboard_cache_misses_total{fragment="item_table"}', metrics)
+
+    def test_metrics_add_up_every_worker(self):
+        record = (
+            "import django; django.setup(); "
+            "from inventory.metrics import REQUESTS; REQUESTS.labels('dashboard', 'GET', '2xx').inc(3)"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory, DJANGO_SETTINGS_MODULE='iccs372proj1.settings')
+            for _ in range(2):
+                subprocess.run([sys.executable, '-c', record], cwd=settings.BASE_DIR, env=env, check=True)
+            with patch.dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory):
+                metrics = render_metrics()
+        self.assertIn('http_requests_total{method="GET",status="2xx",view="dashboard"} 6.0', metrics)
+
+
+class QueryInspectorTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        start = timezone.now() + timedelta(days=1)
+        for n in range(6):
+            owner = User.objects.create_user(f'owner{n}')
+            Reservation.objects.create(
+                user=owner, room=lab_rooms.get('room1'), purpose='Inspect', status='confirmed',
+                start_time=start + timedelta(hours=2 * n), end_time=start + timedelta(hours=2 * n + 1),
+            )
+
+    def test_fingerprints_ignore_parameters_and_in_list_length(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s)')[0],
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s, %s)')[0],
+        )
+
+    @override_settings(QUERY_INSPECTOR_REPEAT_THRESHOLD=5)
+    def test_repeated_statements_are_reported_with_the_template_line(self):
+        template = Template("{% for reservation in reservations %}\n{{ reservation.user.username }}{% endfor %}")
+        inspector = RequestInspector()
+        with connection.execute_wrapper(inspector):
+            template.render(Context({'reservations': Reservation.objects.all()}))
+
+        [finding] = [f for f in inspector.findings() if f['event'] == 'n_plus_one']
+        self.assertEqual(finding['count'], 6)
+        self.assertIn('"auth_user"', finding['sql'])
+        [origin] = finding['origins']
+        self.assertEqual(origin['template'], '<unknown source>:2')
+        self.assertTrue(origin['code'].startswith('inventory/tests.py:'))
+
+    @override_settings(QUERY_INSPECTOR_SLOW_MS=0)
+    def test_slow_statements_come_with_their_plan(self):
+        inspector = RequestInspector()
+        with connection.execute_wrapper(inspector):
+            list(Reservation.objects.filter(room__key='room1'))
+
+        [finding] = inspector.findings()
+        self.assertEqual(finding['event'], 'slow_query')
+        self.assertIn('(test_slow_statements_come_with_their_plan)', finding['code'])
+        self.assertTrue(any('inventory_reservation' in row for row in finding['plan']))
+
+    @override_settings(QUERY_INSPECTOR=True, QUERY_INSPECTOR_REPEAT_THRESHOLD=1, QUERY_INSPECTOR_SLOW_MS=10_000)
+    def test_findings_are_logged_per_request_and_ranked(self):
+        with self.assertLogs('inventory.querycheck', 'WARNING') as logs:
+            self.client.get(reverse('dashboard'))
+        findings = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual({finding['view'] for finding in findings}, {'dashboard'})
+        self.assertEqual(len(findings), QUERY_BUDGETS['dashboard'])
+
+        with tempfile.NamedTemporaryFile('w', suffix='.log') as log:
+            log.writelines(record.getMessage() + '\n' for record in logs.records)
+            log.flush()
+            out = StringIO()
+            call_command('rank_queries', log.name, '--top', '2', stdout=out)
+        self.assertIn(f'N+1 candidates ({QUERY_BUDGETS["dashboard"]} distinct)', out.getvalue())
+        self.assertIn('views: dashboard', out.getvalue())
+
+
+class ReservationListQueryBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        start = timezone.now() + timedelta(days=1)
+        rooms = list(LabRoom.objects.order_by('key'))
+        # bulk_create skips Reservation.save(), so no calendar sync is queued
+        Reservation.objects.bulk_create([
+            Reservation(
+                user=self.user,
+                room=rooms[n % 5],
+                start_time=start + timedelta(hours=n),
+                end_time=start + timedelta(hours=n, minutes=30),
+                purpose='Lab session',
+                status='confirmed',
+            )
+            for n in range(25)
+        ])
+
+    def test_reservation_list_counts_once(self):
+        response = self.assertWithinBudget('reservation_list', reverse('reservation_list') + '?page=2')
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(response.context['paginator'].num_pages, 3)
+        self.assertContains(response, 'Lab Room 3')
+
+    @override_settings(PAGINATOR_CACHED_COUNT_THRESHOLD=20)
+    def test_large_history_count_is_cached(self):
+        url = reverse('reservation_list') + '?status=confirmed'
+        self.client.get(url)
+        with self.assertNumQueries(QUERY_BUDGETS['reservation_list'] - 1):
+            response = self.client.get(url + '&page=3')
+        self.assertEqual(len(response.context['reservations']), 5)
+
+
+class DatabaseProfileTests(TestCase):
+    def test_sqlite_gets_wal_and_immediate_transactions(self):
+        config = database_config('sqlite:///app.sqlite3', conn_max_age=60, busy_timeout=7)
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertIn('PRAGMA journal_mode=WAL', config['OPTIONS']['init_command'])
+        self.assertEqual(config['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertEqual(config['OPTIONS']['timeout'], 7)
+
+    def test_postgres_pool_replaces_persistent_connections(self):
+        persistent = database_config('postgres://app:secret@db/app', conn_max_age=60)
+        self.assertEqual((persistent['CONN_MAX_AGE'], persistent['CONN_HEALTH_CHECKS']), (60, True))
+        self.assertNotIn('pool', persistent.get('OPTIONS', {}))
+
+        pooled = database_config('postgres://app:secret@db/app', conn_max_age=60, pool_size=8)
+        self.assertEqual(pooled['CONN_MAX_AGE'], 0)
+        self.assertEqual(pooled['OPTIONS']['pool']['max_size'], 8)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # TestCase would run every test in a transaction, which always reads from the primary
+    def route(self, method, view, cookies=None, write=False):
+        """Database a read in view would use, and the response"""
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        used = []
+
+        def get_response(request):
+            middleware.process_view(request, view.as_view(), (), {})
+            if write:
+                router.db_for_write(InventoryItem)
+            used.append(router.db_for_read(InventoryItem))
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(get_response)
+        response = middleware(request)
+        return used[0], response
+
+    def test_read_only_views_read_from_a_replica(self):
+        self.assertEqual(self.route('get', Dashboard)[0], 'replica1')
+        self.assertEqual(self.route('post', Dashboard)[0], 'default')
+        self.assertEqual(self.route('get', AddItem)[0], 'default')
+
+    def test_writes_pin_the_browser_to_the_primary(self):
+        alias, response = self.route('get', Dashboard, write=True)
+        self.assertEqual(alias, 'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+        self.assertEqual(self.route('get', Dashboard, cookies={PIN_COOKIE: '1'})[0], 'default')
+        self.assertNotIn(PIN_COOKIE, self.route('get', Dashboard)[1].cookies)
+
+    def test_transactions_and_cache_fills_read_from_the_primary(self):
+        with replica_reads('replica1'):
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Reservation), 'default')
+            with primary():
+                self.assertEqual(router.db_for_read(Category), 'default')
+            self.assertEqual(router.db_for_read(Category), 'replica1')
+
+
+@override_settings(STORAGES=UNHASHED_STORAGES)
+class StockMovementTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('stock', password='stock-pass')
+        self.client.force_login(self.user)
+        self.item = InventoryItem.objects.create(name='Pipette tips', quantity=10, user=self.user)
+        record_opening(self.item, self.user)
+
+    def ledger_total(self):
+        return StockMovement.objects.filter(item=self.item).aggregate(total=Sum('delta'))['total']
+
+    def test_movements_apply_deltas_and_keep_the_ledger_in_step(self):
+        check_in(self.item, 5, self.user)
+        check_out(self.item, 12, self.user)
+        self.assertEqual(self.item.quantity, 3)
+        with self.assertRaises(ValidationError):
+            check_out(self.item, 4, self.user)
+        self.assertEqual(InventoryItem.objects.get(pk=self.item.pk).quantity, 3)
+        self.assertEqual(self.ledger_total(), 3)
+
+        set_quantity(self.item, 8, self.user)
+        self.assertEqual(self.item.quantity, 8)
+        self.assertEqual(self.ledger_total(), 8)
+
+    def test_concurrent_edits_add_up(self):
+        url = reverse('edit-item', args=[self.item.pk])
+        # Both users opened the form while the quantity was 10
+        for quantity in (12, 7):
+            response = self.client.post(url, {
+                'name': 'Pipette tips', 'quantity': quantity, 'original_quantity': 10,
+                'category': Category.objects.create(name=f'Consumables {quantity}').pk,
+            })
+            self.assertRedirects(response, reverse('dashboard'))
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 9)
+        self.assertEqual(self.ledger_total(), 9)
+
+    def test_quantity_at_uses_the_latest_snapshot(self):
+        check_in(self.item, 5)
+        after_check_in = timezone.now()
+        take_snapshots()
+        check_out(self.item, 7)
+
+        self.assertEqual(quantity_at(self.item, after_check_in), 15)
+        self.assertEqual(quantity_at(self.item, timezone.now()), 8)
+        self.assertEqual(quantity_at(self.item, self.item.date_created - timedelta(seconds=1)), 0)
+        # Nothing moved since, so there is nothing new to snapshot
+        check_in(self.item, 1)
+        self.assertEqual(take_snapshots(), 1)
+        self.assertEqual(take_snapshots(), 0)
+
+    def test_snapshots_are_taken_in_locked_chunks(self):
+        others = [InventoryItem.objects.create(name=f'Tips {n}', quantity=0, user=self.item.user) for n in range(4)]
+        for n, item in enumerate(others, 1):
+            check_in(item, n)
+        with patch('inventory.stock.SNAPSHOT_CHUNK', 2):
+            # Per chunk: savepoint, lock, read, insert, release; then the empty last chunk
+            with self.assertNumQueries(3 * 5 + 3):
+                self.assertEqual(take_snapshots(), 5)
+        self.assertEqual(
+            dict(StockSnapshot.objects.values_list('item__name', 'quantity')),
+            {'Pipette tips': 10, 'Tips 0': 1, 'Tips 1': 2, 'Tips 2': 3, 'Tips 3': 4},
+        )
+
+    def test_ledger_is_append_only(self):
+        movement = StockMovement.objects.filter(item=self.item).first()
+        movement.delta = 100
+        with self.assertRaises(ValueError):
+            movement.save()
+
+
+@override_settings(STORAGES=UNHASHED_STORAGES)
+class LabRoomReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('booker', password='booker-pass')
+        self.client.force_login(self.user)
+        lab_rooms.invalidate()
+        day = timezone.localdate() + timedelta(days=2)
+        self.start = timezone.make_aware(datetime.combine(day, time(10)))
+
+    def tearDown(self):
+        # Rooms created here are rolled back, so don't leave them cached
+        lab_rooms.invalidate()
+
+    def book(self, room_key, start, minutes=60):
+        return self.client.post(reverse('create-reservation', args=[room_key]), {
+            'start_time': timezone.localtime(start).strftime('%Y-%m-%dT%H:%M'),
+            'end_time': timezone.localtime(start + timedelta(minutes=minutes)).strftime('%Y-%m-%dT%H:%M'),
+            'purpose': 'Titration practical',
+        })
+
+    def test_booking_links_the_room_and_checks_conflicts_per_room(self):
+        self.assertRedirects(self.book('room2', self.start), reverse('room-calendar'))
+        reservation = Reservation.objects.get()
+        room = LabRoom.objects.get(key='room2')
+        self.assertEqual(reservation.room, room)
+        self.assertEqual(reservation.calendar_id, room.calendar_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(reservation.room_name, 'Lab Room 2')
+
+        self.book('room2', self.start + timedelta(minutes=30))
+        self.book('room3', self.start + timedelta(minutes=30))
+        self.assertEqual(
+            sorted(Reservation.objects.values_list('room__key', flat=True)), ['room2', 'room3']
+        )
+
+        day = timezone.localdate(self.start).isoformat()
+        rooms = self.client.get(reverse('availability'), {'start': day, 'end': day}).json()['rooms']
+        free = {room['key']: room['free'] for room in rooms}
+        self.assertEqual(len(free['room1']), 1)
+        self.assertEqual(free['room2'][0]['end'], self.start.isoformat())
+
+    def test_unknown_or_unavailable_rooms_cannot_be_booked(self):
+        self.assertEqual(self.book('no-such-room', self.start).status_code, 404)
+        room = LabRoom.objects.get(key='room4')
+        room.is_available = False
+        with self.captureOnCommitCallbacks(execute=True):
+            room.save()
+        self.assertContains(self.book('room4', self.start), 'not available for booking')
+
+    def test_room_cache_follows_changes(self):
+        self.assertIsNone(lab_rooms.get('physics'))
+        with self.captureOnCommitCallbacks(execute=True):
+            LabRoom.objects.create(key='physics', name='Physics Lab')
+        self.assertEqual(lab_rooms.get('physics').name, 'Physics Lab')
+        self.assertContains(self.client.get(reverse('room-calendar')), 'Physics Lab')
+
+
+class ReservationConflictTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('conflicts', password='conflicts-pass')
+        lab_rooms.invalidate()
+        self.room = lab_rooms.get('room1')
+        day = timezone.localdate() + timedelta(days=5)
+        self.start = timezone.make_aware(datetime.combine(day, time(10)))
+        self.booked = self.reservation(0, 2)
+        self.booked.save()
+
+    def tearDown(self):
+        lab_rooms.invalidate()
+
+    def reservation(self, start_hours, end_hours, room=None):
+        return Reservation(
+            user=self.user, room=room or self.room, purpose='Conflict check', status='confirmed',
+            start_time=self.start + timedelta(hours=start_hours), end_time=self.start + timedelta(hours=end_hours),
+        )
+
+    def test_overlaps_are_rejected_and_back_to_back_bookings_allowed(self):
+        for start_hours, end_hours in ((1, 3), (-1, 1), (0.5, 1.5), (-1, 3)):
+            with self.assertRaises(ValidationError):
+                self.reservation(start_hours, end_hours).full_clean()
+            with self.assertRaises(ValidationError):
+                self.reservation(start_hours, end_hours).save()
+
+        self.reservation(2, 3).save()
+        self.reservation(-1, 0).save()
+        self.reservation(1, 3, room=lab_rooms.get('room2')).save()
+        # A reservation does not conflict with itself, and a cancelled one frees its slot
+        self.booked.full_clean()
+        self.booked.cancel()
+        self.reservation(0.5, 1.5).save()
+        self.assertEqual(Reservation.objects.confirmed().count(), 4)
+
+    def test_overlap_violation_becomes_a_validation_error(self):
+        violation = IntegrityError(
+            f'conflicting key value violates exclusion constraint "{RESERVATION_OVERLAP_CONSTRAINT}"'
+        )
+        with patch('django.db.models.Model.save', side_effect=violation):
+            with self.assertRaisesMessage(ValidationError, 'conflicts with an existing reservation'):
+                self.reservation(4, 5).save()
+
+        with patch('django.db.models.Model.save', side_effect=IntegrityError('NOT NULL constraint failed')):
+            with self.assertRaises(IntegrityError):
+                self.reservation(4, 5).save()
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('planner', password='planner-pass')
+        self.client.force_login(self.user)
+        lab_rooms.invalidate()
+        self.room = lab_rooms.get('room1')
+        self.day = timezone.localdate() + timedelta(days=2)
+
+    def tearDown(self):
+        lab_rooms.invalidate()
+
+    def at(self, hour, minute=0, days=0):
+        return timezone.make_aware(datetime.combine(self.day + timedelta(days=days), time(hour, minute)))
+
+    def reserve(self, start, end, status='confirmed'):
+        return Reservation.objects.create(
+            user=self.user, room=self.room, purpose='Assay', status=status, start_time=start, end_time=end
+        )
+
+    def bits(self, day):
+        return RoomOccupancy.unpack(RoomOccupancy.objects.get(room=self.room, day=day).slots)
+
+    def test_bitmaps_pack_every_slot_and_round_partial_slots_outward(self):
+        self.assertEqual(RoomOccupancy.unpack(RoomOccupancy.pack(FULL_DAY)), FULL_DAY)
+        self.assertEqual(len(RoomOccupancy.pack(FULL_DAY)), 12)
+        # 9:10 to 9:20 touches the 9:00 and 9:15 slots
+        self.assertEqual(slot_mask(self.day, self.at(9, 10), self.at(9, 20)), 0b11 << 36)
+        self.reserve(self.at(9, 10), self.at(9, 20))
+        self.reserve(self.at(23, 45), self.at(0, days=1))
+        self.assertEqual(self.bits(self.day), 0b11 << 36 | 1 << 95)
+        # Ending at midnight leaves the next day free
+        self.assertFalse(RoomOccupancy.objects.filter(day=self.day + timedelta(days=1)).exists())
+
+    def test_overnight_reservations_split_at_midnight(self):
+        self.reserve(self.at(23), self.at(1, days=1))
+        self.assertEqual(self.bits(self.day), 0b1111 << 92)
+        self.assertEqual(self.bits(self.day + timedelta(days=1)), 0b1111)
+
+        free = free_slots(self.day, self.day + timedelta(days=1), [self.room.pk])[self.room.pk]
+        self.assertEqual(free, [(self.at(0), self.at(23)), (self.at(1, days=1), self.at(0, days=2))])
+
+    def test_refresh_upserts_rows_and_drops_free_days(self):
+        reservation = self.reserve(self.at(10), self.at(11))
+        # A row another transaction already wrote is updated rather than inserted again
+        RoomOccupancy.objects.filter(room=self.room, day=self.day).update(slots=RoomOccupancy.pack(1))
+        refresh_occupancy(self.room.pk, [self.day])
+        self.assertEqual(self.bits(self.day), 0b1111 << 40)
+
+        reservation.cancel()
+        self.assertFalse(RoomOccupancy.objects.filter(room=self.room).exists())
+
+    def test_backfill_builds_bitmaps_for_existing_reservations(self):
+        self.reserve(self.at(10), self.at(11))
+        self.reserve(self.at(23), self.at(1, days=1))
+        self.reserve(self.at(14), self.at(15), status='cancelled')
+        expected = set(RoomOccupancy.objects.values_list('room_id', 'day', 'slots'))
+        RoomOccupancy.objects.all().delete()
+
+        backfill = import_module('inventory.migrations.0013_backfill_room_occupancy')
+        backfill.backfill_occupancy(django_apps, None)
+        self.assertEqual(set(RoomOccupancy.objects.values_list('room_id', 'day', 'slots')), expected)
+
+    def test_endpoint_lists_free_slots_per_room(self):
+        self.reserve(self.at(10), self.at(11, 30))
+        day = self.day.isoformat()
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('availability'), {'start': day, 'end': day})
+        data = response.json()
+        self.assertEqual(data['slot_minutes'], 15)
+        free = {room['key']: room['free'] for room in data['rooms']}
+        self.assertEqual(free['room1'], [
+            {'start': self.at(0).isoformat(), 'end': self.at(10).isoformat()},
+            {'start': self.at(11, 30).isoformat(), 'end': self.at(0, days=1).isoformat()},
+        ])
+        self.assertEqual(len(free['room2']), 1)
+
+        self.assertEqual(self.client.get(reverse('availability'), {'start': 'monday'}).status_code, 400)
+        too_long = {'start': day, 'end': (self.day + timedelta(days=31)).isoformat()}
+        self.assertEqual(self.client.get(reverse('availability'), too_long).status_code, 400)
+
+
+@override_settings(STORAGES=UNHASHED_STORAGES)
+class RecurringReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('weekly', password='weekly-pass')
+        self.client.force_login(self.user)
+        lab_rooms.invalidate()
+        self.room = lab_rooms.get('room1')
+        day = timezone.localdate() + timedelta(days=2)
+        self.start = timezone.make_aware(datetime.combine(day, time(14)))
+
+    def tearDown(self):
+        lab_rooms.invalidate()
+
+    def book_weekly(self, **repeat):
+        return self.client.post(reverse('create-reservation', args=['room1']), {
+            'start_time': timezone.localtime(self.start).strftime('%Y-%m-%dT%H:%M'),
+            'end_time': timezone.localtime(self.start + timedelta(hours=2)).strftime('%Y-%m-%dT%H:%M'),
+            'purpose': 'Weekly lab session',
+            'repeat': 'weekly',
+            **repeat,
+        })
+
+    def test_series_is_booked_in_one_go(self):
+        # Session, user, the form's first-date check, then a savepoint around: one conflict
+        # sweep, series, occurrences, calendar task and the occupancy refresh (read, load, insert)
+        with self.assertNumQueries(12):
+            response = self.book_weekly(repeat_every=1, occurrences=10)
+        self.assertRedirects(response, reverse('room-calendar'))
+
+        reservations = list(Reservation.objects.order_by('start_time'))
+        self.assertEqual(len(reservations), 10)
+        self.assertEqual(reservations[9].start_time - reservations[0].start_time, timedelta(weeks=9))
+        self.assertEqual(timezone.localtime(reservations[9].start_time).hour, 14)
+        self.assertEqual(RoomOccupancy.objects.filter(room=self.room).count(), 10)
+
+        task = CalendarSyncTask.objects.get()
+        series = reservations[0].series
+        self.assertEqual(task.series, series)
+        self.assertEqual(task.payload['recurrence'], ['RRULE:FREQ=WEEKLY;INTERVAL=1;COUNT=10'])
+        self.assertTrue(reservations[0].event_id.startswith(series.event_id + '_'))
+
+    def test_one_conflicting_date_rejects_the_whole_series(self):
+        Reservation.objects.create(
+            user=self.user, room=self.room, purpose='Exam', status='confirmed',
+            start_time=self.start + timedelta(weeks=3, hours=1),
+            end_time=self.start + timedelta(weeks=3, hours=3),
+        )
+        response = self.book_weekly(repeat_until=(self.start + timedelta(weeks=5)).date().isoformat())
+        conflict_day = timezone.localtime(self.start + timedelta(weeks=3)).strftime('%Y-%m-%d')
+        self.assertContains(response, f'conflict with existing reservations: {conflict_day}')
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    @override_settings(CALENDAR_BACKEND='inventory.fake_calendar.FakeCalendarAPI')
+    def test_series_syncs_as_one_recurring_event(self):
+        FakeCalendarAPI.reset()
+        self.book_weekly(occurrences=4)
+        occurrence = Reservation.objects.order_by('start_time')[1]
+        occurrence.cancel()
+
+        self.assertEqual(drain_outbox(), (1, 0))
+        # The cancelled occurrence waited for its recurring event to be created
+        self.assertEqual(drain_outbox(), (1, 0))
+        self.assertEqual(len(FakeCalendarAPI.events), 1)
+        event = next(iter(FakeCalendarAPI.events.values()))
+        self.assertEqual(event['recurrence'], ['RRULE:FREQ=WEEKLY;INTERVAL=1;COUNT=4'])
+        self.assertEqual(list(event['exceptions'].values())[0]['status'], 'cancelled')
+
+
+class CountingCalendarAPI(FakeCalendarAPI):
+    """FakeCalendarAPI that counts how often it is built"""
+    built = 0
+
+    def __init__(self):
+        CountingCalendarAPI.built += 1
+        # A slow build gives other threads the chance to start one too
+        threading.Event().wait(0.02)
+
+
+@override_settings(CALENDAR_BACKEND='inventory.tests.CountingCalendarAPI')
+class CalendarClientTests(TestCase):
+    def setUp(self):
+        reset_calendar_api()
+        CountingCalendarAPI.built = 0
+
+    def tearDown(self):
+        reset_calendar_api()
+
+    def test_client_is_built_once_per_process(self):
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(get_calendar_api())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(CountingCalendarAPI.built, 1)
+        self.assertTrue(all(client is clients[0] for client in clients))
+        self.assertIsInstance(clients[0].api, CountingCalendarAPI)
+        self.assertIs(get_calendar_api(), clients[0])
+
+    def test_calendar_setting_changes_rebuild_the_client(self):
+        client = get_calendar_api()
+        with override_settings(LOW_QUANTITY=5):
+            self.assertIs(get_calendar_api(), client)
+        with override_settings(CALENDAR_BACKEND='inventory.fake_calendar.FakeCalendarAPI'):
+            self.assertIsInstance(get_calendar_api().api, FakeCalendarAPI)
+            self.assertNotIsInstance(get_calendar_api().api, CountingCalendarAPI)
+        # Leaving the override changes the setting back, and the client with it
+        self.assertIsNot(get_calendar_api(), client)
+        self.assertIsInstance(get_calendar_api().api, CountingCalendarAPI)
+
+
+class CalendarBatchTests(SimpleTestCase):
+    def run_scripted(self, operations, script):
+        """run_batch() over a chunk executor that answers each index with the statuses in script, in turn"""
+        chunks = []
+        attempts = {i: 0 for i in range(len(operations))}
+
+        def execute_chunk(operations, indexes, results):
+            chunks.append(list(indexes))
+            for i in indexes:
+                statuses = script.get(i, [])
+                status = statuses[attempts[i]] if attempts[i] < len(statuses) else None
+                attempts[i] += 1
+                if status is None:
+                    results[i] = BatchResult(event_id=operations[i]['event_id'])
+                else:
+                    results[i] = BatchResult(error=CalendarAPIError(f"status {status}", status))
+
+        return run_batch(execute_chunk, operations, retries=2, backoff=0), chunks, attempts
+
+    def test_only_transient_failures_are_sent_again(self):
+        operations = [{'action': 'update', 'event_id': f'event{i}'} for i in range(4)]
+        results, chunks, attempts = self.run_scripted(operations, {1: [503], 2: [404], 3: [429, 429, 429]})
+        self.assertEqual(chunks, [[0, 1, 2, 3], [1, 3], [3]])
+        self.assertEqual(attempts, {0: 1, 1: 2, 2: 1, 3: 3})
+
+        self.assertEqual([result.ok for result in results], [True, True, False, False])
+        self.assertEqual(results[1].event_id, 'event1')
+        self.assertEqual((results[2].status, results[2].retryable), (404, False))
+        self.assertEqual((results[3].status, results[3].retryable), (429, True))
+
+    def test_operations_are_sent_in_chunks_of_the_batch_limit(self):
+        operations = [{'action': 'delete', 'event_id': f'event{i}'} for i in range(BATCH_SIZE + 10)]
+        results, chunks, _ = self.run_scripted(operations, {BATCH_SIZE + 5: [500]})
+        self.assertEqual([len(chunk) for chunk in chunks], [BATCH_SIZE, 10, 1])
+        self.assertTrue(all(result.ok for result in results))
+
+
+@override_settings(CALENDAR_BACKEND='inventory.fake_calendar.FakeCalendarAPI')
+class CalendarOutboxTests(TestCase):
+    def setUp(self):
+        FakeCalendarAPI.reset()
+        self.api = FakeCalendarAPI()
+        self.user = User.objects.create_user('outbox', password='outbox-pass')
+        lab_rooms.invalidate()
+        self.room = lab_rooms.get('room1')
+        day = timezone.localdate() + timedelta(days=4)
+        self.start = timezone.make_aware(datetime.combine(day, time(9)))
+
+    def tearDown(self):
+        lab_rooms.invalidate()
+
+    def reserve(self, hours=0):
+        return Reservation.objects.create(
+            user=self.user, room=self.room, purpose='Outbox', status='confirmed',
+            start_time=self.start + timedelta(hours=hours), end_time=self.start + timedelta(hours=hours + 1),
+        )
+
+    def actions(self, event_id):
+        return list(CalendarSyncTask.objects.filter(event_id=event_id).values_list('action', 'status'))
+
+    def remote(self, event_id):
+        return FakeCalendarAPI.events.get((self.room.calendar_id, event_id))
+
+    def test_entries_being_sent_are_not_claimed_twice(self):
+        for n in range(3):
+            self.reserve(hours=2 * n)
+        overlapping = []
+
+        class Overlapping(FakeCalendarAPI):
+            def batch(api, operations, retries=2):
+                # Another sync_calendar process drains while this one is still sending
+                overlapping.append(drain_outbox(FakeCalendarAPI()))
+                return super().batch(operations, retries)
+
+        self.assertEqual(drain_outbox(Overlapping()), (3, 0))
+        self.assertEqual(overlapping, [(0, 0)])
+
+    def test_claims_of_a_worker_that_died_run_out(self):
+        self.reserve()
+        with patch.object(FakeCalendarAPI, 'batch', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                drain_outbox(self.api)
+        self.assertEqual(drain_outbox(self.api), (0, 0))
+        later = timezone.now() + timedelta(seconds=settings.CALENDAR_SYNC_CLAIM_SECONDS + 1)
+        with patch('inventory.calendar_sync.timezone.now', return_value=later):
+            self.assertEqual(drain_outbox(self.api), (1, 0))
+
+    def test_outbox_drains_through_the_stub_batch_endpoint(self):
+        server, endpoint = start_stub_server()
+        self.addCleanup(server.shutdown)
+        api = GoogleCalendarAPI(credentials=AnonymousCredentials(), api_endpoint=endpoint)
+        reservation = self.reserve()
+        self.assertEqual(drain_outbox(api), (1, 0))
+        key = (self.room.calendar_id, reservation.event_id)
+        self.assertEqual(server.events[key]['summary'], f'Room Reservation - {self.room.name}')
+
+        operation = task_operation(CalendarSyncTask.objects.get(event_id=reservation.event_id))
+        missing = dict(operation, action=CalendarSyncTask.UPDATE, event_id='0' * 32)
+        results = api.batch([operation, missing])
+        self.assertEqual([result.status for result in results], [409, 404])
+
+        reservation.delete()
+        self.assertEqual(drain_outbox(api), (1, 0))
+        self.assertNotIn(key, server.events)
+
+    def test_save_delete_and_cancel_enqueue_changes(self):
+        reservation = self.reserve()
+        event_id = reservation.event_id
+        reservation.purpose = 'Outbox, moved'
+        reservation.save()
+        reservation.delete()
+        pending = CalendarSyncTask.PENDING
+        self.assertEqual(
+            self.actions(event_id),
+            [(CalendarSyncTask.CREATE, pending), (CalendarSyncTask.UPDATE, pending), (CalendarSyncTask.DELETE, pending)],
+        )
+
+        cancelled = self.reserve(hours=2)
+        event_id = cancelled.event_id
+        self.assertTrue(cancelled.cancel())
+        self.assertEqual(cancelled.event_id, '')
+        self.assertEqual(self.actions(event_id), [(CalendarSyncTask.CREATE, pending), (CalendarSyncTask.DELETE, pending)])
+        # Nothing is sent until the outbox is drained
+        self.assertEqual(FakeCalendarAPI.calls, 0)
+
+    def test_changes_to_one_event_are_sent_one_at_a_time_in_order(self):
+        reservation = self.reserve()
+        event_id = reservation.event_id
+        reservation.purpose = 'Outbox, moved'
+        reservation.save()
+        reservation.delete()
+        other = self.reserve(hours=2)
+
+        # The oldest entry of each event goes out; the other event is not held up
+        self.assertEqual(drain_outbox(self.api), (2, 0))
+        self.assertIsNotNone(self.remote(event_id))
+        self.assertIsNotNone(self.remote(other.event_id))
+        self.assertNotIn('moved', self.remote(event_id)['description'])
+        self.assertEqual(drain_outbox(self.api), (1, 0))
+        self.assertIn('Purpose: Outbox, moved', self.remote(event_id)['description'])
+        self.assertEqual(drain_outbox(self.api), (1, 0))
+        self.assertIsNone(self.remote(event_id))
+        self.assertEqual(drain_outbox(self.api), (0, 0))
+
+    @override_settings(FAKE_CALENDAR_FAILURE_RATE=1, CALENDAR_SYNC_MAX_ATTEMPTS=2)
+    def test_failures_back_off_and_give_up_after_max_attempts(self):
+        reservation = self.reserve()
+        reservation.purpose = 'Outbox, moved'
+        reservation.save()
+
+        self.assertEqual(drain_outbox(self.api), (0, 1))
+        create = CalendarSyncTask.objects.get(action=CalendarSyncTask.CREATE)
+        self.assertEqual(create.attempts, 1)
+        self.assertGreater(create.next_attempt_at, timezone.now())
+        self.assertIn('unavailable', create.last_error)
+        # Backing off, and the update stays behind it
+        self.assertEqual(drain_outbox(self.api), (0, 0))
+
+        CalendarSyncTask.objects.filter(pk=create.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(drain_outbox(self.api), (0, 1))
+        create.refresh_from_db()
+        self.assertEqual(create.status, CalendarSyncTask.FAILED)
+        # The next change of the event may go now that the failed one is out of the way
+        with override_settings(FAKE_CALENDAR_FAILURE_RATE=0):
+            self.assertEqual(drain_outbox(self.api), (1, 0))
+
+    def test_entries_in_backoff_do_not_stall_the_outbox(self):
+        reservations = [self.reserve(hours=2 * n) for n in range(3)]
+        later = timezone.now() + timedelta(hours=1)
+        CalendarSyncTask.objects.filter(event_id__in=[r.event_id for r in reservations[:2]]).update(next_attempt_at=later)
+        self.assertEqual(drain_outbox(self.api, limit=2), (1, 0))
+        self.assertIsNotNone(self.remote(reservations[2].event_id))
+
+    def test_retried_insert_that_already_landed_is_settled(self):
+        reservation = self.reserve()
+        # The first attempt created the event but its response was lost
+        self.api.create_event(
+            self.room.calendar_id, 'Room Reservation - Lab Room 1', reservation.start_time,
+            reservation.end_time, event_id=reservation.event_id,
+        )
+        self.assertEqual(drain_outbox(self.api), (1, 0))
+        self.assertEqual(len(FakeCalendarAPI.events), 1)
+        self.assertEqual(self.actions(reservation.event_id), [(CalendarSyncTask.CREATE, CalendarSyncTask.DONE)])
+
+    def test_deleting_an_event_that_is_gone_is_settled(self):
+        reservation = self.reserve()
+        drain_outbox(self.api)
+        self.api.delete_event(self.room.calendar_id, reservation.event_id)
+        reservation.delete()
+        self.assertEqual(drain_outbox(self.api), (1, 0))
+
+        delete = {'action': CalendarSyncTask.DELETE}
+        self.assertTrue(_settled(delete, BatchResult(error=CalendarAPIError("Gone", 410))))
+        self.assertFalse(_settled(delete, BatchResult(error=CalendarAPIError("Unavailable", 503))))
+        self.assertFalse(_settled({'action': CalendarSyncTask.UPDATE}, BatchResult(error=CalendarAPIError("Conflict", 409))))
+
+
+@override_settings(CALENDAR_BACKEND='inventory.fake_calendar.FakeCalendarAPI')
+class CalendarReconcileTests(TestCase):
+    def setUp(self):
+        FakeCalendarAPI.reset()
+        self.api = FakeCalendarAPI()
+        self.user = User.objects.create_user('reconciler', password='reconciler-pass')
+        lab_rooms.invalidate()
+        self.room = lab_rooms.get('room1')
+        start = timezone.now() + timedelta(days=1)
+        self.reservations = [
+            Reservation.objects.create(
+                user=self.user, room=self.room, purpose=f'Session {n}', status='confirmed',
+                start_time=start + timedelta(hours=2 * n), end_time=start + timedelta(hours=2 * n + 1),
+            )
+            for n in range(3)
+        ]
+        drain_outbox(self.api)
+
+    def tearDown(self):
+        lab_rooms.invalidate()
+
+    def reconcile(self, **kwargs):
+        return reconcile_calendar(self.api, self.room.calendar_id, page_size=2, **kwargs)
+
+    def remote(self, event_id):
+        return FakeCalendarAPI.events.get((self.room.calendar_id, event_id))
+
+    def test_incremental_listing_repairs_drift(self):
+        result = self.reconcile()
+        self.assertTrue(result.full)
+        self.assertEqual((result.checked, result.repaired), (3, 0))
+
+        gone, edited, _ = [reservation.event_id for reservation in self.reservations]
+        calendar_id = self.room.calendar_id
+        start = self.reservations[1].start_time
+        self.api.delete_event(calendar_id, gone)
+        self.api.update_event(calendar_id, edited, 'Moved by hand', start, start + timedelta(hours=3))
+        orphan = self.api.create_event(calendar_id, 'Left behind', start, start + timedelta(hours=1), event_id='a' * 32)
+        self.api.create_event(calendar_id, 'Staff meeting', start, start + timedelta(hours=1), event_id='staffmeeting')
+
+        result = self.reconcile()
+        self.assertFalse(result.full)
+        self.assertEqual((result.checked, result.orphaned, result.missing, result.changed), (4, 1, 1, 1))
+        drain_outbox(self.api)
+
+        self.assertIsNone(self.remote(orphan))
+        self.assertIsNotNone(self.remote('staffmeeting'))
+        self.assertEqual(self.remote(edited)['summary'], 'Room Reservation - Lab Room 1')
+        recreated = Reservation.objects.get(pk=self.reservations[0].pk)
+        self.assertNotEqual(recreated.event_id, gone)
+        self.assertIsNotNone(self.remote(recreated.event_id))
+        # Our own repairs come back in the next listing and need nothing further
+        self.assertEqual(self.reconcile().repaired, 0)
+
+    def test_full_listing_finds_events_that_never_arrived(self):
+        start = timezone.now() + timedelta(days=2)
+        reservation = Reservation.objects.create(
+            user=self.user, room=self.room, purpose='Lost insert', status='confirmed',
+            start_time=start, end_time=start + timedelta(hours=1),
+        )
+        # The insert gave up, so the calendar has never heard of this event
+        CalendarSyncTask.objects.filter(reservation=reservation).update(status=CalendarSyncTask.FAILED)
+        CalendarSyncState.objects.create(calendar_id=self.room.calendar_id, sync_token='expired')
+
+        # The stale token is answered with 410, which falls back to a full listing
+        result = self.reconcile()
+        self.assertTrue(result.full)
+        self.assertEqual((result.missing, result.repaired), (1, 1))
+        self.assertEqual(self.reconcile(dry_run=True).repaired, 0)
+        drain_outbox(self.api)
+        reservation.refresh_from_db()
+        self.assertIsNotNone(self.remote(reservation.event_id))
+        self.assertEqual(self.reconcile(full=True).repaired, 0)
+
+
+class StaticAssetTests(TestCase):
+    @override_settings(STORAGES=UNHASHED_STORAGES)
+    def test_pages_load_only_our_own_static_files(self):
+        self.client.force_login(User.objects.create_user('assets'))
+        dashboard = self.client.get(reverse('dashboard')).content.decode()
+        self.assertIn('/static/vendor/bootswatch/minty/bootstrap.min.css', dashboard)
+        self.assertIn('/static/js/dashboard.js', dashboard)
+        calendar = self.client.get(reverse('room-calendar')).content.decode()
+        self.assertIn('/static/vendor/fullcalendar/index.global.min.js', calendar)
+        for page in (dashboard, calendar):
+            self.assertNotIn('https://', page)
+            self.assertNotIn('<style>', page)
+
+    def test_hashed_names_come_from_the_collectstatic_manifest(self):
+        with tempfile.TemporaryDirectory() as root:
+            storage = CompressedManifestStaticFilesStorage(location=root, base_url='/static/')
+            # Not collected yet: an error rather than an unversioned link
+            with self.assertRaises(ValueError):
+                storage.url('css/style.css')
+            storage.hashed_files = {'css/style.css': 'css/style.0123456789ab.css'}
+            self.assertEqual(storage.url('css/style.css'), '/static/css/style.0123456789ab.css')
+
+
+@override_settings(CALENDAR_BACKEND='inventory.fake_calendar.FakeCalendarAPI')
+class RoomEventsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        FakeCalendarAPI.reset()
+        self.user = User.objects.create_user('viewer', password='viewer-pass')
+        self.client.force_login(self.user)
+        lab_rooms.invalidate()
+        self.room = lab_rooms.get('room1')
+        day = timezone.localdate() + timedelta(days=1)
+        self.start = timezone.make_aware(datetime.combine(day, time(9)))
+        self.reservation = Reservation.objects.create(
+            user=self.user, room=self.room, purpose='Spectroscopy', status='confirmed',
+            start_time=self.start, end_time=self.start + timedelta(hours=1),
+        )
+        drain_outbox(FakeCalendarAPI())
+        FakeCalendarAPI().create_event(
+            self.room.calendar_id, 'Staff meeting', self.start + timedelta(hours=2),
+            self.start + timedelta(hours=3), event_id='staffmeeting'
+        )
+        refresh_remote_events(self.room.calendar_id)
+        self.url = reverse('room-events', args=['room1'])
+        self.range = {'start': (day - timedelta(days=1)).isoformat(), 'end': (day + timedelta(days=1)).isoformat()}
+
+    def tearDown(self):
+        lab_rooms.invalidate()
+
+    def test_feed_merges_reservations_and_remote_events(self):
+        response = self.client.get(self.url, self.range)
+        events = response.json()
+        # The reservation's own calendar event is not listed twice
+        self.assertEqual([event['title'] for event in events], ['Spectroscopy', 'Staff meeting'])
+        self.assertEqual(events[0]['url'], reverse('update_reservation', args=[self.reservation.pk]))
+        self.assertIn('max-age=15', response['Cache-Control'])
+
+        self.assertEqual(self.client.get(self.url, {'start': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('room-events', args=['nope'])).status_code, 404)
+
+    def test_unchanged_feed_revalidates_without_reading_reservations(self):
+        tag = self.client.get(self.url, self.range)['ETag']
+        # The session, the user and one aggregate over the reservations
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, self.range, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reservation.cancel()
+        response = self.client.get(self.url, self.range, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event['title'] for event in response.json()], ['Staff meeting'])
+
+        FakeCalendarAPI().delete_event(self.room.calendar_id, 'staffmeeting')
+        refresh_remote_events(self.room.calendar_id)
+        self.assertEqual(self.client.get(self.url, self.range).json(), [])
+
+    def test_etag_follows_the_database_in_every_worker(self):
+        tag = self.client.get(self.url, self.range)['ETag']
+        # A worker whose cache has its own copy of the remote events agrees on the tag
+        cache.clear()
+        refresh_remote_events(self.room.calendar_id)
+        self.assertEqual(self.client.get(self.url, self.range)['ETag'], tag)
+
+        # Another worker edits the reservation; nothing in this process hears of it
+        Reservation.objects.filter(pk=self.reservation.pk).update(
+            purpose='Mass spectrometry', updated_at=timezone.now() + timedelta(seconds=1)
+        )
+        response = self.client.get(self.url, self.range, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['title'], 'Mass spectrometry')
+
+        tag = response['ETag']
+        Reservation.objects.bulk_create([Reservation(
+            user=self.user, room=self.room, purpose='Late booking', status='confirmed',
+            start_time=self.start + timedelta(hours=4), end_time=self.start + timedelta(hours=5),
+        )])
+        self.assertEqual(self.client.get(self.url, self.range, HTTP_IF_NONE_MATCH=tag).status_code, 200)
+
+
+@override_settings(STORAGES=UNHASHED_STORAGES)
+class AsyncReservationViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('async-booker', password='booker-pass')
+        lab_rooms.invalidate()
+        day = timezone.localdate() + timedelta(days=3)
+        self.start = timezone.make_aware(datetime.combine(day, time(14)))
+
+    def tearDown(self):
+        lab_rooms.invalidate()
+
+    def form(self, start, purpose):
+        return {
+            'start_time': timezone.localtime(start).strftime('%Y-%m-%dT%H:%M'),
+            'end_time': timezone.localtime(start + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M'),
+            'purpose': purpose,
+        }
+
+    async def test_book_update_and_delete_from_the_event_loop(self):
+        url = reverse('create-reservation', args=['room1'])
+        response = await self.async_client.post(url, self.form(self.start, 'Chromatography'))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(reverse('login')))
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(url, self.form(self.start, 'Chromatography'))
+        self.assertRedirects(response, reverse('room-calendar'), fetch_redirect_response=False)
+        reservation = await Reservation.objects.aget(user=self.user)
+
+        # The conflict check runs too
+        response = await self.async_client.post(url, self.form(self.start + timedelta(minutes=30), 'Overlap'))
+        self.assertContains(response, 'conflicts with an existing reservation')
+
+        update = reverse('update_reservation', args=[reservation.pk])
+        response = await self.async_client.get(update)
+        self.assertContains(response, 'Lab Room 1')
+        later = self.form(self.start + timedelta(hours=2), 'Chromatography, second run')
+        response = await self.async_client.post(update, dict(later, status='confirmed'))
+        self.assertRedirects(response, reverse('reservation_list'), fetch_redirect_response=False)
+        await reservation.arefresh_from_db()
+        self.assertEqual(reservation.start_time, self.start + timedelta(hours=2))
+
+        await self.async_client.post(reverse('delete_reservation', args=[reservation.pk]))
+        self.assertFalse(await Reservation.objects.filter(pk=reservation.pk).aexists())
+        actions = [task.action async for task in CalendarSyncTask.objects.filter(event_id=reservation.event_id).order_by('id')]
+        self.assertEqual(actions, [CalendarSyncTask.CREATE, CalendarSyncTask.UPDATE, CalendarSyncTask.DELETE])
+
+    @override_settings(
+        PERF_SAMPLE_RATE=1, QUERY_INSPECTOR=True, QUERY_INSPECTOR_REPEAT_THRESHOLD=1, QUERY_INSPECTOR_SLOW_MS=10_000,
+    )
+    async def test_middleware_keeps_the_views_on_the_event_loop(self):
+        async def view(request):
+            return HttpResponse()
+
+        with override_settings(DATABASE_REPLICAS=['replica1']):
+            for middleware in (PerformanceMiddleware, QueryInspectorMiddleware, ReplicaMiddleware):
+                self.assertTrue(iscoroutinefunction(middleware(view)), middleware.__name__)
+
+        # The SQL the views hand to a thread is still timed and inspected
+        await self.async_client.aforce_login(self.user)
+        with self.assertLogs('inventory.querycheck', 'WARNING') as logs:
+            response = await self.async_client.get(reverse('create-reservation', args=['room1']))
+        self.assertEqual(response.status_code, 200)
+        queries = len(logs.records)
+        self.assertGreater(queries, 0)
+        self.assertIn(f'desc="{queries} queries"', response['Server-Timing'])
+        self.assertEqual({json.loads(record.getMessage())['view'] for record in logs.records}, {'create-reservation'})
+
+    async def test_remote_events_refresh_with_the_async_client(self):
+        server, endpoint = start_stub_server()
+        self.addCleanup(server.shutdown)
+        room = await sync_to_async(lab_rooms.get)('room1')
+        body = {
+            'id': 'seminar', 'summary': 'Seminar',
+            'start': {'dateTime': self.start.isoformat()}, 'end': {'dateTime': (self.start + timedelta(hours=1)).isoformat()},
+        }
+        server.events[(room.calendar_id, 'seminar')] = body
+        server.changes[(room.calendar_id, 'seminar')] = (1, self.start.isoformat())
+        server.change_count = 1
+
+        await cache.adelete(f'room-events:remote:{room.calendar_id}')
+        api = AsyncGoogleCalendarAPI(credentials=AnonymousCredentials(), api_endpoint=endpoint, concurrency=2)
+        entry = await arefresh_remote_events(room.calendar_id, api)
+        self.assertEqual(list(entry['events']), ['seminar'])
+        self.assertEqual(entry['sync_token'], '1')
+
+        # Nothing changed since the sync token, so the version stays
+        entry = await arefresh_remote_events(room.calendar_id, api)
+        self.assertEqual(entry['version'], 1)
+
+
+@override_settings(STORAGES=UNHASHED_STORAGES)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('pager', password='pager-pass')
+        # Plenty of equal quantities so the id tiebreak matters
+        InventoryItem.objects.bulk_create([
+            InventoryItem(name=f'Item {n}', quantity=n % 4, user=user) for n in range(23)
+        ])
+
+    def test_paging_forward_and_back_visits_every_item_once(self):
+        for ordering_key, fields in ORDERINGS.items():
+            expected = list(InventoryItem.objects.order_by(*fields).values_list('id', flat=True))
+
+            seen, page = [], keyset_page(InventoryItem.objects.all(), ordering_key, per_page=5)
+            seen += [item.id for item in page.items]
+            while page.has_next:
+                page = keyset_page(InventoryItem.objects.all(), ordering_key, after=page.next_cursor, per_page=5)
+                seen += [item.id for item in page.items]
+            self.assertEqual(seen, expected)
+
+            back = [item.id for item in page.items]
+            while page.has_previous:
+                page = keyset_page(InventoryItem.objects.all(), ordering_key, before=page.previous_cursor, per_page=5)
+                back = [item.id for item in page.items] + back
+            self.assertEqual(back, expected)
+
+    def test_cursor_from_another_ordering_starts_over(self):
+        page = keyset_page(InventoryItem.objects.all(), 'low_to_high', per_page=5)
+        restarted = keyset_page(InventoryItem.objects.all(), 'high_to_low', after=page.next_cursor, per_page=5)
+        first = keyset_page(InventoryItem.objects.all(), 'high_to_low', per_page=5)
+        self.assertEqual([i.id for i in restarted.items], [i.id for i in first.items])
+
+    def test_tampered_cursors_start_over(self):
+        first = [item.id for item in keyset_page(InventoryItem.objects.all(), 'low_to_high', per_page=5).items]
+        self.client.force_login(User.objects.get(username='pager'))
+        for values in (['abc', 1], [None, 'x'], [True, 1], [1.5, 2], [1, 2, 3], 'abc'):
+            cursor = base64.urlsafe_b64encode(json.dumps(['low_to_high', values]).encode()).decode()
+            page = keyset_page(InventoryItem.objects.all(), 'low_to_high', after=cursor, per_page=5)
+            self.assertEqual([item.id for item in page.items], first)
+            response = self.client.get(reverse('dashboard'), {'quantity_filter': 'low_to_high', 'after': cursor})
+            self.assertEqual(response.status_code, 200)
+
+
+class SearchSuggestionsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('suggest', password='suggest-pass')
+        other = User.objects.create_user('other', password='other-pass')
+        for name in ['Glass beaker', 'Beaker 250ml', 'Burette', 'Pipette tips']:
+            InventoryItem.objects.create(name=name, quantity=10, user=self.user)
+        InventoryItem.objects.create(name='Beaker rack', quantity=1, user=other)
+        suggestion_index.invalidate()
+        self.client.force_login(self.user)
+
+    def suggest(self, query):
+        response = self.client.get(reverse('search_suggestions'), {'q': query})
+        return [row['name'] for row in response.json()]
+
+    def test_prefix_matches_rank_whole_name_first(self):
+        self.assertEqual(self.suggest('bea'), ['Beaker 250ml', 'Glass beaker'])
+
+    def test_typos_still_match(self):
+        self.assertEqual(self.suggest('pipete'), ['Pipette tips'])
+
+    def test_index_follows_saves_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = InventoryItem.objects.create(name='Bunsen burner', quantity=2, user=self.user)
+        self.assertEqual(self.suggest('bun'), ['Bunsen burner'])
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(self.suggest('bun'), [])
+
+    def test_searches_are_answered_while_the_index_rebuilds(self):
+        self.assertEqual(self.suggest('bur'), ['Burette'])
+        burette = InventoryItem.objects.get(name='Burette')
+        # Read here: the rebuilding thread has its own connection, outside this test's transaction
+        snapshot = SuggestionIndex._load()
+        loading, release = threading.Event(), threading.Event()
+
+        def slow_load():
+            loading.set()
+            release.wait(5)
+            return snapshot
+
+        with patch.object(SuggestionIndex, '_load', side_effect=slow_load), override_settings(SUGGESTION_INDEX_TTL=0):
+            rebuild = threading.Thread(target=suggestion_index.search, args=('bur', self.user.pk))
+            rebuild.start()
+            self.assertTrue(loading.wait(5))
+            # Served from the old index instead of waiting for the rebuild
+            self.assertEqual(suggestion_index.search('bur', self.user.pk), ['Burette'])
+            suggestion_index.update(burette.pk, 'Burner', self.user.pk)
+            release.set()
+            rebuild.join()
+        # The rename made during the rebuild survived the swap
+        self.assertEqual(self.suggest('bur'), ['Burner'])
+
+
+class LowStockAlertTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alerts', password='alerts-pass')
+        self.item = InventoryItem.objects.create(name='Gloves', quantity=20, low_stock_threshold=5, user=self.user)
+
+    def test_flag_follows_movements_and_threshold(self):
+        self.assertFalse(self.item.is_low)
+        check_out(self.item, 15, self.user)
+        self.assertTrue(self.item.is_low)
+        self.assertTrue(InventoryItem.objects.get(pk=self.item.pk).is_low)
+        check_in(self.item, 1, self.user)
+        self.assertFalse(InventoryItem.objects.get(pk=self.item.pk).is_low)
+        set_threshold(self.item, 6)
+        self.assertTrue(InventoryItem.objects.get(pk=self.item.pk).is_low)
+
+    def test_alert_is_raised_once_per_crossing(self):
+        check_out(self.item, 15, self.user)
+        check_out(self.item, 2, self.user)
+        self.assertEqual(LowStockAlert.objects.filter(item=self.item).count(), 1)
+        check_in(self.item, 10, self.user)
+        check_out(self.item, 10, self.user)
+        self.assertEqual(LowStockAlert.objects.filter(item=self.item).count(), 2)
+
+    @override_settings(LOW_STOCK_ALERT_RECIPIENTS=['lab@example.com'])
+    def test_pending_alerts_go_out_as_one_digest(self):
+        restocked = InventoryItem.objects.create(name='Masks', quantity=20, low_stock_threshold=5, user=self.user)
+        check_out(self.item, 15, self.user)
+        check_in(self.item, 10, self.user)
+        check_out(self.item, 10, self.user)
+        check_out(restocked, 16, self.user)
+        check_in(restocked, 16, self.user)
+
+        self.assertEqual(send_pending_alerts(), (3, 1))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Gloves: 5 left (threshold 5)', mail.outbox[0].body)
+        self.assertNotIn('Masks', mail.outbox[0].body)
+        self.assertEqual(send_pending_alerts(), (0, 0))
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('search', password='search-pass')
+        InventoryItem.objects.bulk_create([
+            InventoryItem(name='Erlenmeyer flask 250ml', quantity=5, user=self.user),
+            InventoryItem(name='Flask', quantity=5, user=self.user),
+            InventoryItem(name='Flask brush', quantity=5, user=self.user),
+            InventoryItem(name='Test tube rack', quantity=5, user=self.user),
+        ])
+
+    def names(self, query):
+        items = search_items(InventoryItem.objects.all(), query)
+        return [item.name for item in keyset_page(items, RELEVANCE).items]
+
+    def test_matches_words_and_prefixes_ranked(self):
+        self.assertEqual(self.names('flask')[0], 'Flask')
+        self.assertCountEqual(self.names('fla'), ['Erlenmeyer flask 250ml', 'Flask', 'Flask brush'])
+        self.assertEqual(self.names('tube rack'), ['Test tube rack'])
+        self.assertEqual(self.names('%'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        item = InventoryItem.objects.get(name='Test tube rack')
+        item.name = 'Pipette stand'
+        item.save()
+        self.assertEqual(self.names('pipette'), ['Pipette stand'])
+        self.assertEqual(self.names('rack'), [])
+        item.delete()
+        self.assertEqual(self.names('pipette'), [])
+
+    def test_triggers_survive_migrations_and_cover_bulk_writes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("The FTS5 triggers are SQLite only")
+        # A later migration that rebuilds the table drops them silently; see 0010
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'inventory_inventoryitem'")
+            triggers = {name for name, in cursor.fetchall()}
+        self.assertEqual(triggers, {'inventory_item_fts_ai', 'inventory_item_fts_ad', 'inventory_item_fts_au'})
+
+        InventoryItem.objects.filter(name='Flask brush').update(name='Bottle brush')
+        self.assertEqual(self.names('bottle'), ['Bottle brush'])
+        InventoryItem.objects.filter(name='Bottle brush').delete()
+        self.assertEqual(self.names('brush'), [])
+
+    def test_every_term_must_match_and_only_the_last_as_a_prefix(self):
+        self.assertEqual(self.names('flask br'), ['Flask brush'])
+        self.assertEqual(self.names('fla brush'), [])
+        self.assertEqual(self.names('"flask" OR rack'), [])
+        self.assertEqual(prefix_tsquery(search_terms('Flask br')), 'flask & br:*')
+        self.assertEqual(prefix_tsquery(['tube']), 'tube:*')
+
+    def test_relevance_pages_cover_every_match(self):
+        items = search_items(InventoryItem.objects.all(), 'flask')
+        page = keyset_page(items, RELEVANCE, per_page=2)
+        rest = keyset_page(items, RELEVANCE, after=page.next_cursor, per_page=2)
+        self.assertEqual(len(page.items) + len(rest.items), 3)
+        self.assertFalse(rest.has_next)
+
+
+@override_settings(STORAGES=UNHASHED_STORAGES)
+class BulkImportExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bulk', password='bulk-pass')
+        InventoryItem.objects.create(name='Burette', quantity=1, user=self.user)
+        self.client.force_login(self.user)
+
+    def upload(self, name, content):
+        return self.client.post(reverse('import-items'), {'file': SimpleUploadedFile(name, content.encode())})
+
+    def test_csv_import_creates_updates_and_reports_bad_rows(self):
+        response = self.upload('items.csv', 'name,quantity,category\nburette,7,Glassware\nPipette,3,\n,4,\nFlask,-1,\n')
+        self.assertRedirects(response, reverse('dashboard'))
+        self.assertEqual(InventoryItem.objects.get(name='Burette').quantity, 7)
+        self.assertEqual(InventoryItem.objects.get(name='Burette').category.name, 'Glassware')
+        self.assertEqual(InventoryItem.objects.get(name='Pipette').quantity, 3)
+        self.assertFalse(InventoryItem.objects.filter(name='Flask').exists())
+
+    def test_malformed_csv_is_reported_as_a_form_error(self):
+        response = self.upload('items.csv', 'name,quantity\nPipette,3\n' + 'x' * (csv.field_size_limit() + 1) + ',1\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Could not read the file: field larger than field limit')
+        # Batches before the error are kept; this one was still being read
+        self.assertFalse(InventoryItem.objects.filter(name='Pipette').exists())
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write('name,quantity\n' + 'x' * (csv.field_size_limit() + 1) + ',1\n')
+            f.flush()
+            with self.assertRaisesMessage(CommandError, 'field larger than field limit'):
+                call_command('import_items', f.name, user='bulk')
+
+    def test_json_array_and_lines_import_in_batches(self):
+        records = [{'name': f'Item {n}', 'quantity': n, 'category': f'Category {n % 3}'} for n in range(25)]
+        # Per batch: savepoint, name lookup, category lookup, item insert, ledger insert, release;
+        # plus creating the categories once and alerting for the items that start low (all in batch 1)
+        with self.assertNumQueries(6 * 3 + 2 + 1):
+            result = import_items(iter(records), self.user, batch_size=10)
+        self.assertEqual((result.created, result.updated, result.failed), (25, 0, 0))
+
+        self.upload('items.json', json.dumps(records[:5], indent=2))
+        self.upload('items.jsonl', '\n'.join(json.dumps(r) for r in records[20:]))
+        self.assertEqual(InventoryItem.objects.count(), 26)
+
+    def test_rolled_back_batches_and_fractional_quantities_are_only_rejected(self):
+        records = [
+            {'name': 'Burette', 'quantity': 5},
+            {'name': 'Pipette', 'quantity': 3},
+            {'name': 'Beaker', 'quantity': 2.7},
+            {'name': 'Flask', 'quantity': '2.7'},
+            {'name': 'Cylinder', 'quantity': True},
+        ]
+        with patch.object(LowStockAlert.objects, 'bulk_create', side_effect=IntegrityError('duplicate name')):
+            result = import_items(iter(records), self.user)
+        self.assertEqual((result.created, result.updated, result.failed), (0, 0, 5))
+        self.assertEqual(InventoryItem.objects.get(name='Burette').quantity, 1)
+
+        result = import_items(iter(records), self.user)
+        self.assertEqual((result.created, result.updated, result.failed), (1, 1, 3))
+        self.assertEqual(InventoryItem.objects.get(name='Burette').quantity, 5)
+        self.assertFalse(InventoryItem.objects.filter(name__in=['Beaker', 'Flask', 'Cylinder']).exists())
+
+    def test_json_array_is_parsed_incrementally(self):
+        class Chunked:
+            def __init__(self, data):
+                self.data = data
+
+            def read(self, size):
+                chunk, self.data = self.data[:size], self.data[size:]
+                return chunk
+
+        text = json.dumps([{'name': 'A "quoted" name', 'quantity': 1}, {'name': 'B', 'quantity': 12345}, 678901])
+        records = list(_iter_json_array(Chunked(text), chunk_size=3))
+        self.assertEqual(records[2], 678901)
+        records = records[:2]
+        self.assertEqual([r['quantity'] for r in records], [1, 12345])
+
+    def test_export_round_trips(self):
+        InventoryItem.objects.create(name='Flask, 250ml', quantity=4, user=self.user)
+        response = self.client.get(reverse('export-items'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ['name,quantity,category', 'Burette,1,', '"Flask, 250ml",4,'])
+
+        response = self.client.get(reverse('export-items') + '?format=json')
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data[1], {'name': 'Flask, 250ml', 'quantity': 4, 'category': None})
+
+
+    async def test_export_streams_over_asgi(self):
+        await sync_to_async(InventoryItem.objects.create)(name='Flask, 250ml', quantity=4, user=self.user)
+        await self.async_client.aforce_login(self.user)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = await self.async_client.get(reverse('export-items'))
+            # As ASGIHandler sends it
+            content = b''.join([chunk async for chunk in response])
+        self.assertEqual(content.decode().splitlines(), ['name,quantity,category', 'Burette,1,', '"Flask, 250ml",4,'])
+        self.assertEqual([str(warning.message) for warning in caught if 'synchronous iterators' in str(warning.message)], [])
+
+
+class BenchBaselineTests(TestCase):
+    def result(self, p95_ms, queries):
+        return {'scales': {'small': {'routes': {'GET dashboard': {'count': 80, 'p95_ms': p95_ms, 'queries': queries}}}}}
+
+    def test_slower_routes_and_extra_queries_are_regressions(self):
+        baseline = self.result(40.0, 2)
+        self.assertEqual(regressions(baseline, self.result(47.0, 2)), [])
+        # 150% slower, but by less than floor_ms, which is noise
+        self.assertEqual(regressions(self.result(1.0, 2), self.result(2.5, 2)), [])
+        self.assertEqual(
+            regressions(baseline, self.result(60.0, 3)),
+            ['small GET dashboard: p95 40.0ms -> 60.0ms', 'small GET dashboard: 2 -> 3 queries per request'],
+        )
+        # Scales that the baseline didn't run are not compared
+        self.assertEqual(regressions({'scales': {}}, self.result(60.0, 3)), [])
@@ -1,6 +1,6 @@
 from django.urls import path, include, reverse_lazy
 from .views import (
-    Index, SignUpView, Dashboard, AddItem, EditItem, DeleteItem, SearchSuggestions, RoomCalendarView,
+    Index, SignUpView, Dashboard, DashboardCacheStats, MetricsView, AddItem, EditItem, DeleteItem, ImportItems, ExportItems, SearchSuggestions, RoomCalendarView, RoomEventsView, AvailabilityView,
     CreateReservationView, UpdateReservationView, DeleteReservationView, ReservationListView
 )
 from django.contrib.auth import views as auth_views
@@ -9,14 +9,20 @@ from . import views
 urlpatterns = [
     path('', Index.as_view(), name='index'),
     path('dashboard/', Dashboard.as_view(), name='dashboard'),
+    path('dashboard/cache-stats/', DashboardCacheStats.as_view(), name='dashboard_cache_stats'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('add-item/', AddItem.as_view(), name='add-item'),
     path('edit-item/<int:pk>', EditItem.as_view(), name='edit-item'),
     path('delete-item/<int:pk>', DeleteItem.as_view(), name='delete-item'),
+    path('import-items/', ImportItems.as_view(), name='import-items'),
+    path('export-items/', ExportItems.as_view(), name='export-items'),
     path('signup/', SignUpView.as_view(), name='signup'),
     path('login/', auth_views.LoginView.as_view(template_name='inventory/login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='index'), name='logout'),
     path('search_suggestions/', SearchSuggestions.as_view(), name='search_suggestions'),
     path('room-calendar/', RoomCalendarView.as_view(), name='room-calendar'),
+    path('rooms/<str:room_key>/events/', RoomEventsView.as_view(), name='room-events'),
+    path('availability/', AvailabilityView.as_view(), name='availability'),
     path('create-reservation/<str:room_key>/', CreateReservationView.as_view(), name='create-reservation'),
     path('reservation/<int:pk>/update/', UpdateReservationView.as_view(), name='update_reservation'),
     path('reservation/<int:pk>/delete/', DeleteReservationView.as_view(), name='delete_reservation'),
@@ -1,73 +1,127 @@
+import csv
+import inspect
+from datetime import date, timedelta
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth import authenticate, login
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
 from django.http import Http404
-from django.http import JsonResponse
-from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, render, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse_lazy
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
 from django.utils import timezone
+from django.utils.http import quote_etag
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.views.generic import TemplateView, View
 
-from .forms import UserRegisterForm, InventoryItemForm, ReservationForm
+from .availability import SLOT_MINUTES, free_slots
+from .bulk import astream, export_csv, export_json, import_items, read_records
+from .cache import cache_stats, cached, inventory_version
+from .forms import UserRegisterForm, InventoryItemForm, ItemImportForm, NewReservationForm, ReservationForm
+from .metrics import render_metrics
 from .models import InventoryItem, Category, Reservation
+from .pagination import RELEVANCE, CachedCountPaginator, keyset_page
+from .room_events import aremote_events, etag, parse_range, remote_events, room_events
+from .rooms import lab_rooms
+from .search import search_items
+from .series import book_series
+from .stock import adjust, record_opening, set_quantity, set_threshold
+from .suggest import suggestion_index
 
-LOW_QUANTITY = settings.LOW_QUANTITY
+DASHBOARD_PAGE_SIZE = 50
 
 from django.contrib import messages
 
+# Templates may query (crispy forms, lazy relations), so they render off the event loop
+arender = sync_to_async(render)
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """LoginRequiredMixin for views with async handlers; the session user is loaded without blocking"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Resolved up front, so the sync checks in LoginRequiredMixin don't query
+        request.user = await request.auser()
+        response = super().dispatch(request, *args, **kwargs)
+        # The redirect to the login page is a plain response, the handlers return coroutines
+        return await response if inspect.isawaitable(response) else response
+
 
 class Index(TemplateView):
     template_name = 'inventory/index.html'
 
 
 class Dashboard(LoginRequiredMixin, View):
+    # GET requests may read from a replica (see replicas.py)
+    replica_reads = True
+
     def get(self, request):
         search_query = request.GET.get('q', '')  # Get the search query from the URL
         quantity_filter = request.GET.get('quantity_filter', '')
         category_filter = request.GET.get('category_filter', '')
 
-        items = InventoryItem.objects.all().order_by('id')
+        after = request.GET.get('after')
+        before = request.GET.get('before')
+
+        # Fragments are cached per inventory version; any item or category change starts a new one
+        version = inventory_version()
+
+        def render_table():
+            # One query for the table, category joined in; is_low is stored on the row
+            items = InventoryItem.objects.select_related('category')
 
-        # Apply search functionality
-        if search_query:
-            items = items.filter(name__icontains=search_query)
+            # Apply full-text search; matches are listed by relevance unless a quantity order was picked
+            ordering_key = quantity_filter
+            if search_query:
+                items = search_items(items, search_query)
+                ordering_key = quantity_filter or RELEVANCE
 
-        # Apply category filter if selected
-        if category_filter:
-            items = items.filter(category_id=category_filter)
+            # Apply category filter if selected
+            if category_filter:
+                items = items.filter(category_id=category_filter)
 
-        # Apply quantity filter if selected
-        if quantity_filter == 'high_to_low':
-            items = items.order_by('-quantity')
-        elif quantity_filter == 'low_to_high':
-            items = items.order_by('quantity')
+            # Apply quantity filter (ordering) and fetch one page after/before the cursor
+            page = keyset_page(items, ordering_key, after=after, before=before, per_page=DASHBOARD_PAGE_SIZE)
+            return render_to_string(
+                'inventory/_item_table.html', {'items': page.items, 'page': page}, request=request
+            )
 
-        # Highlight low stock items
-        low_inventory = InventoryItem.objects.filter(
-            quantity__lte=LOW_QUANTITY
+        item_table = cached(
+            'item_table',
+            # The pagination links repeat the whole query string, so all of it is part of the key
+            (request.user.pk, sorted(request.GET.lists())),
+            render_table,
+            version,
         )
 
-        if low_inventory.count() > 0:
-            if low_inventory.count() > 1:
-                messages.error(request, f'{low_inventory.count()} items have low inventory')
-            else:
-                messages.error(request, f'{low_inventory.count()} item has low inventory')
+        # Highlight low stock items; the count reads the partial index on is_low
+        low_inventory_count = cached(
+            'low_stock_count', (),
+            lambda: InventoryItem.objects.filter(is_low=True).count(),
+            version,
+        )
 
-        low_inventory_ids = InventoryItem.objects.filter(
-            quantity__lte=LOW_QUANTITY
-        ).values_list('id', flat=True)
+        if low_inventory_count > 0:
+            if low_inventory_count > 1:
+                messages.error(request, f'{low_inventory_count} items have low inventory')
+            else:
+                messages.error(request, f'{low_inventory_count} item has low inventory')
 
         # Get all categories for the category filter dropdown
-        categories = Category.objects.all()
+        categories = cached('categories', (), lambda: list(Category.objects.all()), version)
 
         return render(
             request,
             'inventory/dashboard.html',
             {
-                'items': items,
-                'low_inventory_ids': low_inventory_ids,
+                'item_table': item_table,
                 'categories': categories,
                 'search': search_query,
                 'quantity_filter': quantity_filter,
@@ -76,6 +130,27 @@ class Dashboard(LoginRequiredMixin, View):
         )
 
 
+class DashboardCacheStats(LoginRequiredMixin, UserPassesTestMixin, View):
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        return JsonResponse(cache_stats())
+
+
+class MetricsView(View):
+    """Request, SQL, calendar and cache totals of every worker for Prometheus"""
+
+    def get(self, request):
+        if settings.METRICS_TOKEN:
+            allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}')
+        else:
+            allowed = request.user.is_staff
+        if not allowed:
+            return HttpResponseForbidden()
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class SignUpView(View):
     def get(self, request):
         form = UserRegisterForm()
@@ -118,7 +193,10 @@ class AddItem(LoginRequiredMixin, CreateView):
             messages.error(self.request, "Quantity cannot be negative.")
             return self.form_invalid(form)
         form.instance.user = self.request.user
-        return super().form_valid(form)
+        with transaction.atomic():
+            response = super().form_valid(form)
+            record_opening(self.object, self.request.user)
+        return response
 
 
 class EditItem(LoginRequiredMixin, UpdateView):
@@ -136,8 +214,25 @@ class EditItem(LoginRequiredMixin, UpdateView):
         if form.cleaned_data['quantity'] < 0:
             messages.error(self.request, "Quantity cannot be negative.")
             return self.form_invalid(form)
-        form.instance.user = self.request.user
-        return super().form_valid(form)
+        item = form.save(commit=False)
+        item.user = self.request.user
+        original = form.cleaned_data.get('original_quantity')
+        threshold_changed = 'low_stock_threshold' in form.changed_data
+        try:
+            with transaction.atomic():
+                item.save(update_fields=['name', 'category', 'user', 'last_updated'])
+                # The quantity changes by what this user changed it by, so concurrent edits add up
+                # instead of the last one overwriting the others
+                if original is None:
+                    set_quantity(item, form.cleaned_data['quantity'], self.request.user)
+                else:
+                    adjust(item, form.cleaned_data['quantity'] - original, self.request.user)
+                if threshold_changed:
+                    set_threshold(item, form.cleaned_data['low_stock_threshold'])
+        except ValidationError as e:
+            form.add_error('quantity', e)
+            return self.form_invalid(form)
+        return redirect(self.get_success_url())
 
 
 class DeleteItem(LoginRequiredMixin, DeleteView):
@@ -147,120 +242,239 @@ class DeleteItem(LoginRequiredMixin, DeleteView):
     context_object_name = 'item'
 
 
-class SearchSuggestions(LoginRequiredMixin, View):
+class ImportItems(LoginRequiredMixin, View):
     def get(self, request):
+        return render(request, 'inventory/import_items.html', {'form': ItemImportForm()})
+
+    def post(self, request):
+        form = ItemImportForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return render(request, 'inventory/import_items.html', {'form': form})
+
+        upload = form.cleaned_data['file']
+        try:
+            result = import_items(read_records(upload.file, form.cleaned_data['format']), request.user)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            # The file itself could not be parsed; batches before the error are kept
+            form.add_error('file', f"Could not read the file: {e}")
+            return render(request, 'inventory/import_items.html', {'form': form})
+
+        messages.success(request, f"Import finished: {result}")
+        for error in result.errors:
+            messages.warning(request, error)
+        return redirect('dashboard')
+
+
+class ExportItems(LoginRequiredMixin, View):
+    def get(self, request):
+        if request.GET.get('format') == 'json':
+            content, content_type, filename = export_json(), 'application/json', 'inventory.json'
+        else:
+            content, content_type, filename = export_csv(), 'text/csv', 'inventory.csv'
+        if isinstance(request, ASGIRequest):
+            # Django would read a sync iterator into a list before sending any of it
+            content = astream(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class SearchSuggestions(AsyncLoginRequiredMixin, View):
+    replica_reads = True
+
+    async def get(self, request):
         query = request.GET.get("q", "")
         if query:
-            items = InventoryItem.objects.filter(name__icontains=query, user=request.user).values("name")[:5]
-            return JsonResponse(list(items), safe=False)
+            # A (re)build of the index reads the user's items
+            names = await sync_to_async(suggestion_index.search)(query, request.user.id, limit=5)
+            return JsonResponse([{'name': name} for name in names], safe=False)
         return JsonResponse([], safe=False)
 
 
 class RoomCalendarView(LoginRequiredMixin, View):
+    replica_reads = True
+
     def get(self, request):
+        rooms = lab_rooms.all()
         context = {
-            'lab_rooms': settings.LAB_ROOMS,
-            'timezone': settings.TIME_ZONE,
-            'default_calendar_id': settings.LAB_ROOMS['room1']['calendar_id']
+            'lab_rooms': rooms,
+            'default_room': rooms[0] if rooms else None,
         }
         return render(request, 'inventory/room_calendar.html', context)
 
 
-class CreateReservationView(LoginRequiredMixin, View):
-    def get_lab_room(self, room_key):
-        if room_key not in settings.LAB_ROOMS:
+class RoomEventsView(AsyncLoginRequiredMixin, View):
+    """FullCalendar event feed for one room between ?start= and ?end=, revalidated with ETags"""
+    MAX_DAYS = 62
+
+    async def get(self, request, room_key):
+        room = await sync_to_async(lab_rooms.get)(room_key)
+        if room is None:
             raise Http404("Lab room not found")
-        room_data = settings.LAB_ROOMS[room_key]
-        return {
-            'name': room_data['name'],
-            'calendar_id': room_data['calendar_id'],
-            'key': room_key
-        }
+        try:
+            start, end = parse_range(request.GET.get('start'), request.GET.get('end'))
+        except ValueError:
+            return JsonResponse({'error': 'start and end must be ISO 8601 dates or times.'}, status=400)
+        if end <= start or end - start > timedelta(days=self.MAX_DAYS):
+            return JsonResponse({'error': f'The range must cover at most {self.MAX_DAYS} days.'}, status=400)
+
+        remote = None
+        if room.calendar_id and isinstance(request, ASGIRequest):
+            remote = await aremote_events(room.calendar_id)
+        elif room.calendar_id:
+            # Under WSGI the event loop ends with the request, so the refresh needs a thread
+            remote = await sync_to_async(remote_events)(room.calendar_id)
+        tag = await sync_to_async(etag)(room, start, end, request.user, remote)
+        # Answered before any reservation is read when the browser's copy is current
+        response = get_conditional_response(request, etag=quote_etag(tag))
+        if response is None:
+            events = await sync_to_async(room_events)(room, start, end, request.user, remote)
+            response = JsonResponse(events, safe=False)
+            response['ETag'] = quote_etag(tag)
+        patch_cache_control(response, private=True, max_age=settings.ROOM_EVENTS_MAX_AGE)
+        return response
+
+
+class AvailabilityView(LoginRequiredMixin, View):
+    """Free slots for every lab room between ?start= and ?end= (YYYY-MM-DD, inclusive)"""
+    MAX_DAYS = 31
+    replica_reads = True
+
+    def get(self, request):
+        try:
+            start = date.fromisoformat(request.GET.get('start') or timezone.localdate().isoformat())
+            end = date.fromisoformat(request.GET.get('end') or (start + timedelta(days=6)).isoformat())
+        except ValueError:
+            return JsonResponse({'error': 'Dates must be in YYYY-MM-DD format.'}, status=400)
+        if end < start or (end - start).days >= self.MAX_DAYS:
+            return JsonResponse({'error': f'The range must cover 1 to {self.MAX_DAYS} days.'}, status=400)
+
+        free = free_slots(start, end)
+        rooms = [
+            {
+                'key': room.key,
+                'name': room.name,
+                'free': [{'start': s.isoformat(), 'end': e.isoformat()} for s, e in free.get(room.pk, [])],
+            }
+            for room in lab_rooms.all()
+        ]
+        return JsonResponse({
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'slot_minutes': SLOT_MINUTES,
+            'rooms': rooms,
+        })
 
-    def get(self, request, room_key):
-        room = self.get_lab_room(room_key)
-        form = ReservationForm(initial={'room_key': room_key})  # Add initial value
-        return render(request, 'inventory/create_reservation.html', {
+
+class CreateReservationView(AsyncLoginRequiredMixin, View):
+    async def get_lab_room(self, room_key):
+        room = await sync_to_async(lab_rooms.get)(room_key)
+        if room is None:
+            raise Http404("Lab room not found")
+        return room
+
+    async def get(self, request, room_key):
+        room = await self.get_lab_room(room_key)
+        form = NewReservationForm()
+        return await arender(request, 'inventory/create_reservation.html', {
             'form': form,
             'room': room
         })
 
-    def post(self, request, room_key):
-        room = self.get_lab_room(room_key)
-        form = ReservationForm(request.POST)
+    async def post(self, request, room_key):
+        room = await self.get_lab_room(room_key)
+        # Set the room up front so model validation checks conflicts against the right room
+        form = NewReservationForm(request.POST, instance=Reservation(user=request.user, room=room))
+        # Validation checks the slot against the room's reservations
+        valid = await sync_to_async(form.is_valid)()
 
-        if form.is_valid():
+        series = form.series() if valid else None
+        if series is not None:
+            # All occurrences are checked and booked together, as one recurring calendar event
+            try:
+                reservations = await sync_to_async(book_series)(series)
+                messages.success(request, f"{len(reservations)} reservations created")
+                return redirect('room-calendar')
+            except ValidationError as e:
+                messages.error(request, ' '.join(e.messages))
+                return await arender(request, 'inventory/create_reservation.html', {
+                    'form': form,
+                    'room': room
+                })
+
+        if valid:
             reservation = form.save(commit=False)
             reservation.user = request.user
-            reservation.room_key = room_key
-            reservation.calendar_id = room['calendar_id']
+            reservation.room = room
+            reservation.calendar_id = room.calendar_id
             reservation.status = 'confirmed'  # Set status to confirmed
 
             try:
-                reservation.save()
+                await reservation.asave()
                 messages.success(request, "Reservation created successfully")
                 return redirect('room-calendar')
             except ValidationError as e:
                 messages.error(request, str(e))
-                return render(request, 'inventory/create_reservation.html', {
+                return await arender(request, 'inventory/create_reservation.html', {
                     'form': form,
                     'room': room
                 })
             except Exception as e:
                 messages.error(request, f"Error creating reservation: {str(e)}")
-                return render(request, 'inventory/create_reservation.html', {
+                return await arender(request, 'inventory/create_reservation.html', {
                     'form': form,
                     'room': room
                 })
 
-        return render(request, 'inventory/create_reservation.html', {
+        return await arender(request, 'inventory/create_reservation.html', {
             'form': form,
             'room': room
         })
 
 
-class UpdateReservationView(LoginRequiredMixin, View):
-    def get_object(self):
-        return get_object_or_404(Reservation, pk=self.kwargs['pk'], user=self.request.user)
+class UpdateReservationView(AsyncLoginRequiredMixin, View):
+    async def get_object(self):
+        return await aget_object_or_404(Reservation, pk=self.kwargs['pk'], user=self.request.user)
 
-    def get_room_name(self, room_key):
-        return settings.LAB_ROOMS.get(room_key, {}).get('name', 'Unknown Room')
-
-    def get(self, request, *args, **kwargs):
-        reservation = self.get_object()
+    async def get(self, request, *args, **kwargs):
+        reservation = await self.get_object()
         form = ReservationForm(instance=reservation)
-        return render(request, 'inventory/update_reservation.html', {
-            'form': form,
-            'reservation': reservation,
-            'room_name': self.get_room_name(reservation.room_key)  # Add this
-        })
+        return await self.render_form(request, form, reservation)
 
-    def post(self, request, *args, **kwargs):
-        reservation = self.get_object()
+    async def post(self, request, *args, **kwargs):
+        reservation = await self.get_object()
         form = ReservationForm(request.POST, instance=reservation)
-        if form.is_valid():
-            form.save()
-            messages.success(request, 'Reservation updated successfully.')
-            return redirect('reservation_list')  # or wherever you want to redirect
-        return render(request, 'inventory/update_reservation.html', {
+        if await sync_to_async(form.is_valid)():
+            try:
+                await sync_to_async(form.save)()
+                messages.success(request, 'Reservation updated successfully.')
+                return redirect('reservation_list')  # or wherever you want to redirect
+            except ValidationError as e:
+                form.add_error(None, e)
+        return await self.render_form(request, form, reservation)
+
+    async def render_form(self, request, form, reservation):
+        return await arender(request, 'inventory/update_reservation.html', {
             'form': form,
-            'reservation': reservation
+            'reservation': reservation,
+            # Read from the room cache, which is loaded on first use
+            'room_name': await sync_to_async(lambda: reservation.room_name)()
         })
 
 
-class DeleteReservationView(LoginRequiredMixin, View):
-    def get_object(self):
-        return get_object_or_404(Reservation, pk=self.kwargs['pk'], user=self.request.user)
+class DeleteReservationView(AsyncLoginRequiredMixin, View):
+    async def get_object(self):
+        return await aget_object_or_404(Reservation, pk=self.kwargs['pk'], user=self.request.user)
 
-    def post(self, request, *args, **kwargs):
-        reservation = self.get_object()
-        reservation.delete()
+    async def post(self, request, *args, **kwargs):
+        reservation = await self.get_object()
+        await reservation.adelete()
         messages.success(request, 'Reservation deleted successfully.')
         return redirect('reservation_list')
 
-    def get(self, request, *args, **kwargs):
-        reservation = self.get_object()
-        return render(request, 'inventory/delete_reservation.html', {
+    async def get(self, request, *args, **kwargs):
+        reservation = await self.get_object()
+        return await arender(request, 'inventory/delete_reservation.html', {
             'reservation': reservation
         })
 
@@ -270,6 +484,8 @@ class ReservationListView(LoginRequiredMixin, ListView):
     template_name = 'inventory/reservation_list.html'
     context_object_name = 'reservations'
     paginate_by = 10
+    paginator_class = CachedCountPaginator
+    replica_reads = True
 
     def get_queryset(self):
         # Get base queryset
@@ -287,18 +503,27 @@ class ReservationListView(LoginRequiredMixin, ListView):
 
         return queryset.order_by('-start_time')
 
+    def get_paginator(self, queryset, per_page, **kwargs):
+        # The filters, not the SQL, identify the count: the SQL embeds the current time
+        cache_key = 'reservations:{}:{}:{}'.format(
+            self.request.user.pk,
+            self.request.GET.get('status', ''),
+            self.request.GET.get('show_past') == 'true',
+        )
+        return super().get_paginator(queryset, per_page, cache_key=cache_key, **kwargs)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Add all necessary context variables
         context.update({
-            'lab_rooms': settings.LAB_ROOMS,
+            'lab_rooms': lab_rooms.all(),
             'status': self.request.GET.get('status', ''),
             'show_past': self.request.GET.get('show_past', 'false'),
             'now': timezone.localtime(),
-            'is_paginated': self.paginate_by and self.get_queryset().count() > self.paginate_by,
         })
 
-        # Add page range for better pagination display
+        # Add page range for better pagination display; is_paginated comes from the
+        # paginator, so the count query is not run a second time
         if context['is_paginated']:
             page = context['page_obj']
             paginator = context['paginator']